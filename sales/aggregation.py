@@ -0,0 +1,149 @@
+from decimal import Decimal
+from django.db.models import Q, Sum
+from .models import DailySalesRollup
+
+# Grouping dimensions the engine can roll up, mapped to their DailySalesRollup field
+DIMENSIONS = {
+    'product': 'productID__prodName',
+    'category': 'productID__category',
+    'country': 'country',
+}
+
+MEASURES = ('line_count', 'quantity', 'gross_sales', 'margin')
+
+# Group name of the row summing every group outside a top-N selection
+OTHER_LABEL = 'Other'
+
+
+def _empty_totals():
+    return {'line_count': 0, 'quantity': 0, 'gross_sales': Decimal('0'), 'margin': Decimal('0')}
+
+
+class SalesAggregate:
+    """
+    Result of a single-pass multi-dimension aggregation.
+
+    Attributes:
+        total (dict): Store-wide line_count, quantity, gross_sales and margin.
+        previous (dict): The same totals for the comparison window, or None without one.
+        groups (dict): Per-dimension dicts mapping each group key to its totals.
+    """
+    def __init__(self, dimensions, compare=False):
+        self.dimensions = tuple(dimensions)
+        self.total = _empty_totals()
+        self.previous = _empty_totals() if compare else None
+        self.groups = {dimension: {} for dimension in self.dimensions}
+
+    def add(self, row):
+        """
+        Folds one fine-grained database row into the total and every dimension.
+
+        Rows that only hold sales of the comparison window count towards the previous
+        totals but do not create groups.
+
+        Args:
+            row (dict): A row holding the dimension fields, a 'sum_<measure>' per measure and,
+                        when comparing, a 'prev_<measure>' per measure.
+        """
+        values = {measure: row[f'sum_{measure}'] or 0 for measure in MEASURES}
+        for measure in MEASURES:
+            self.total[measure] += values[measure]
+        if self.previous is not None:
+            for measure in MEASURES:
+                self.previous[measure] += row[f'prev_{measure}'] or 0
+            if not values['line_count']:
+                return
+        for dimension in self.dimensions:
+            key = row[DIMENSIONS[dimension]]
+            totals = self.groups[dimension].get(key)
+            if totals is None:
+                totals = self.groups[dimension][key] = _empty_totals()
+            for measure in MEASURES:
+                totals[measure] += values[measure]
+
+    def by(self, dimension):
+        """
+        Returns the rolled up totals for one dimension, best sellers first.
+
+        Args:
+            dimension (str): One of the dimensions the aggregate was built with.
+
+        Returns:
+            list: Dicts with the dimension's field name as key plus the measures.
+        """
+        field = DIMENSIONS[dimension]
+        rows = [{field: key, **totals} for key, totals in self.groups[dimension].items()]
+        rows.sort(key=lambda row: row['gross_sales'], reverse=True)
+        return rows
+
+
+def aggregate_sales(filters=None, dimensions=tuple(DIMENSIONS), previous=None):
+    """
+    Computes the store-wide total and several groupings in one database pass.
+
+    The rollup is grouped once by the combination of all requested dimensions and the
+    coarser groupings are summed in memory, so adding a dimension adds no query. With a
+    comparison window, both windows are read in the same query using conditional sums.
+
+    Args:
+        filters (dict, optional): Filters on DailySalesRollup, e.g. {'day__gte': date}. Defaults to None.
+        dimensions (iterable, optional): Dimensions to group by. Defaults to all of DIMENSIONS.
+        previous (dict, optional): Filters selecting the comparison window. Defaults to None.
+
+    Returns:
+        SalesAggregate: The total, the comparison totals and the per-dimension groupings.
+    """
+    aggregate = SalesAggregate(dimensions, compare=previous is not None)
+    if previous is None:
+        rollups = DailySalesRollup.objects.filter(**(filters or {}))
+        measures = {f'sum_{measure}': Sum(measure) for measure in MEASURES}
+    else:
+        current_q, previous_q = Q(**(filters or {})), Q(**previous)
+        rollups = DailySalesRollup.objects.filter(current_q | previous_q)
+        measures = {f'sum_{measure}': Sum(measure, filter=current_q) for measure in MEASURES}
+        measures.update({f'prev_{measure}': Sum(measure, filter=previous_q) for measure in MEASURES})
+    fields = sorted({DIMENSIONS[dimension] for dimension in aggregate.dimensions})
+    if not fields:
+        aggregate.add(rollups.aggregate(**measures))
+        return aggregate
+    for row in rollups.values(*fields).annotate(**measures).order_by().iterator():
+        aggregate.add(row)
+    return aggregate
+
+
+def top_groups(filters, dimension, limit, offset=0):
+    """
+    Returns one page of a dimension's groups ranked by gross sales, computed in the database.
+
+    Only limit + 1 grouped rows leave the database; the extra row tells whether another page exists.
+
+    Args:
+        filters (dict): Filters on DailySalesRollup, e.g. {'day__gte': date}.
+        dimension (str): One of DIMENSIONS.
+        limit (int): Page size.
+        offset (int, optional): Number of higher-ranked groups to skip. Defaults to 0.
+
+    Returns:
+        tuple: (rows in the same shape as SalesAggregate.by, whether more groups follow).
+    """
+    field = DIMENSIONS[dimension]
+    measures = {f'sum_{measure}': Sum(measure) for measure in MEASURES}
+    ranked = DailySalesRollup.objects.filter(**(filters or {})).values(field).annotate(
+        **measures
+    ).order_by('-sum_gross_sales', field)[offset:offset + limit + 1]
+    rows = [{field: row[field], **{measure: row[f'sum_{measure}'] or 0 for measure in MEASURES}} for row in ranked]
+    return rows[:limit], len(rows) > limit
+
+
+def other_totals(total, rows):
+    """
+    Returns the totals of everything not covered by the given groups.
+
+    Args:
+        total (dict): Store-wide totals, e.g. SalesAggregate.total.
+        rows (list): Groups from top_groups or SalesAggregate.by.
+
+    Returns:
+        dict: The measures of the remaining groups, all 0 when nothing remains.
+    """
+    return {measure: total[measure] - sum(row[measure] for row in rows) for measure in MEASURES}
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
+
+    def ready(self):
+        # Connect the signal handlers that keep DailySalesRollup and CustomerActivity up to date
+        from . import signals  # noqa: F401
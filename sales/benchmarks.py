@@ -0,0 +1,416 @@
+import csv
+import io
+import json
+import random
+import statistics
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from core.models import Order, OrderInvoiceItems, Inventory, Product, Report
+from .models import ReportJob, Sale, TrendPeriod
+
+BULK_BATCH_SIZE = 5000
+
+# Rows uploaded by the 'endpoint:sale_ingest' benchmark, and the product name marking them
+INGEST_ROWS = 2000
+INGEST_PRODUCT = 'Benchmark upload'
+
+# Token the 'endpoint:metrics' benchmark authenticates with, as a Prometheus scraper would
+METRICS_TOKEN = 'benchmark'
+
+# Last day of the synthetic dataset and the 'today' of every benchmark, so results do not
+# depend on the day the benchmarks run
+ANCHOR_DATE = date(2024, 12, 31)
+
+COUNTRIES = ['Australia', 'Canada', 'France', 'Germany', 'India', 'Japan', 'Mexico', 'New Zealand', 'Singapore', 'United Kingdom', 'United States', 'Vietnam']
+CATEGORIES = ['Apparel', 'Beauty', 'Books', 'Electronics', 'Garden', 'Grocery', 'Home', 'Outdoors', 'Sports', 'Toys']
+
+
+def _placeholder(field, index, rng):
+    """
+    Returns a value for a required field the generator does not set explicitly.
+    """
+    if field.choices:
+        return field.choices[0][0]
+    if isinstance(field, models.BooleanField):
+        return False
+    if isinstance(field, models.EmailField):
+        return f'bench{index}@example.com'
+    if isinstance(field, (models.CharField, models.TextField)):
+        value = f'bench-{index}'
+        return value[:field.max_length] if field.max_length else value
+    if isinstance(field, models.DecimalField):
+        return Decimal(rng.randint(1, 100))
+    if isinstance(field, (models.IntegerField, models.FloatField)):
+        return rng.randint(1, 100)
+    if isinstance(field, models.DateTimeField):
+        return _at_anchor(dt_time(12))
+    if isinstance(field, models.DateField):
+        return ANCHOR_DATE
+    return None
+
+
+def _at_anchor(at, day=ANCHOR_DATE):
+    """
+    Returns day at the given time, aware in the current time zone when USE_TZ is enabled.
+    """
+    moment = datetime.combine(day, at)
+    return timezone.make_aware(moment) if timezone.is_aware(timezone.now()) else moment
+
+
+def build(model, index, rng, **values):
+    """
+    Builds an unsaved model instance, filling required fields not given with placeholders.
+
+    Args:
+        model (Model): The model class.
+        index (int): Sequence number used to make placeholder values unique.
+        rng (Random): The seeded random generator.
+        **values: Field values to set.
+
+    Returns:
+        Model: The unsaved instance.
+    """
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field.null or field.has_default() or field.is_relation:
+            continue
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            continue
+        if field.name not in values and field.attname not in values:
+            values[field.name] = _placeholder(field, index, rng)
+    return model(**values)
+
+
+def generate_dataset(items=10000, seed=42, days=730):
+    """
+    Bulk inserts a reproducible synthetic dataset and rebuilds the rollup and customer activity tables.
+
+    The generator writes products, shipping addresses, orders, invoice items, inventory
+    batches, legacy Sale rows and a few reports, the first with a generated CSV file. The
+    same seed always produces the same data.
+
+    Args:
+        items (int, optional): Number of invoice line items. Defaults to 10000.
+        seed (int, optional): Random seed. Defaults to 42.
+        days (int, optional): Number of days the orders are spread over, ending on ANCHOR_DATE. Defaults to 730.
+
+    Returns:
+        dict: Number of rows written per model.
+    """
+    from .customers import rebuild_customer_activity
+    from .reports import SALES_SUMMARY_SECTIONS, iter_report_rows, report_filters
+    from .rollup import rebuild_rollup
+
+    rng = random.Random(seed)
+    first_day = ANCHOR_DATE - timedelta(days=days - 1)
+    product_count = max(50, items // 200)
+    order_count = max(1, items // 3)
+    customer_count = max(1, order_count // 2)
+
+    products = [
+        build(
+            Product, index, rng,
+            prodName=f'Product {index:05d}',
+            category=CATEGORIES[index % len(CATEGORIES)],
+            price=price,
+            costPrice=(price * Decimal(rng.randint(40, 80)) / 100).quantize(Decimal('0.01')),
+            restockThreshold=rng.randint(5, 50)
+        )
+        for index, price in enumerate(Decimal(rng.randint(500, 50000)) / 100 for _ in range(product_count))
+    ]
+    products = Product.objects.bulk_create(products, batch_size=BULK_BATCH_SIZE)
+
+    Shipping = Order._meta.get_field('shippingID').related_model
+    shippings = Shipping.objects.bulk_create(
+        [build(Shipping, index, rng, country=country) for index, country in enumerate(COUNTRIES)],
+        batch_size=BULK_BATCH_SIZE
+    )
+
+    orders = []
+    for index in range(order_count):
+        day = first_day + timedelta(days=rng.randrange(days))
+        orders.append(build(
+            Order, index, rng,
+            order_datetime=_at_anchor(dt_time(rng.randrange(24), rng.randrange(60)), day),
+            custEmail=f'customer{rng.randrange(customer_count)}@example.com',
+            shippingID=rng.choice(shippings)
+        ))
+    orders = Order.objects.bulk_create(orders, batch_size=BULK_BATCH_SIZE)
+
+    written_items = 0
+    batch = []
+    for index in range(items):
+        batch.append(build(
+            OrderInvoiceItems, index, rng,
+            orderID=orders[index % order_count],
+            productID=rng.choice(products),
+            quantity=rng.randint(1, 10)
+        ))
+        if len(batch) >= BULK_BATCH_SIZE:
+            OrderInvoiceItems.objects.bulk_create(batch)
+            written_items += len(batch)
+            batch = []
+    if batch:
+        OrderInvoiceItems.objects.bulk_create(batch)
+        written_items += len(batch)
+
+    Batch = Inventory._meta.get_field('batchID').related_model
+    batches = Batch.objects.bulk_create(
+        [build(Batch, index, rng, productID=products[index % product_count], quantity=rng.randint(0, 200)) for index in range(product_count * 2)],
+        batch_size=BULK_BATCH_SIZE
+    )
+    inventory = Inventory.objects.bulk_create(
+        [build(Inventory, index, rng, batchID=batch_row, lastRestocked=first_day + timedelta(days=rng.randrange(days))) for index, batch_row in enumerate(batches)],
+        batch_size=BULK_BATCH_SIZE
+    )
+
+    sales = Sale.objects.bulk_create(
+        [
+            Sale(
+                product_name=rng.choice(products).prodName,
+                quantity=rng.randint(1, 10),
+                sale_date=first_day + timedelta(days=rng.randrange(days)),
+                revenue=Decimal(rng.randint(100, 100000)) / 100
+            )
+            for _ in range(max(1, items // 10))
+        ],
+        batch_size=BULK_BATCH_SIZE
+    )
+
+    reports = Report.objects.bulk_create(
+        [build(Report, index, rng, reportName=f'Report {index}', description='Benchmark report', createdDate=ANCHOR_DATE, createdBy='bench') for index in range(20)],
+        batch_size=BULK_BATCH_SIZE
+    )
+
+    jobs = ReportJob.objects.bulk_create(
+        [ReportJob(report=report, report_type='sales-summary', status=ReportJob.SUCCEEDED, progress=100, finished_at=_at_anchor(dt_time(12))) for report in reports],
+        batch_size=BULK_BATCH_SIZE
+    )
+
+    rollups = rebuild_rollup()
+    customers = rebuild_customer_activity()
+
+    # The report file benchmark downloads the first report's CSV
+    content = io.StringIO()
+    csv.writer(content).writerows(iter_report_rows(SALES_SUMMARY_SECTIONS, report_filters()))
+    job = ReportJob.objects.get(pk=jobs[0].pk)
+    job.file.save(f'sales-summary_report_{job.pk}.csv', ContentFile(content.getvalue().encode()))
+    return {
+        'products': len(products),
+        'orders': len(orders),
+        'order_invoice_items': written_items,
+        'inventory': len(inventory),
+        'sales': len(sales),
+        'reports': len(reports),
+        'daily_sales_rollups': rollups,
+        'customer_activity': customers,
+    }
+
+
+def remove_dataset_files():
+    """
+    Deletes the report files generate_dataset stored, before its database is dropped.
+    """
+    for job in ReportJob.objects.exclude(file=''):
+        job.file.delete(save=False)
+
+
+def _view(view_class, actions=None):
+    """
+    Returns a view callable with permission checks disabled, so benchmarks need no user roles.
+    """
+    if actions:
+        return view_class.as_view(actions, permission_classes=[])
+    return view_class.as_view(permission_classes=[])
+
+
+def get_benchmarks():
+    """
+    Returns every benchmark: each endpoint in sales/urls.py plus the calculation functions.
+
+    Returns:
+        list: (name, callable) pairs. Each callable runs the benchmarked operation once.
+    """
+    from . import calculations, views
+    from .serializers import ReportSerializer
+    from .aggregation import aggregate_sales
+    from .instrumentation import registry
+    from .restock import restock_candidates
+
+    factory = APIRequestFactory()
+    today = ANCHOR_DATE
+    year_ago = (today - timedelta(days=365)).isoformat()
+    trend = _view(views.SalesTrendData)
+    overview = _view(views.SalesOverview)
+    report = _view(views.GenerateSalesPerformanceReport, {'get': 'list'})
+    list_reports = _view(views.ListReportsView)
+    create_report = _view(views.CreateReportView)
+    delete_report = _view(views.DeleteReportView)
+    report_id = ReportJob.objects.exclude(file='').values_list('report_id', flat=True).first()
+
+    def get(view, path, kwargs=None, **params):
+        def run():
+            response = view(factory.get(path, params), **(kwargs or {}))
+            if hasattr(response, 'render'):
+                response.render()
+            # Drain streamed responses so their queries are part of the measurement
+            if getattr(response, 'streaming', False):
+                for _chunk in response.streaming_content:
+                    pass
+            return response
+        return run
+
+    def create_and_delete():
+        payload = ReportSerializer(Report.objects.order_by('reportID').first()).data
+        payload.pop('reportID', None)
+        response = create_report(factory.post('/sales/create-report/', payload, format='json'))
+        response.render()
+        delete_report(factory.delete('/sales/reports/'), reportID=response.data['reportID'])
+
+    upload = io.StringIO()
+    writer = csv.writer(upload)
+    writer.writerow(['product_name', 'quantity', 'sale_date', 'revenue'])
+    for index in range(INGEST_ROWS):
+        writer.writerow([INGEST_PRODUCT, index % 9 + 1, (today - timedelta(days=index % 365)).isoformat(), f'{(index % 9 + 1) * 4.5:.2f}'])
+    upload = upload.getvalue().encode()
+    ingest = _view(views.SaleIngestView)
+
+    def ingest_and_delete():
+        request = factory.post('/sales/ingest/', {'file': SimpleUploadedFile('sales.csv', upload, content_type='text/csv')}, format='multipart')
+        ingest(request).render()
+        # Remove the uploaded rows, so every run inserts into the same table
+        Sale.objects.filter(product_name=INGEST_PRODUCT).delete()
+
+    metrics = views.SalesMetricsView.as_view()
+    # One recorded request per endpoint, so the exposition has the size of a live one
+    for url_name in ('sales_trend_data', 'sales-overview', 'generate_sales_performance_report', 'create_report',
+                     'list_reports', 'delete_report', 'report_job_status', 'report_job_file', 'sales_restock', 'sale_ingest'):
+        registry.record(url_name, {
+            'request_seconds': 0.05, 'db_seconds': 0.02, 'compute_seconds': 0.02, 'serialize_seconds': 0.01,
+            'db_queries': 4, 'response_bytes': 4096,
+        })
+
+    def read_metrics():
+        # Metrics are only served while recording is on
+        with override_settings(SALES_METRICS_ENABLED=True, SALES_METRICS_TOKEN=METRICS_TOKEN):
+            response = metrics(factory.get('/sales/metrics/', HTTP_AUTHORIZATION=f'Bearer {METRICS_TOKEN}'))
+        if response.status_code != 200:
+            raise RuntimeError(f'sales/metrics/ answered {response.status_code}.')
+        return response
+
+    report_path = f'/sales/reports/{report_id}/'
+    return [
+        ('endpoint:sales_trend_data', get(trend, '/sales/sales_trend_data/', start_date=year_ago, end_date=today.isoformat(), metric='SMA')),
+        ('endpoint:sales_trend_data:indicators', get(trend, '/sales/sales_trend_data/', start_date=year_ago, end_date=today.isoformat(), metric='EMA', indicators='sma:3:revenue,ema:6:quantity,wma:4:revenue')),
+        ('endpoint:overview:today', get(overview, '/sales/overview/', start_date=today.isoformat(), end_date=today.isoformat())),
+        ('endpoint:overview:7days', get(overview, '/sales/overview/', start_date=(today - timedelta(days=7)).isoformat(), end_date=today.isoformat())),
+        ('endpoint:overview:all', get(overview, '/sales/overview/', date_range='all')),
+        ('endpoint:report:sales-summary', get(report, '/sales/generate_sales_performance_report/', reportType='sales-summary', fromDate=year_ago, toDate=today.isoformat())),
+        ('endpoint:report:product-analysis', get(report, '/sales/generate_sales_performance_report/', reportType='product-analysis', fromDate=year_ago, toDate=today.isoformat())),
+        ('endpoint:report:product-analysis:stream', get(report, '/sales/generate_sales_performance_report/', reportType='product-analysis', fromDate=year_ago, toDate=today.isoformat(), stream='true')),
+        ('endpoint:create_report+delete_report', create_and_delete),
+        ('endpoint:reports', get(list_reports, '/sales/reports/')),
+        ('endpoint:report_job_status', get(_view(views.ReportJobStatusView), report_path + 'status/', {'reportID': report_id})),
+        ('endpoint:report_job_file', get(_view(views.ReportFileView), report_path + 'file/', {'reportID': report_id})),
+        ('endpoint:metrics', read_metrics),
+        ('endpoint:restock', get(_view(views.RestockView), '/sales/restock/', as_of=today.isoformat())),
+        ('endpoint:sale_ingest', ingest_and_delete),
+        ('calculations:get_sales_data', lambda: calculations.get_sales_data()),
+        ('calculations:get_sales_data_pandas', lambda: calculations.get_sales_data_pandas()),
+        ('calculations:get_sales_trend_data', lambda: calculations.get_sales_trend_data(year_ago, today.isoformat(), 'SMA')),
+        ('models:Sale.get_sales_trend_data', lambda: Sale.get_sales_trend_data()),
+        ('aggregation:aggregate_sales', lambda: aggregate_sales()),
+        ('restock:restock_candidates', lambda: restock_candidates(as_of=today)),
+    ]
+
+
+def run_benchmarks(repeat=5, only=None):
+    """
+    Times every benchmark and records its query count.
+
+    Result caching and single-flight coalescing are disabled, and the persisted trend months
+    are cleared before every run, so every run does the full work.
+
+    Args:
+        repeat (int, optional): Runs per benchmark; the median time is reported. Defaults to 5.
+        only (str, optional): Only run benchmarks whose name contains this text. Defaults to None.
+
+    Returns:
+        dict: Maps each benchmark name to {'seconds': median seconds, 'queries': query count}.
+    """
+    results = {}
+    with override_settings(SALES_CACHE_ENABLED=False, SALES_SINGLE_FLIGHT_ENABLED=False):
+        for name, run in get_benchmarks():
+            if only and only not in name:
+                continue
+            timings = []
+            queries = 0
+            for _ in range(repeat):
+                TrendPeriod.objects.all().delete()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - start)
+                queries = len(captured.captured_queries)
+            results[name] = {'seconds': statistics.median(timings), 'queries': queries}
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """
+    Compares benchmark results to a saved baseline.
+
+    A benchmark regresses when its median time exceeds the baseline by more than the
+    tolerance, or when it runs more queries than the baseline.
+
+    Args:
+        results (dict): Output of run_benchmarks.
+        baseline (dict): A previously saved 'results' mapping.
+        tolerance (float, optional): Allowed relative slowdown. Defaults to 0.25.
+
+    Returns:
+        list: Human-readable descriptions of each regression.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['seconds'] > expected['seconds'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['seconds'] * 1000:.1f} ms vs baseline {expected['seconds'] * 1000:.1f} ms")
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{name}: {result['queries']} queries vs baseline {expected['queries']}")
+    return regressions
+
+
+def load_baseline(path):
+    """
+    Loads a baseline JSON file written by save_baseline.
+
+    Args:
+        path (str): The file path.
+
+    Returns:
+        dict: The file contents, with 'meta' and 'results' keys.
+    """
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, results, **meta):
+    """
+    Writes benchmark results and the dataset parameters to a baseline JSON file.
+
+    Args:
+        path (str): The file path.
+        results (dict): Output of run_benchmarks.
+        **meta: Dataset parameters such as items and seed.
+    """
+    with open(path, 'w') as baseline_file:
+        json.dump({'meta': meta, 'results': results}, baseline_file, indent=2, sort_keys=True)
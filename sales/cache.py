@@ -0,0 +1,193 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from core.models import OrderInvoiceItems, Report
+from .models import DataVersion
+from .singleflight import single_flight
+
+# Settings:
+# - SALES_CACHE_ENABLED : Turns the analytics result cache on or off. Defaults to True.
+# - SALES_CACHE_ALIAS : Django cache alias to store results in. Defaults to 'default'.
+#   Local-memory caches evict the least recently used entries past their MAX_ENTRIES option.
+# - SALES_CACHE_TIMEOUT : Seconds to keep results for ranges that include today. Defaults to 300.
+# - SALES_CACHE_CLOSED_TIMEOUT : Seconds to keep results for past-only ranges. Defaults to 86400.
+#   They are also replaced as soon as the data watermark moves.
+# - SALES_FIRST_SEEN_TIMEOUT : Seconds an ETag's Last-Modified time is remembered. Defaults to 86400.
+#   Afterwards it restarts at the next request, which only costs clients a full response.
+#
+# The watermarks read version counters stored in the database (DataVersion), so a change made
+# by any worker process moves them everywhere, even with a per-process local-memory cache.
+
+DATA_VERSION = 'data'
+REPORT_VERSION = 'reports'
+
+_MISSING = object()
+
+
+def get_cache():
+    """
+    Returns the Django cache backend used for sales analytics results.
+
+    Returns:
+        BaseCache: The configured cache backend.
+    """
+    return caches[getattr(settings, 'SALES_CACHE_ALIAS', 'default')]
+
+
+def get_version(name):
+    """
+    Returns a version counter stored in the database.
+
+    Args:
+        name (str): DATA_VERSION or REPORT_VERSION.
+
+    Returns:
+        int: The current version, 0 before the first bump.
+    """
+    return DataVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+def get_data_version():
+    """
+    Returns the data version counter, bumped whenever rollup rows change.
+
+    Returns:
+        int: The current data version.
+    """
+    return get_version(DATA_VERSION)
+
+
+def _bump(name):
+    now = timezone.now()
+    if DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now):
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(name=name, version=1, updated_at=now)
+    except IntegrityError:
+        # Another process created the counter first
+        DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+
+
+def bump_data_version():
+    """
+    Increments the data version so every cached result keyed on the old watermark is ignored.
+    """
+    _bump(DATA_VERSION)
+
+
+def bump_report_version():
+    """
+    Increments the report version, so report listings keyed on the old watermark are stale.
+    """
+    _bump(REPORT_VERSION)
+
+
+def data_watermark():
+    """
+    Returns a cheap watermark that changes whenever the sales data changes.
+
+    It combines the data version counter with the latest invoice item ID, so line items
+    inserted without signals, e.g. by bulk_create, are noticed as well.
+
+    Returns:
+        str: The watermark.
+    """
+    latest_item = OrderInvoiceItems.objects.aggregate(latest=Max('pk'))['latest']
+    return f'{get_data_version()}-{latest_item or 0}'
+
+
+def report_watermark():
+    """
+    Returns a cheap watermark that changes whenever a report is created, changed or deleted.
+
+    Returns:
+        str: The watermark, combining the report version counter with the latest report ID.
+    """
+    latest_report = Report.objects.aggregate(latest=Max('reportID'))['latest']
+    return f'{get_version(REPORT_VERSION)}-{latest_report or 0}'
+
+
+def first_seen(key):
+    """
+    Returns when a key, such as an ETag, was first seen, recording now on the first call.
+
+    The record expires after SALES_FIRST_SEEN_TIMEOUT, so keys of outdated ETags do not pile up.
+
+    Args:
+        key (str): The key.
+
+    Returns:
+        datetime: The first time the key was seen, truncated to whole seconds.
+    """
+    cache = get_cache()
+    now = timezone.now().replace(microsecond=0)
+    cache.add(f'sales:first-seen:{key}', now, timeout=getattr(settings, 'SALES_FIRST_SEEN_TIMEOUT', 86400))
+    return cache.get(f'sales:first-seen:{key}', now)
+
+
+def cache_key(name, params, watermark):
+    """
+    Builds the cache key for a result from its normalized parameters and the data watermark.
+
+    Args:
+        name (str): The name of the cached computation, e.g. 'overview'.
+        params (dict): JSON-serializable parameters, already normalized.
+        watermark (str): The data watermark.
+
+    Returns:
+        str: The cache key.
+    """
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f'sales:{name}:{watermark}:{digest}'
+
+
+def cached_result(name, params, compute, closed=False, watermark=None):
+    """
+    Returns a cached result, computing and storing it on a miss.
+
+    Concurrent misses for the same key are coalesced by sales.singleflight, so only one
+    caller computes the result and the others wait for it instead of stampeding the database.
+
+    Args:
+        name (str): The name of the cached computation, e.g. 'overview'.
+        params (dict): JSON-serializable parameters, already normalized.
+        compute (callable): Function returning the result when it is not cached.
+        closed (bool, optional): True when the range lies entirely in the past. Defaults to False.
+        watermark (str, optional): The data watermark, if the caller already read it. Defaults to None.
+
+    Returns:
+        The cached or freshly computed result.
+
+    Raises:
+        SingleFlightTimeout: If another caller's computation of the same result did not finish in time.
+    """
+    if not getattr(settings, 'SALES_CACHE_ENABLED', True):
+        return single_flight(cache_key(name, params, 'uncached'), compute)
+
+    cache = get_cache()
+    key = cache_key(name, params, watermark or data_watermark())
+    result = cache.get(key, _MISSING)
+    if result is _MISSING:
+        result = single_flight(key, lambda: _compute_and_store(key, compute, closed))
+    return result
+
+
+def _compute_and_store(key, compute, closed):
+    """
+    Computes a result and caches it, unless a caller in another process stored it meanwhile.
+    """
+    cache = get_cache()
+    result = cache.get(key, _MISSING)
+    if result is _MISSING:
+        result = compute()
+        if closed:
+            timeout = getattr(settings, 'SALES_CACHE_CLOSED_TIMEOUT', 86400)
+        else:
+            timeout = getattr(settings, 'SALES_CACHE_TIMEOUT', 300)
+        cache.set(key, result, timeout=timeout)
+    return result
@@ -1,19 +1,178 @@
-import pandas as pd
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncQuarter
+from django.conf import settings
+from django.db import transaction
 from core.models import OrderInvoiceItems, Product
+from .dateranges import parse_date, range_filters, today
+from .cache import get_data_version
+from .indicators import INDICATOR_FIELDS, Indicator, compute_indicator_matrix, compute_indicators, indicator_from_name, indicator_name, resume_indicators
+from .models import DailySalesRollup, TrendPeriod
+from .routing import primary_reads
 
-def get_sales_data(start_date=None, end_date=None):
+# Supported bucket sizes: the pandas resample rule, the database truncation function and
+# the label format used in API responses. Labels name the bucket by its last day, as resample does.
+# The period-end aliases 'ME' and 'QE-DEC' replace 'M' and 'Q', which pandas 2.2 deprecated and
+# pandas 3 removed.
+GRANULARITIES = {
+    'day': {'rule': 'D', 'trunc': TruncDay, 'label': '%Y-%m-%d'},
+    'week': {'rule': 'W-SUN', 'trunc': TruncWeek, 'label': '%Y-%m-%d'},
+    'month': {'rule': 'ME', 'trunc': TruncMonth, 'label': '%Y-%m'},
+    'quarter': {'rule': 'QE-DEC', 'trunc': TruncQuarter, 'label': '%Y-%m'},
+}
+
+def get_granularity(granularity):
+    """
+    Looks up the settings for a bucket size.
+
+    Args:
+        granularity (str): One of 'day', 'week', 'month' or 'quarter'.
+
+    Returns:
+        dict: The resample rule, truncation function and label format.
+
+    Raises:
+        ValueError: If the granularity is not supported.
+    """
+    try:
+        return GRANULARITIES[granularity]
+    except KeyError:
+        raise ValueError(f"Invalid granularity '{granularity}'. Use one of: {', '.join(GRANULARITIES)}.")
+
+def next_bucket(start, granularity):
+    """
+    Returns the first day of the bucket following the one starting at start.
+
+    Args:
+        start (date): First day of a bucket, as returned by the truncation function.
+        granularity (str): One of GRANULARITIES.
+
+    Returns:
+        date: First day of the next bucket.
+    """
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(weeks=1)
+    months = 3 if granularity == 'quarter' else 1
+    month_index = start.month - 1 + months
+    return start.replace(year=start.year + month_index // 12, month=month_index % 12 + 1, day=1)
+
+def bucket_label(start, granularity):
+    """
+    Formats the label of the bucket starting at start, named after its last day.
+
+    Args:
+        start (date): First day of a bucket.
+        granularity (str): One of GRANULARITIES.
+
+    Returns:
+        str: The bucket label, e.g. '2024-03' for a month.
+    """
+    last_day = next_bucket(start, granularity) - timedelta(days=1)
+    return last_day.strftime(get_granularity(granularity)['label'])
+
+def fill_buckets(rows, granularity, fields, start=None):
+    """
+    Expands one row per non-empty bucket into a dense series from the first to the last bucket.
+
+    Buckets without rows are filled with 0, matching pandas resample(...).sum().
+
+    Args:
+        rows (iterable): Rows ordered by 'bucket', each holding the bucket start and the fields.
+        granularity (str): One of GRANULARITIES.
+        fields (list): The value fields to carry over.
+        start (date, optional): Bucket to start filling from when there are rows. Defaults to the first row's bucket.
+
+    Returns:
+        dict: 'labels', the bucket start dates under 'buckets', plus one list per field.
+    """
+    series = {'labels': [], 'buckets': [], **{field: [] for field in fields}}
+    current = start
+    for row in rows:
+        bucket = row['bucket']
+        if isinstance(bucket, datetime):
+            bucket = bucket.date()
+        while current is not None and current < bucket:
+            series['labels'].append(bucket_label(current, granularity))
+            series['buckets'].append(current)
+            for field in fields:
+                series[field].append(0)
+            current = next_bucket(current, granularity)
+        series['labels'].append(bucket_label(bucket, granularity))
+        series['buckets'].append(bucket)
+        for field in fields:
+            series[field].append(row[field])
+        current = next_bucket(bucket, granularity)
+    return series
+
+def get_sales_data(start_date=None, end_date=None, granularity='month'):
+    """
+    Fetches and aggregates sales data from the OrderInvoiceItems model, bucketing in the database.
+
+    Only one row per bucket leaves the database. The result is identical to get_sales_data_pandas.
+
+    Args:
+        start_date (str, optional): The start date for filtering data. Defaults to None.
+        end_date (str, optional): The last day to include, in 'YYYY-MM-DD' format. Defaults to None.
+        granularity (str, optional): Bucket size, one of GRANULARITIES. Defaults to 'month'.
+
+    Returns:
+        DataFrame: A pandas DataFrame with per-bucket sales data containing total quantities and total revenue.
+        None: If the DataFrame is empty.
+    """
+    import pandas as pd
+
+    bucketing = get_granularity(granularity)
+
+    order_items = OrderInvoiceItems.objects.all()
+
+    # Filter by date range if provided
+    if start_date and end_date:
+        order_items = order_items.filter(**range_filters('orderID__order_datetime', start_date, end_date))
+
+    # Truncate in UTC, the zone pandas sees when resampling the raw datetimes
+    buckets = order_items.annotate(
+        bucket=bucketing['trunc']('orderID__order_datetime', tzinfo=dt_timezone.utc if settings.USE_TZ else None)
+    ).values('bucket').annotate(
+        total_quantity=Sum('quantity'),
+        total_revenue=Sum(ExpressionWrapper(
+            F('productID__price') - F('productID__costPrice'),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        ))
+    ).order_by('bucket')
+
+    df = pd.DataFrame(list(buckets))
+    if df.empty:
+        return None
+
+    # Resampling one row per bucket only fills gaps and applies the period-end labels
+    df['bucket'] = pd.to_datetime(df['bucket'])
+    df.set_index('bucket', inplace=True)
+    df.index.name = 'orderID__order_datetime'
+
+    return df.resample(bucketing['rule']).agg({
+        'total_quantity': 'sum',
+        'total_revenue': 'sum'
+    })
+
+def get_sales_data_pandas(start_date=None, end_date=None, granularity='month'):
     """
-    Fetches and aggregates sales data from the OrderInvoiceItems model.
+    Fetches and aggregates sales data from the OrderInvoiceItems model by resampling every line item in pandas.
+
+    Reference implementation for get_sales_data, which buckets in the database instead.
 
     Args:
         start_date (str, optional): The start date for filtering data. Defaults to None.
-        end_date (str, optional): The end date for filtering data. Defaults to None.
+        end_date (str, optional): The last day to include, in 'YYYY-MM-DD' format. Defaults to None.
+        granularity (str, optional): Bucket size, one of GRANULARITIES. Defaults to 'month'.
 
     Returns:
-        DataFrame: A pandas DataFrame with resampled monthly sales data containing total quantities and total revenue.
+        DataFrame: A pandas DataFrame with resampled sales data containing total quantities and total revenue.
         None: If the DataFrame is empty.
     """
+    import pandas as pd
+
     # Annotate order items with calculated revenue
     order_items = OrderInvoiceItems.objects.annotate(
         revenue=ExpressionWrapper(
@@ -28,18 +187,18 @@ def get_sales_data(start_date=None, end_date=None):
 
     # Filter by date range if provided
     if start_date and end_date:
-        order_items = order_items.filter(orderID__order_datetime__range=[start_date, end_date])
+        order_items = order_items.filter(**range_filters('orderID__order_datetime', start_date, end_date))
 
     # Convert to DataFrame
     df = pd.DataFrame(list(order_items))
     if df.empty:
         return None
 
-    # Set datetime index and resample data monthly
+    # Set datetime index and resample data per bucket
     df['orderID__order_datetime'] = pd.to_datetime(df['orderID__order_datetime'])
     df.set_index('orderID__order_datetime', inplace=True)
 
-    df = df.resample('M').agg({
+    df = df.resample(get_granularity(granularity)['rule']).agg({
         'quantity': 'sum',
         'revenue': 'sum'
     }).rename(columns={'quantity': 'total_quantity', 'revenue': 'total_revenue'})
@@ -72,65 +231,229 @@ def calculate_ema(data, span):
     """
     return data.ewm(span=span, adjust=False).mean()
 
-def get_sales_trend_data(start_date, end_date, metric):
+def closed_month_cutoff(end_date):
+    """
+    Returns the first month whose totals may still change for a trend ending on end_date.
+
+    Months before the current month that lie entirely within the range are closed.
+
+    Args:
+        end_date (date): Last day of the trend range.
+
+    Returns:
+        date: First day of the first month that is not closed.
+    """
+    end_month = end_date.replace(day=1)
+    if end_date + timedelta(days=1) == next_bucket(end_month, 'month'):
+        end_month = next_bucket(end_month, 'month')
+    return min(today().replace(day=1), end_month)
+
+def legacy_overlays(metric, indicators=None):
+    """
+    Returns the legacy 3-month overlays a trend metric selects, and every indicator to compute.
+
+    Args:
+        metric (str): 'SMA' or 'EMA' select the overlays; any other value selects none.
+        indicators (list, optional): Additional Indicator tuples requested. Defaults to None.
+
+    Returns:
+        tuple: (dict mapping overlay keys such as 'sma_revenue' to their Indicator, list of the
+               Indicators to compute, the overlays first and without duplicates).
+    """
+    legacy = {}
+    if metric in ('SMA', 'EMA'):
+        for field in INDICATOR_FIELDS:
+            legacy[f'{metric.lower()}_{field}'] = Indicator(metric.lower(), 3, field)
+    wanted = list(dict.fromkeys(list(legacy.values()) + list(indicators or [])))
+    return legacy, wanted
+
+# Indicators whose values are persisted with the closed months of a series. Further requested
+# indicators are computed from the persisted monthly totals on every request instead.
+MAX_TRACKED_INDICATORS = 8
+
+def get_sales_trend_data(start_date, end_date, metric, indicators=None):
     """
     Fetches and calculates sales trend data for a given date range and trend metric.
 
+    Closed months are persisted as TrendPeriod rows with their totals and the values of the
+    tracked indicators, so a request only aggregates the months after the last persisted one
+    (usually just the open month). Tracked indicators are continued from the persisted values
+    with resume_indicators; SMA and WMA read their window from the persisted totals, EMA
+    continues from its last value. Up to MAX_TRACKED_INDICATORS indicators are tracked per series.
+
     Args:
-        start_date (str): The start date for filtering data in 'YYYY-MM-DD' format.
-        end_date (str): The end date for filtering data in 'YYYY-MM-DD' format.
+        start_date (str | date): The start date for filtering data in 'YYYY-MM-DD' format.
+        end_date (str | date): The end date for filtering data in 'YYYY-MM-DD' format.
         metric (str): The trend metric to calculate ('SMA' for Simple Moving Average or 'EMA' for Exponential Moving Average).
+        indicators (list, optional): Additional Indicator tuples to compute, see sales.indicators. Defaults to None.
 
     Returns:
-        dict: A dictionary containing the sales trend data, including months, total revenue, total quantity, and the calculated trend values.
+        dict: A dictionary containing the sales trend data, including months, total revenue, total quantity, the
+              calculated 3-month trend values for the metric and an 'indicators' dict keyed by indicator name.
     """
-    # Fetch data from OrderInvoiceItems with necessary annotations
-    queryset = OrderInvoiceItems.objects.filter(
-        orderID__order_datetime__date__gte=start_date,
-        orderID__order_datetime__date__lte=end_date
+    start_date, end_date = parse_date(start_date), parse_date(end_date)
+
+    # The metric selects the legacy 3-month overlays, computed alongside the requested indicators
+    requested = list(indicators or [])
+    legacy, wanted = legacy_overlays(metric, requested)
+
+    # Load the persisted closed months; rows written in an older format are rebuilt
+    version = get_data_version()
+    cutoff = closed_month_cutoff(end_date)
+    closed = list(TrendPeriod.objects.filter(series_start=start_date, month__lt=cutoff).order_by('month'))
+    replace = any(not isinstance(value, (int, float)) for period in closed for value in period.indicators.values())
+    if replace:
+        closed = []
+    tracked = [indicator_from_name(name) for name in sorted(closed[-1].indicators)] if closed else []
+
+    # Aggregate the months after the persisted ones from the daily sales rollup, oldest first
+    resume = next_bucket(closed[-1].month, 'month') if closed else start_date
+    queryset = DailySalesRollup.objects.filter(
+        day__gte=resume,
+        day__lte=end_date
     ).annotate(
-        month=F('orderID__order_datetime__month'),
-        year=F('orderID__order_datetime__year')
-    ).values('month', 'year').annotate(
-        total_revenue=Sum(F('quantity') * F('productID__price')),
+        bucket=TruncMonth('day')
+    ).values('bucket').annotate(
+        total_revenue=Sum('gross_sales'),
         total_quantity=Sum('quantity')
-    )
+    ).order_by('bucket')
+    fresh = fill_buckets(queryset, 'month', ['total_revenue', 'total_quantity'], start=resume if closed else None)
 
-    # Convert to DataFrame
-    df = pd.DataFrame(list(queryset))
+    history = {field: [float(getattr(period, f'total_{field}')) for period in closed] for field in INDICATOR_FIELDS}
+    added = {field: [float(value) for value in fresh[f'total_{field}']] for field in INDICATOR_FIELDS}
 
-    if df.empty:
-        return {
-            "months": [],
-            "total_revenue": [],
-            "total_quantity": [],
-            "sma_revenue": [],
-            "ema_revenue": []
-        }
-
-    # Prepare DataFrame for trend calculations
-    df['date'] = pd.to_datetime(df[['year', 'month']].assign(day=1))
-    df.set_index('date', inplace=True)
-    df = df.resample('M').sum()
+    # Continue the tracked indicators over the new months only
+    values = {}
+    if tracked:
+        last_values = closed[-1].indicators
+        for name, new_values in resume_indicators(history, added, tracked, last_values).items():
+            values[name] = [period.indicators[name] for period in closed] + new_values
 
-    # Calculate Simple Moving Average (SMA)
-    if metric == 'SMA':
-        df['sma_revenue'] = df['total_revenue'].rolling(window=3).mean()
+    # Compute the other wanted indicators over the whole series, and start tracking them while there is room
+    untracked = [indicator for indicator in wanted if indicator_name(indicator) not in values]
+    full = {field: history[field] + added[field] for field in INDICATOR_FIELDS}
+    values.update(compute_indicators(full, untracked))
+    newly_tracked = [indicator_name(indicator) for indicator in untracked[:max(MAX_TRACKED_INDICATORS - len(tracked), 0)]]
+    for index, period in enumerate(closed):
+        period.indicators.update({name: values[name][index] for name in newly_tracked})
 
-    # Calculate Exponential Moving Average (EMA)
-    if metric == 'EMA':
-        df['ema_revenue'] = df['total_revenue'].ewm(span=3, adjust=False).mean()
+    tracked_names = [indicator_name(indicator) for indicator in tracked] + newly_tracked
+    periods = []
+    for index, month in enumerate(fresh['buckets']):
+        if month < cutoff:
+            position = len(closed) + index
+            periods.append(TrendPeriod(
+                series_start=start_date,
+                month=month,
+                total_revenue=fresh['total_revenue'][index],
+                total_quantity=fresh['total_quantity'][index],
+                indicators={name: values[name][position] for name in tracked_names}
+            ))
 
-    # Fill NaN values with 0
-    df.fillna(0, inplace=True)
+    # Persist the newly closed months, up to the last one with sales, unless the data changed meanwhile.
+    # The version is compared with the primary's, so months read from a lagging replica are not persisted.
+    while periods and not (periods[-1].total_revenue or periods[-1].total_quantity):
+        periods.pop()
+    with primary_reads():
+        current_version = get_data_version()
+    if (periods or replace or (closed and newly_tracked)) and current_version == version:
+        with transaction.atomic():
+            if replace:
+                TrendPeriod.objects.filter(series_start=start_date).delete()
+            elif closed and newly_tracked:
+                TrendPeriod.objects.bulk_update(closed, ['indicators'])
+            TrendPeriod.objects.bulk_create(periods, ignore_conflicts=True)
 
     # Prepare data for response
     trend_data = {
-        "months": df.index.strftime('%Y-%m').tolist(),
-        "total_revenue": df['total_revenue'].tolist(),
-        "total_quantity": df['total_quantity'].tolist(),
-        "sma_revenue": df.get('sma_revenue', pd.Series()).tolist(),
-        "ema_revenue": df.get('ema_revenue', pd.Series()).tolist()
+        "months": [bucket_label(period.month, 'month') for period in closed] + fresh['labels'],
+        "total_revenue": [period.total_revenue for period in closed] + fresh['total_revenue'],
+        "total_quantity": [period.total_quantity for period in closed] + fresh['total_quantity'],
+        "indicators": {indicator_name(indicator): values[indicator_name(indicator)] for indicator in requested}
     }
+    for key in ('sma_revenue', 'ema_revenue', 'sma_quantity', 'ema_quantity'):
+        trend_data[key] = values[indicator_name(legacy[key])] if key in legacy else []
 
     return trend_data
+
+# Entities a grouped trend can be split by: the filter and grouping field and the name field
+TREND_DIMENSIONS = {
+    'product': {'key': 'productID', 'name': 'productID__prodName'},
+    'category': {'key': 'productID__category', 'name': 'productID__category'},
+}
+
+def get_grouped_sales_trend_data(start_date, end_date, metric, dimension, keys, indicators=None):
+    """
+    Fetches monthly sales trends for several products or categories in one grouped query.
+
+    The (entity x month) totals are laid out as two NumPy matrices sharing one month axis,
+    and every moving average is computed on the whole matrix at once.
+
+    Args:
+        start_date (str | date): The start date for filtering data in 'YYYY-MM-DD' format.
+        end_date (str | date): The end date for filtering data in 'YYYY-MM-DD' format.
+        metric (str): The legacy 3-month overlay to add, 'SMA' or 'EMA'.
+        dimension (str): One of TREND_DIMENSIONS.
+        keys (list): Product IDs or category names, in the order the series are returned.
+        indicators (list, optional): Additional Indicator tuples to compute, see sales.indicators. Defaults to None.
+
+    Returns:
+        dict: 'months', 'dimension' and 'series', one dict per key with its 'key', 'name' (None
+              when it had no sales), 'total_revenue', 'total_quantity', 'indicators' and the legacy overlays.
+    """
+    import numpy as np
+
+    fields = TREND_DIMENSIONS[dimension]
+    rows = list(DailySalesRollup.objects.filter(
+        day__gte=start_date,
+        day__lte=end_date,
+        **{f"{fields['key']}__in": keys}
+    ).annotate(
+        bucket=TruncMonth('day')
+    ).values(fields['key'], fields['name'], 'bucket').annotate(
+        total_revenue=Sum('gross_sales'),
+        total_quantity=Sum('quantity')
+    ).order_by('bucket'))
+
+    # One shared, gap-free month axis from the first to the last month with sales
+    months = []
+    if rows:
+        month, last = rows[0]['bucket'], rows[-1]['bucket']
+        while month <= last:
+            months.append(month)
+            month = next_bucket(month, 'month')
+    column = {month: index for index, month in enumerate(months)}
+    row_of = {key: index for index, key in enumerate(keys)}
+
+    revenue = np.zeros((len(keys), len(months)))
+    quantity = np.zeros((len(keys), len(months)))
+    names = {}
+    if rows:
+        entity = np.fromiter((row_of[row[fields['key']]] for row in rows), dtype=np.intp, count=len(rows))
+        period = np.fromiter((column[row['bucket']] for row in rows), dtype=np.intp, count=len(rows))
+        revenue[entity, period] = np.fromiter((float(row['total_revenue'] or 0) for row in rows), dtype=float, count=len(rows))
+        quantity[entity, period] = np.fromiter((float(row['total_quantity'] or 0) for row in rows), dtype=float, count=len(rows))
+        names = {row[fields['key']]: row[fields['name']] for row in rows}
+
+    requested = list(indicators or [])
+    legacy, wanted = legacy_overlays(metric, requested)
+    values = compute_indicator_matrix({'revenue': revenue, 'quantity': quantity}, wanted)
+
+    series = []
+    for index, key in enumerate(keys):
+        entry = {
+            'key': key,
+            'name': names.get(key),
+            'total_revenue': revenue[index].tolist(),
+            'total_quantity': quantity[index].astype(np.int64).tolist(),
+            'indicators': {indicator_name(i): values[indicator_name(i)][index].tolist() for i in requested},
+        }
+        for name, indicator in legacy.items():
+            entry[name] = values[indicator_name(indicator)][index].tolist()
+        series.append(entry)
+
+    return {
+        'months': [bucket_label(month, 'month') for month in months],
+        'dimension': dimension,
+        'series': series,
+    }
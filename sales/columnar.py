@@ -0,0 +1,137 @@
+import json
+import struct
+import sys
+from array import array
+from decimal import Decimal
+
+# Binary layout of the packed format:
+#   b'SLC1' | uint32 little-endian header length | UTF-8 JSON header | padding to 8 bytes | float64 buffers
+# The header holds the scalars and string columns as-is; each numeric column is described
+# by {'dtype', 'offset', 'length'}, with offsets counted from the start of the buffers.
+PACKED_MAGIC = b'SLC1'
+
+
+def column_dtype(values):
+    """
+    Returns the element type of a list, or None when it is not a homogeneous column.
+
+    Args:
+        values (list): The list.
+
+    Returns:
+        str: 'int64', 'float64' or 'string', or None.
+    """
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            kinds.add('int64')
+        elif isinstance(value, (float, Decimal)):
+            kinds.add('float64')
+        elif isinstance(value, str):
+            kinds.add('string')
+        else:
+            return None
+    if kinds == {'string'}:
+        return 'string'
+    if kinds and 'string' not in kinds:
+        return 'int64' if kinds == {'int64'} else 'float64'
+    return 'float64' if not kinds else None
+
+
+def to_columns(data):
+    """
+    Converts a response payload into typed columns.
+
+    Lists of numbers or strings become {'dtype', 'values'} columns with plain Python floats
+    and ints, lists of uniform dicts are turned into a dict of such columns, and Decimal
+    scalars become floats. Anything else is kept as it is.
+
+    Args:
+        data: The payload, e.g. the dict returned by get_sales_trend_data.
+
+    Returns:
+        The converted payload.
+    """
+    if isinstance(data, dict):
+        return {key: to_columns(value) for key, value in data.items()}
+    if isinstance(data, Decimal):
+        return float(data)
+    if not isinstance(data, (list, tuple)):
+        return data
+
+    if data and all(isinstance(row, dict) for row in data):
+        keys = list(data[0])
+        if all(list(row) == keys for row in data):
+            return {key: to_columns([row[key] for row in data]) for key in keys}
+    dtype = column_dtype(data)
+    if dtype == 'float64':
+        return {'dtype': dtype, 'values': list(map(float, data))}
+    if dtype is not None:
+        return {'dtype': dtype, 'values': list(data)}
+    return [to_columns(value) for value in data]
+
+
+def encode_json(data):
+    """
+    Encodes a payload as columnar JSON.
+
+    The columns hold only floats, ints and strings, so the C JSON encoder handles them
+    without per-element fallbacks.
+
+    Args:
+        data: The payload.
+
+    Returns:
+        bytes: The UTF-8 JSON document.
+    """
+    return json.dumps(to_columns(data), separators=(',', ':'), allow_nan=False, default=str).encode()
+
+
+def _pack(node, buffers, position):
+    """
+    Moves every numeric column of a converted payload into float64 buffers.
+
+    Returns:
+        tuple: (header node, position after the last buffer).
+    """
+    if isinstance(node, dict):
+        if node.get('dtype') in ('int64', 'float64') and isinstance(node.get('values'), list):
+            packed = array('d', map(float, node['values']))
+            if sys.byteorder != 'little':
+                packed.byteswap()
+            buffers.append(packed.tobytes())
+            return {'dtype': node['dtype'], 'offset': position, 'length': len(packed)}, position + 8 * len(packed)
+        header = {}
+        for key, value in node.items():
+            header[key], position = _pack(value, buffers, position)
+        return header, position
+    if isinstance(node, list):
+        header = []
+        for value in node:
+            packed, position = _pack(value, buffers, position)
+            header.append(packed)
+        return header, position
+    return node, position
+
+
+def encode_packed(data):
+    """
+    Encodes a payload in the packed binary format described by PACKED_MAGIC.
+
+    Numeric columns are sent as little-endian float64 buffers; int64 columns are stored as
+    float64 too and are exact up to 2**53.
+
+    Args:
+        data: The payload.
+
+    Returns:
+        bytes: The encoded payload.
+    """
+    buffers = []
+    header, _end = _pack(to_columns(data), buffers, 0)
+    header = json.dumps(header, separators=(',', ':'), allow_nan=False, default=str).encode()
+    prefix_length = len(PACKED_MAGIC) + 4 + len(header)
+    padding = b' ' * (-prefix_length % 8)
+    return PACKED_MAGIC + struct.pack('<I', len(header) + len(padding)) + header + padding + b''.join(buffers)
@@ -0,0 +1,63 @@
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from .cache import cache_key, first_seen
+
+
+def make_etag(name, params, watermark):
+    """
+    Builds the ETag of a response from its normalized parameters and the data watermark.
+
+    Args:
+        name (str): The endpoint name, e.g. 'overview'.
+        params (dict): JSON-serializable parameters that determine the payload.
+        watermark (str): The data watermark.
+
+    Returns:
+        str: The unquoted ETag.
+    """
+    return hashlib.sha1(cache_key(name, params, watermark).encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    Mixin for DRF views that answer conditional GET requests with 304 Not Modified.
+
+    A view validates its parameters, reads a cheap watermark and calls check_not_modified
+    before doing any real work. The ETag and Last-Modified validators are then added to the
+    full response as well.
+    """
+    validators = None
+
+    def check_not_modified(self, request, name, params, watermark):
+        """
+        Returns a 304 response when the client's copy is still current.
+
+        Args:
+            request (Request): The request, possibly carrying If-None-Match or If-Modified-Since.
+            name (str): The endpoint name, e.g. 'overview'.
+            params (dict): JSON-serializable parameters that determine the payload.
+            watermark (str): The data watermark.
+
+        Returns:
+            HttpResponseNotModified: When the client's copy is current, otherwise None.
+        """
+        renderer = getattr(request, 'accepted_renderer', None)
+        params = {**params, 'accept': request.META.get('HTTP_ACCEPT', ''), 'format': getattr(renderer, 'format', None)}
+        etag = make_etag(name, params, watermark)
+        self.validators = (etag, first_seen(etag))
+        return get_conditional_response(
+            request, etag=quote_etag(etag), last_modified=int(self.validators[1].timestamp())
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.validators and response.status_code in (200, 304):
+            etag, last_modified = self.validators
+            if not response.has_header('ETag'):
+                response['ETag'] = quote_etag(etag)
+            if not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+            # Browsers may keep the payload but must revalidate it on every use
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,209 @@
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q
+from django.db.models.functions import TruncMonth
+from core.models import Order, OrderInvoiceItems
+from .dateranges import local_day
+from .models import CustomerActivity, CustomerMonth
+from .rollup import ROLLUP_AGGREGATES
+
+CUSTOMER_BATCH_SIZE = 1000
+
+# Number of months after the first order tracked by cohort retention
+COHORT_MONTHS = 12
+
+
+def _month(value):
+    """
+    Returns the first day of the local month of a datetime or truncated month.
+    """
+    return local_day(value).replace(day=1)
+
+
+def _orders(email=None):
+    orders = Order.objects.filter(order_datetime__isnull=False).exclude(custEmail__isnull=True).exclude(custEmail='')
+    return orders.filter(custEmail=email) if email is not None else orders
+
+
+def refresh_customer(email):
+    """
+    Recomputes one customer's activity rows from their orders.
+
+    The rows are deleted when the customer has no orders left. Must run inside a transaction:
+    the customer's row is created if needed and locked before their orders are read, so
+    concurrent refreshes of one customer run one after the other, and the later one sees the
+    orders of the earlier one.
+
+    Args:
+        email (str): The customer's email.
+    """
+    def summarize():
+        return _orders(email).aggregate(first=Min('order_datetime'), last=Max('order_datetime'), count=Count('pk'))
+
+    summary = summarize()
+    if not summary['count']:
+        CustomerActivity.objects.filter(email=email).delete()
+        return
+
+    customer, _created = CustomerActivity.objects.get_or_create(email=email, defaults={
+        'first_order': summary['first'],
+        'last_order': summary['last'],
+        'cohort': _month(summary['first']),
+    })
+    customer = CustomerActivity.objects.select_for_update().get(pk=customer.pk)
+
+    # Read again under the lock, which waits for a concurrent refresh to commit
+    summary = summarize()
+    if not summary['count']:
+        customer.delete()
+        return
+    value = OrderInvoiceItems.objects.filter(orderID__custEmail=email).aggregate(
+        value=ROLLUP_AGGREGATES['total_gross_sales']
+    )['value']
+    customer.first_order = summary['first']
+    customer.last_order = summary['last']
+    customer.cohort = _month(summary['first'])
+    customer.order_count = summary['count']
+    customer.lifetime_value = value or 0
+    customer.save()
+
+    months = _orders(email).annotate(month=TruncMonth('order_datetime')).values('month').annotate(count=Count('pk')).order_by()
+    customer.months.all().delete()
+    CustomerMonth.objects.bulk_create(
+        [CustomerMonth(customer=customer, month=_month(row['month']), order_count=row['count']) for row in months]
+    )
+
+
+def refresh_customers(emails):
+    """
+    Recomputes the activity rows of several customers inside one transaction.
+
+    Args:
+        emails (iterable): Customer emails. Empty values and duplicates are ignored.
+    """
+    emails = {email for email in emails if email}
+    if not emails:
+        return
+    with transaction.atomic():
+        for email in emails:
+            refresh_customer(email)
+
+
+def rebuild_customer_activity(batch_size=CUSTOMER_BATCH_SIZE):
+    """
+    Rebuilds every customer activity row from the orders, in three grouped queries.
+
+    Args:
+        batch_size (int, optional): Number of rows per bulk insert. Defaults to CUSTOMER_BATCH_SIZE.
+
+    Returns:
+        int: The number of customers written.
+    """
+    values = dict(
+        OrderInvoiceItems.objects.values('orderID__custEmail').annotate(
+            value=ROLLUP_AGGREGATES['total_gross_sales']
+        ).order_by().values_list('orderID__custEmail', 'value')
+    )
+    summaries = _orders().values('custEmail').annotate(
+        first=Min('order_datetime'), last=Max('order_datetime'), count=Count('pk')
+    ).order_by()
+    months = _orders().annotate(month=TruncMonth('order_datetime')).values('custEmail', 'month').annotate(
+        count=Count('pk')
+    ).order_by()
+
+    written = 0
+    with transaction.atomic():
+        CustomerActivity.objects.all().delete()
+        batch = []
+        for row in summaries.iterator(chunk_size=batch_size):
+            batch.append(CustomerActivity(
+                email=row['custEmail'],
+                first_order=row['first'],
+                last_order=row['last'],
+                cohort=_month(row['first']),
+                order_count=row['count'],
+                lifetime_value=values.get(row['custEmail']) or 0,
+            ))
+            if len(batch) >= batch_size:
+                CustomerActivity.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            CustomerActivity.objects.bulk_create(batch)
+            written += len(batch)
+
+        # Look the IDs up rather than relying on bulk_create returning them, which not every backend does
+        ids = dict(CustomerActivity.objects.values_list('email', 'pk'))
+        batch = []
+        for row in months.iterator(chunk_size=batch_size):
+            batch.append(CustomerMonth(customer_id=ids[row['custEmail']], month=_month(row['month']), order_count=row['count']))
+            if len(batch) >= batch_size:
+                CustomerMonth.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            CustomerMonth.objects.bulk_create(batch)
+    return written
+
+
+def _range(field, start=None, end=None):
+    filters = {}
+    if start is not None:
+        filters[f'{field}__gte'] = start
+    if end is not None:
+        filters[f'{field}__lt'] = end
+    return Q(**filters)
+
+
+def customer_metrics(start=None, end=None):
+    """
+    Counts new, active and repeat customers in a half-open datetime range.
+
+    Active and repeat customers are counted from the orders placed inside the range, so a
+    historical range gives the same answer however the customers ordered afterwards.
+
+    Args:
+        start (datetime, optional): Start of the range. Defaults to None (unbounded).
+        end (datetime, optional): End of the range, exclusive. Defaults to None (unbounded).
+
+    Returns:
+        dict: 'new' customers placed their first order in the range, 'active' customers
+              ordered in the range, and 'repeat' customers are active customers with more than
+              one order in the range, or with an order before it.
+    """
+    new = CustomerActivity.objects.filter(_range('first_order', start, end)).count()
+
+    in_range = _orders().filter(_range('order_datetime', start, end)).values('custEmail').annotate(count=Count('pk'))
+    if start is not None:
+        returning = Exists(CustomerActivity.objects.filter(email=OuterRef('custEmail'), first_order__lt=start))
+        in_range = in_range.annotate(returning=returning)
+        repeat = Q(count__gt=1) | Q(returning=True)
+    else:
+        repeat = Q(count__gt=1)
+    in_range = in_range.order_by()
+    return {'new': new, 'active': in_range.count(), 'repeat': in_range.filter(repeat).count()}
+
+
+def cohort_retention(start=None, end=None, months=COHORT_MONTHS):
+    """
+    Returns monthly cohort retention for customers whose first order falls in a range.
+
+    Args:
+        start (datetime, optional): Start of the range. Defaults to None (unbounded).
+        end (datetime, optional): End of the range, exclusive. Defaults to None (unbounded).
+        months (int, optional): Number of months tracked after the first order. Defaults to COHORT_MONTHS.
+
+    Returns:
+        list: (cohort month, cohort size, list of customers ordering in each month since the
+              first order, starting with the cohort month itself) tuples, oldest cohort first.
+    """
+    cohorts = CustomerActivity.objects.filter(_range('first_order', start, end))
+    sizes = dict(cohorts.values('cohort').annotate(size=Count('pk')).order_by().values_list('cohort', 'size'))
+    retained = {cohort: [0] * months for cohort in sizes}
+    active = CustomerMonth.objects.filter(customer__in=cohorts).values('customer__cohort', 'month').annotate(
+        customers=Count('customer')
+    ).order_by()
+    for row in active:
+        cohort = row['customer__cohort']
+        offset = (row['month'].year - cohort.year) * 12 + row['month'].month - cohort.month
+        if 0 <= offset < months:
+            retained[cohort][offset] = row['customers']
+    return [(cohort, sizes[cohort], retained[cohort]) for cohort in sorted(sizes)]
@@ -0,0 +1,139 @@
+from datetime import date, datetime, time, timedelta
+from django.utils import timezone
+
+# Index expectations:
+# Date ranges are filtered as 'column >= start AND column < end' on the raw column, never through
+# a '__date' cast, so the database can answer them with an index range scan. That relies on:
+# - core Order.order_datetime : a B-tree index (db_index=True), ideally including shippingID and custEmail.
+# - core OrderInvoiceItems.orderID / productID : the foreign key indexes Django creates by default.
+# - core Order.custEmail : an index, used to refresh one customer's CustomerActivity row.
+# - sales DailySalesRollup (day, productID, country) : the unique constraint's index.
+# - sales DailySalesRollup.productID, core Inventory.batchID and the batch's productID : the foreign
+#   key indexes, used by the per-product subqueries of sales.restock.
+# - sales Sale (sale_date, product_name) : the indexes declared in Sale.Meta.
+
+
+def parse_date(value):
+    """
+    Converts a user-supplied date into a date.
+
+    Args:
+        value (str | date | datetime): A 'YYYY-MM-DD' string, a date or a datetime.
+
+    Returns:
+        date: The calendar day, or None when value is empty.
+
+    Raises:
+        ValueError: If a string is not in 'YYYY-MM-DD' format.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return local_day(value)
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def local_day(value):
+    """
+    Returns the local calendar day of an order datetime.
+
+    Args:
+        value (datetime): The order datetime, aware or naive.
+
+    Returns:
+        date: The day the rollup row for this datetime belongs to.
+    """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def today():
+    """
+    Returns the current local calendar day.
+
+    Unlike timezone.localdate(), it also works when USE_TZ is disabled.
+
+    Returns:
+        date: Today.
+    """
+    return local_day(timezone.now())
+
+
+def day_start(day):
+    """
+    Returns the first instant of a local calendar day.
+
+    Args:
+        day (date): The day.
+
+    Returns:
+        datetime: Local midnight, aware when USE_TZ is enabled.
+    """
+    start = datetime.combine(day, time.min)
+    if timezone.is_naive(timezone.now()):
+        return start
+    return timezone.make_aware(start, timezone.get_current_timezone())
+
+
+def day_bounds(day):
+    """
+    Returns the half-open datetime range covering a local calendar day.
+
+    Args:
+        day (date): The day to cover.
+
+    Returns:
+        tuple: (start, end) datetimes, aware when USE_TZ is enabled.
+    """
+    return day_start(day), day_start(day + timedelta(days=1))
+
+
+def date_range(start_date=None, end_date=None):
+    """
+    Turns an inclusive range of days into a half-open datetime range.
+
+    The end is midnight after end_date, so the whole last day is included.
+
+    Args:
+        start_date (str | date, optional): First day of the range. Defaults to None (unbounded).
+        end_date (str | date, optional): Last day of the range, inclusive. Defaults to None (unbounded).
+
+    Returns:
+        tuple: (start, end) datetimes; either is None when its bound is not given.
+
+    Raises:
+        ValueError: If a date string is not in 'YYYY-MM-DD' format.
+    """
+    start_day = parse_date(start_date)
+    end_day = parse_date(end_date)
+    return (
+        day_start(start_day) if start_day else None,
+        day_start(end_day + timedelta(days=1)) if end_day else None,
+    )
+
+
+def range_filters(field, start_date=None, end_date=None):
+    """
+    Builds index-friendly queryset filters for an inclusive range of days on a datetime field.
+
+    Args:
+        field (str): The lookup path of the datetime field, e.g. 'orderID__order_datetime'.
+        start_date (str | date, optional): First day of the range. Defaults to None.
+        end_date (str | date, optional): Last day of the range, inclusive. Defaults to None.
+
+    Returns:
+        dict: Filters keyed by '<field>__gte' and/or '<field>__lt'.
+
+    Raises:
+        ValueError: If a date string is not in 'YYYY-MM-DD' format.
+    """
+    start, end = date_range(start_date, end_date)
+    filters = {}
+    if start is not None:
+        filters[f'{field}__gte'] = start
+    if end is not None:
+        filters[f'{field}__lt'] = end
+    return filters
@@ -0,0 +1,285 @@
+from array import array
+from collections import namedtuple
+
+# Indicator kinds and the series they can be computed on
+INDICATOR_KINDS = ('sma', 'ema', 'wma')
+INDICATOR_FIELDS = ('revenue', 'quantity')
+MAX_WINDOW = 120
+
+# Up to this many output points (series length x indicators), the pure-Python path is used
+# and NumPy is never imported. Per-month endpoint series stay well below it.
+PYTHON_PATH_LIMIT = 4096
+
+Indicator = namedtuple('Indicator', ['kind', 'window', 'field'])
+Indicator.__doc__ = """
+    A moving-average indicator request.
+
+    Attributes:
+        kind (str): 'sma', 'ema' or 'wma'.
+        window (int): The window size, or span for EMA.
+        field (str): The series to smooth, 'revenue' or 'quantity'.
+"""
+
+
+def indicator_name(indicator):
+    """
+    Returns the response key of an indicator, e.g. 'sma_revenue_3'.
+
+    Args:
+        indicator (Indicator): The indicator.
+
+    Returns:
+        str: The response key.
+    """
+    return f'{indicator.kind}_{indicator.field}_{indicator.window}'
+
+
+def parse_indicators(spec):
+    """
+    Parses a comma-separated indicator list such as 'sma:3:revenue,ema:6:quantity'.
+
+    The field defaults to revenue when it is omitted ('wma:4').
+
+    Args:
+        spec (str): The indicator list from the query string.
+
+    Returns:
+        list: Unique Indicator tuples, in request order.
+
+    Raises:
+        ValueError: If an entry is malformed or out of range.
+    """
+    indicators = []
+    for entry in filter(None, (part.strip() for part in (spec or '').split(','))):
+        parts = entry.lower().split(':')
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid indicator '{entry}'. Use kind:window[:field], e.g. sma:3:revenue.")
+        kind, window, field = parts[0], parts[1], parts[2] if len(parts) == 3 else 'revenue'
+        if kind not in INDICATOR_KINDS:
+            raise ValueError(f"Invalid indicator kind '{kind}'. Use one of: {', '.join(INDICATOR_KINDS)}.")
+        if field not in INDICATOR_FIELDS:
+            raise ValueError(f"Invalid indicator field '{field}'. Use one of: {', '.join(INDICATOR_FIELDS)}.")
+        if not window.isdigit() or not 1 <= int(window) <= MAX_WINDOW:
+            raise ValueError(f"Invalid indicator window '{window}'. Use a whole number from 1 to {MAX_WINDOW}.")
+        indicator = Indicator(kind, int(window), field)
+        if indicator not in indicators:
+            indicators.append(indicator)
+    return indicators
+
+
+def _python_indicator(values, indicator):
+    """
+    Computes one indicator over a short series without NumPy.
+
+    Args:
+        values (array): The source series as an array('d').
+        indicator (Indicator): The indicator to compute.
+
+    Returns:
+        list: The indicator values, 0.0 where the window is incomplete.
+    """
+    window = indicator.window
+    result = array('d', bytes(8 * len(values)))
+    if indicator.kind == 'ema':
+        alpha = 2.0 / (window + 1.0)
+        for t, value in enumerate(values):
+            result[t] = value if t == 0 else alpha * value + (1 - alpha) * result[t - 1]
+    elif indicator.kind == 'sma':
+        running = 0.0
+        for t, value in enumerate(values):
+            running += value
+            if t >= window:
+                running -= values[t - window]
+            if t >= window - 1:
+                result[t] = running / window
+    else:
+        weight_sum = window * (window + 1) / 2
+        for t in range(window - 1, len(values)):
+            result[t] = sum((window - j) * values[t - j] for j in range(window)) / weight_sum
+    return result.tolist()
+
+
+def _rolling_sums(matrix, window):
+    """
+    Returns trailing window sums of every row, NaN where the window is incomplete.
+    """
+    import numpy as np
+
+    n = matrix.shape[1]
+    sums = np.full(matrix.shape, np.nan)
+    if window <= n:
+        padded = np.zeros((matrix.shape[0], n + 1))
+        np.cumsum(matrix, axis=1, out=padded[:, 1:])
+        sums[:, window - 1:] = padded[:, window:] - padded[:, :n - window + 1]
+    return sums
+
+
+def _sma(matrix, window):
+    return _rolling_sums(matrix, window) / window
+
+
+def _wma(matrix, window):
+    # sum_{j<w} (w - j) * x[t - j] = S2[t] - S2[t - w] - (t - w) * (S1[t] - S1[t - w]), where
+    # S1 and S2 are the cumulative sums of x and of i * x
+    import numpy as np
+
+    positions = np.arange(matrix.shape[1], dtype=float)
+    weighted = _rolling_sums(matrix * positions, window)
+    plain = _rolling_sums(matrix, window)
+    return (weighted - (positions - window) * plain) / (window * (window + 1) / 2)
+
+
+def _ema(matrix, spans):
+    # Recursive, so iterate over time once while updating every (series, span) row together
+    import numpy as np
+
+    alphas = 2.0 / (np.asarray(spans, dtype=float) + 1.0)
+    result = np.empty(matrix.shape)
+    if matrix.shape[1]:
+        result[:, 0] = matrix[:, 0]
+        for t in range(1, matrix.shape[1]):
+            result[:, t] = alphas * matrix[:, t] + (1 - alphas) * result[:, t - 1]
+    return result
+
+
+def compute_indicators(series, indicators):
+    """
+    Computes several moving-average indicators over the given series in one vectorized pass.
+
+    The source series are stacked into one contiguous float64 matrix. SMA and WMA values for
+    all series come from shared cumulative sums, and every EMA is advanced in the same loop
+    over time, one row per (series, span) pair. Incomplete windows are reported as 0, as the
+    trend endpoint has always done.
+
+    Short inputs, such as the per-month series the endpoints return, take a pure-Python path
+    over array('d') buffers instead, so NumPy is only imported for large inputs.
+
+    Args:
+        series (dict): Maps each field name to a sequence of numbers, all of the same length.
+        indicators (list): Indicator tuples to compute.
+
+    Returns:
+        dict: Maps indicator_name(indicator) to a list of floats.
+    """
+    if not indicators:
+        return {}
+    length = max((len(values) for values in series.values()), default=0)
+    if length * len(indicators) <= PYTHON_PATH_LIMIT:
+        arrays = {field: array('d', map(float, series[field])) for field in {i.field for i in indicators}}
+        return {indicator_name(i): _python_indicator(arrays[i.field], i) for i in indicators}
+
+    import numpy as np
+
+    fields = sorted({indicator.field for indicator in indicators})
+    row_of = {field: index for index, field in enumerate(fields)}
+    matrix = np.ascontiguousarray([np.asarray(series[field], dtype=float) for field in fields], dtype=float)
+
+    results = {}
+    for kind, compute in (('sma', _sma), ('wma', _wma)):
+        for window in sorted({i.window for i in indicators if i.kind == kind}):
+            values = compute(matrix, window)
+            for indicator in indicators:
+                if indicator.kind == kind and indicator.window == window:
+                    results[indicator] = values[row_of[indicator.field]]
+
+    emas = [indicator for indicator in indicators if indicator.kind == 'ema']
+    if emas:
+        values = _ema(matrix[[row_of[i.field] for i in emas]], [i.window for i in emas])
+        for index, indicator in enumerate(emas):
+            results[indicator] = values[index]
+
+    return {indicator_name(i): np.nan_to_num(results[i], nan=0.0).tolist() for i in indicators}
+
+
+def resume_indicators(history, fresh, indicators, last_values):
+    """
+    Continues indicators over new values of their series, from the end of a persisted history.
+
+    SMA and WMA only look back window - 1 values, so they are computed by compute_indicators
+    over the tail of the history followed by the new values. EMA continues from its last
+    persisted value. Either way the cost depends on the new values, not on the history.
+
+    Args:
+        history (dict): Maps each field name to the values already covered, oldest first.
+        fresh (dict): Maps each field name to the new values, oldest first.
+        indicators (list): Indicator tuples to continue.
+        last_values (dict): Maps indicator_name(indicator) to its value at the end of the history.
+            Only used for EMA, and only when the history is not empty.
+
+    Returns:
+        dict: Maps indicator_name(indicator) to a list of floats, one per new value.
+    """
+    results = {}
+    windowed = [indicator for indicator in indicators if indicator.kind != 'ema']
+    if windowed:
+        tail = max(indicator.window for indicator in windowed) - 1
+        series = {}
+        for field in {indicator.field for indicator in windowed}:
+            covered = list(history[field])
+            series[field] = covered[max(len(covered) - tail, 0):] + list(fresh[field])
+        prefix = {field: len(series[field]) - len(fresh[field]) for field in series}
+        for name, values in compute_indicators(series, windowed).items():
+            results[name] = values[prefix[indicator_from_name(name).field]:]
+
+    for indicator in indicators:
+        if indicator.kind != 'ema':
+            continue
+        name = indicator_name(indicator)
+        if history[indicator.field]:
+            # The EMA of [last value, x1, x2, ...] continues the persisted EMA exactly
+            values = compute_indicators({indicator.field: [last_values[name], *fresh[indicator.field]]}, [indicator])
+            results[name] = values[name][1:]
+        else:
+            results.update(compute_indicators({indicator.field: fresh[indicator.field]}, [indicator]))
+    return results
+
+
+def indicator_from_name(name):
+    """
+    Parses a response key produced by indicator_name back into an Indicator.
+
+    Args:
+        name (str): The response key, e.g. 'sma_revenue_3'.
+
+    Returns:
+        Indicator: The indicator.
+    """
+    kind, field, window = name.split('_')
+    return Indicator(kind, int(window), field)
+
+
+def compute_indicator_matrix(matrices, indicators):
+    """
+    Computes indicators for many series at once, one row per series.
+
+    Every SMA and WMA is one vectorized operation over the whole matrix, and all EMAs share
+    a single loop over time that updates every (series, span) row together.
+
+    Args:
+        matrices (dict): Maps each field name to a 2-D NumPy array of shape (series, periods).
+        indicators (list): Indicator tuples to compute.
+
+    Returns:
+        dict: Maps indicator_name(indicator) to a 2-D array, 0.0 where the window is incomplete.
+    """
+    import numpy as np
+
+    results = {}
+    for indicator in indicators:
+        if indicator.kind == 'sma':
+            results[indicator_name(indicator)] = _sma(matrices[indicator.field], indicator.window)
+        elif indicator.kind == 'wma':
+            results[indicator_name(indicator)] = _wma(matrices[indicator.field], indicator.window)
+
+    emas = [indicator for indicator in indicators if indicator.kind == 'ema']
+    if emas:
+        stacked = np.concatenate([matrices[i.field] for i in emas])
+        spans = np.repeat([i.window for i in emas], [matrices[i.field].shape[0] for i in emas])
+        values = _ema(stacked, spans)
+        start = 0
+        for indicator in emas:
+            rows = matrices[indicator.field].shape[0]
+            results[indicator_name(indicator)] = values[start:start + rows]
+            start += rows
+
+    return {name: np.nan_to_num(values, nan=0.0) for name, values in results.items()}
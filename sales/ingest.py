@@ -0,0 +1,246 @@
+import codecs
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.db import DatabaseError, transaction
+from .models import Sale
+
+INGEST_BATCH_SIZE = 5000
+
+# At most this many row errors are returned; the counts still cover every row
+MAX_REPORTED_ERRORS = 1000
+
+INGEST_FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(name, content_type=None):
+    """
+    Guesses the ingest format of an upload from its file name or content type.
+
+    Args:
+        name (str): The file name or path.
+        content_type (str, optional): The upload's content type. Defaults to None.
+
+    Returns:
+        str: 'csv' or 'ndjson'. Defaults to 'csv'.
+    """
+    lowered = (name or '').lower()
+    if lowered.endswith(('.ndjson', '.jsonl', '.json')) or 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+
+def iter_records(stream, fmt):
+    """
+    Lazily reads records from a binary stream, one line at a time.
+
+    Args:
+        stream (file): A binary file-like object, e.g. an uploaded file.
+        fmt (str): 'csv' (with a header row) or 'ndjson' (one JSON object per line).
+
+    Yields:
+        tuple: (line number, dict of raw values), or (line number, None) for an unreadable line.
+    """
+    text = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def _field_limits():
+    meta = Sale._meta
+    revenue = meta.get_field('revenue')
+    return meta.get_field('product_name').max_length, revenue.max_digits, revenue.decimal_places
+
+
+def _parse_quantity(value):
+    """
+    Returns value as an int, or None unless it is a whole number. Booleans are not numbers here.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        number = Decimal(value.strip() if isinstance(value, str) else str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    if not number.is_finite() or number != number.to_integral_value():
+        return None
+    return int(number)
+
+
+def _parse_revenue(value, max_digits, decimal_places):
+    """
+    Returns value as a Decimal with decimal_places places, or None if it is not a number that
+    fits the field exactly. Extra decimal places are rejected rather than rounded away.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = Decimal(value.strip() if isinstance(value, str) else str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    if not number.is_finite():
+        return None
+    # Counted as DRF's DecimalField does
+    _, digits, exponent = number.as_tuple()
+    if exponent >= 0:
+        total, decimals = len(digits) + exponent, 0
+    elif -exponent > len(digits):
+        total = decimals = -exponent
+    else:
+        total, decimals = len(digits), -exponent
+    if decimals > decimal_places or total - decimals > max_digits - decimal_places:
+        return None
+    return number.quantize(Decimal(1).scaleb(-decimal_places))
+
+
+def validate_record(record, limits=None):
+    """
+    Validates one raw record and converts it into a Sale.
+
+    Checks the same constraints as the model fields, without a serializer per row, and as
+    strictly as the serializer: quantities must be whole numbers, revenues may not have more
+    decimal places than the field, and booleans are accepted as neither.
+
+    Args:
+        record (dict): Raw values keyed by Sale field name, or None for an unreadable line.
+        limits (tuple, optional): (product name length, revenue digits, revenue decimal places).
+
+    Returns:
+        tuple: (Sale, None) for a valid record, or (None, dict of field errors).
+    """
+    if record is None:
+        return None, {'non_field_errors': 'Line is not a valid record.'}
+    max_length, max_digits, decimal_places = limits or _field_limits()
+    errors = {}
+
+    product_name = str(record.get('product_name') or '').strip()
+    if not product_name:
+        errors['product_name'] = 'This field is required.'
+    elif len(product_name) > max_length:
+        errors['product_name'] = f'Ensure this field has no more than {max_length} characters.'
+
+    quantity = _parse_quantity(record.get('quantity'))
+    if quantity is None:
+        errors['quantity'] = 'A valid integer is required.'
+
+    try:
+        sale_date = datetime.strptime(str(record.get('sale_date') or ''), '%Y-%m-%d').date()
+    except ValueError:
+        errors['sale_date'] = 'Date has wrong format. Use YYYY-MM-DD.'
+
+    revenue = _parse_revenue(record.get('revenue'), max_digits, decimal_places)
+    if revenue is None:
+        errors['revenue'] = f'A valid number is required, with at most {max_digits} digits and {decimal_places} decimal places.'
+
+    if errors:
+        return None, errors
+    return Sale(product_name=product_name, quantity=quantity, sale_date=sale_date, revenue=revenue), None
+
+
+class IngestResult:
+    """
+    Running totals of an ingest.
+
+    Attributes:
+        rows (int): Records read.
+        inserted (int): Sales written.
+        rejected (int): Records that failed validation or belonged to a batch that failed to insert.
+        batches (int): Batches processed.
+        errors (list): Up to MAX_REPORTED_ERRORS dicts with 'batch', 'line' and 'errors'.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.errors = []
+
+    def add_error(self, batch, line, errors):
+        """
+        Records the errors of one line, or of a whole batch when line is None.
+        """
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'batch': batch, 'line': line, 'errors': errors})
+
+    def as_dict(self):
+        """
+        Returns the totals as a JSON-serializable dict.
+        """
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'errors': self.errors,
+            'errors_truncated': self.rejected > len(self.errors),
+        }
+
+
+def _flush(batch, result):
+    """
+    Inserts one batch of valid sales in its own transaction.
+    """
+    if not batch:
+        return
+    try:
+        with transaction.atomic():
+            Sale.objects.bulk_create(batch)
+    except DatabaseError as e:
+        result.rejected += len(batch)
+        result.add_error(result.batches, None, {'non_field_errors': f'Batch could not be inserted: {e}'})
+        return
+    result.inserted += len(batch)
+
+
+def ingest_sales(records, batch_size=INGEST_BATCH_SIZE, on_batch=None):
+    """
+    Validates and inserts sales in batches, keeping at most one batch in memory.
+
+    Invalid records are skipped and reported; every batch of valid records is inserted with
+    bulk_create in its own transaction, so a failing batch does not undo earlier ones.
+
+    Args:
+        records (iterable): (line number, raw record) pairs, e.g. from iter_records.
+        batch_size (int, optional): Records validated and inserted together. Defaults to INGEST_BATCH_SIZE.
+        on_batch (callable, optional): Called with the IngestResult after every batch. Defaults to None.
+
+    Returns:
+        IngestResult: The totals and the reported errors.
+    """
+    limits = _field_limits()
+    result = IngestResult()
+    batch = []
+    for line, record in records:
+        result.rows += 1
+        sale, errors = validate_record(record, limits)
+        if errors:
+            result.rejected += 1
+            result.add_error(result.batches + 1, line, errors)
+        else:
+            batch.append(sale)
+        if result.rows % batch_size == 0:
+            result.batches += 1
+            _flush(batch, result)
+            batch = []
+            if on_batch:
+                on_batch(result)
+    if result.rows % batch_size:
+        result.batches += 1
+        _flush(batch, result)
+        if on_batch:
+            on_batch(result)
+    return result
@@ -0,0 +1,223 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+# Settings:
+# - SALES_METRICS_ENABLED : Records per-request metrics for the sales views. Defaults to False.
+# - SALES_METRICS_TOKEN : If set, sales/metrics/ requires 'Authorization: Bearer <token>'.
+#   Otherwise it is only available to staff users.
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _geometric_bounds(start, factor, count):
+    return tuple(start * factor ** index for index in range(count))
+
+
+# Upper bucket bounds; values above the last bound land in an overflow bucket
+SECONDS_BOUNDS = _geometric_bounds(0.0005, 2, 18)   # 0.5 ms .. ~65 s
+COUNT_BOUNDS = _geometric_bounds(1, 2, 16)          # 1 .. 32768 queries
+BYTES_BOUNDS = _geometric_bounds(256, 2, 20)        # 256 B .. 128 MB
+
+# Recorded measurements: name, help text, bucket bounds
+MEASUREMENTS = (
+    ('request_seconds', 'Total time spent in the view, including rendering.', SECONDS_BOUNDS),
+    ('db_seconds', 'Time spent executing SQL.', SECONDS_BOUNDS),
+    ('compute_seconds', 'Time spent in the view outside SQL and rendering (pandas/NumPy and Python).', SECONDS_BOUNDS),
+    ('serialize_seconds', 'Time spent rendering the response body.', SECONDS_BOUNDS),
+    ('db_queries', 'Number of SQL queries executed.', COUNT_BOUNDS),
+    ('response_bytes', 'Size of the response body; streamed responses are not counted.', BYTES_BOUNDS),
+)
+
+
+def metrics_enabled():
+    """
+    Returns whether per-request metrics are being recorded.
+
+    Returns:
+        bool: The SALES_METRICS_ENABLED setting.
+    """
+    return getattr(settings, 'SALES_METRICS_ENABLED', False)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with constant memory, used to estimate quantiles.
+
+    Attributes:
+        bounds (tuple): Upper bounds of the buckets, ascending.
+        counts (list): Observations per bucket, plus one overflow bucket.
+        total (float): Sum of all observations.
+        count (int): Number of observations.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Records one observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by interpolating linearly inside the bucket that contains it.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimate, or 0.0 without observations.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+
+class MetricsRegistry:
+    """
+    Process-wide store of per-endpoint histograms.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, endpoint, values):
+        """
+        Records the measurements of one request.
+
+        Args:
+            endpoint (str): The endpoint label.
+            values (dict): Maps measurement names to values. Missing names are skipped.
+        """
+        with self._lock:
+            for name, _help, bounds in MEASUREMENTS:
+                if values.get(name) is None:
+                    continue
+                histogram = self._histograms.get((name, endpoint))
+                if histogram is None:
+                    histogram = self._histograms[(name, endpoint)] = Histogram(bounds)
+                histogram.observe(values[name])
+
+    def reset(self):
+        """
+        Drops every recorded measurement.
+        """
+        with self._lock:
+            self._histograms.clear()
+
+    def render_prometheus(self):
+        """
+        Renders all measurements in the Prometheus text exposition format.
+
+        Each measurement is a summary with p50/p95/p99 estimates, a sum and a count per endpoint.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        with self._lock:
+            for name, help_text, _bounds in MEASUREMENTS:
+                metric = f'sales_{name}'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} summary')
+                for (recorded, endpoint), histogram in sorted(self._histograms.items()):
+                    if recorded != name:
+                        continue
+                    label = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+                    for q in QUANTILES:
+                        lines.append(f'{metric}{{endpoint="{label}",quantile="{q}"}} {histogram.quantile(q):.6g}')
+                    lines.append(f'{metric}_sum{{endpoint="{label}"}} {histogram.total:.6g}')
+                    lines.append(f'{metric}_count{{endpoint="{label}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting queries and the time spent running them.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+@contextmanager
+def measure_queries():
+    """
+    Counts the SQL queries run on this thread's connections inside the block.
+
+    Every configured database is wrapped, so reads sent to a replica are counted too.
+
+    Yields:
+        QueryTimer: The running totals.
+    """
+    timer = QueryTimer()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        yield timer
+
+
+class InstrumentedViewMixin:
+    """
+    Mixin for DRF views that records SQL, compute, rendering time and response size.
+
+    When SALES_METRICS_ENABLED is off, dispatch goes straight to the view, so the only
+    overhead is a settings lookup.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if not metrics_enabled():
+            return super().dispatch(request, *args, **kwargs)
+
+        start = time.perf_counter()
+        with measure_queries() as timer:
+            response = super().dispatch(request, *args, **kwargs)
+            handled = time.perf_counter()
+            handler_db_seconds = timer.seconds
+            # Render here, rather than after the view returns, so rendering time is measured.
+            # Rendering is idempotent, so Django's later call does nothing.
+            if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                response.render()
+        finished = time.perf_counter()
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.url_name if match and match.url_name else type(self).__name__
+        registry.record(endpoint, {
+            'request_seconds': finished - start,
+            'db_seconds': timer.seconds,
+            'compute_seconds': max(handled - start - handler_db_seconds, 0.0),
+            'serialize_seconds': finished - handled,
+            'db_queries': timer.queries,
+            'response_bytes': None if getattr(response, 'streaming', False) else len(response.content),
+        })
+        return response
@@ -0,0 +1,156 @@
+import csv
+import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import ReportJob
+from .reports import REPORT_SECTIONS, ReportData, report_filters
+from .routing import analytics_reads
+
+# Settings:
+# - SALES_REPORT_WORKERS : Number of worker threads generating reports. Defaults to 2.
+# - SALES_REPORT_JOB_STALE_SECONDS : Jobs left queued or running this long without being saved
+#   are considered lost, e.g. because their process restarted. Defaults to 900.
+#
+# Jobs run on threads of the web process, so a restart drops the jobs it was running or had
+# queued. recover_stale_jobs() resubmits lost queued jobs and fails lost running ones. Every
+# process runs it when it creates its worker pool, and 'manage.py recover_report_jobs' runs it
+# on demand, e.g. from cron or after a deploy.
+
+INTERRUPTED_ERROR = 'The report was interrupted before it finished, e.g. by a server restart. Request it again.'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide worker pool, creating it on first use.
+
+    Returns:
+        ThreadPoolExecutor: The report worker pool.
+    """
+    global _executor
+    with _executor_lock:
+        created = _executor is None
+        if created:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'SALES_REPORT_WORKERS', 2),
+                thread_name_prefix='sales-report'
+            )
+    if created:
+        # Pick up jobs lost by an earlier process, now that this one can run them
+        recover_stale_jobs(executor=_executor)
+    return _executor
+
+
+def recover_stale_jobs(stale_seconds=None, executor=None):
+    """
+    Recovers report jobs that were lost because the process running them stopped.
+
+    Queued jobs not saved for stale_seconds are submitted again; run_report_job only starts
+    queued jobs, so a job that another process already picked up is not run twice. Running
+    jobs not saved for stale_seconds are marked as failed, since a running job saves after
+    every section.
+
+    Args:
+        stale_seconds (int, optional): Defaults to settings.SALES_REPORT_JOB_STALE_SECONDS or 900.
+        executor (ThreadPoolExecutor, optional): Pool to submit queued jobs to. Defaults to get_executor().
+
+    Returns:
+        tuple: (number of jobs resubmitted, number of jobs failed).
+    """
+    stale_seconds = stale_seconds or getattr(settings, 'SALES_REPORT_JOB_STALE_SECONDS', 900)
+    now = timezone.now()
+    stale = ReportJob.objects.filter(updated_at__lt=now - timedelta(seconds=stale_seconds))
+
+    failed = stale.filter(status=ReportJob.RUNNING).update(
+        status=ReportJob.FAILED, error=INTERRUPTED_ERROR, finished_at=now, updated_at=now
+    )
+    queued = list(stale.filter(status=ReportJob.QUEUED).values_list('pk', flat=True))
+    if queued:
+        # Touch them, so the next sweep does not resubmit them while they wait for a worker
+        ReportJob.objects.filter(pk__in=queued, status=ReportJob.QUEUED).update(updated_at=now)
+        executor = executor or get_executor()
+        for job_id in queued:
+            executor.submit(run_report_job, job_id)
+    return len(queued), failed
+
+
+def enqueue_report_job(job):
+    """
+    Submits a report job to the worker pool once the surrounding transaction commits.
+
+    Args:
+        job (ReportJob): The queued job.
+    """
+    transaction.on_commit(lambda: get_executor().submit(run_report_job, job.pk))
+
+
+def _update_running(job_id, **fields):
+    """
+    Saves fields on a job only while it is still running, e.g. not failed by recover_stale_jobs.
+
+    Returns:
+        bool: True if the job was still running and has been updated.
+    """
+    return bool(ReportJob.objects.filter(pk=job_id, status=ReportJob.RUNNING).update(updated_at=timezone.now(), **fields))
+
+
+def run_report_job(job_id):
+    """
+    Generates the CSV for a report job and stores it on the job.
+
+    Only queued jobs are started, and the switch to running is atomic, so a job submitted
+    twice, e.g. by recover_stale_jobs, runs once. Progress is saved after every section.
+    Any error marks the job as failed. Progress and the outcome are only saved while the job
+    is still running, so a run that recover_stale_jobs gave up on stops instead of overwriting
+    the failure. The sections are read through analytics_reads, the job itself on the primary.
+    Runs on a worker thread, which closes its own database connections when done.
+
+    Args:
+        job_id (int): The primary key of the ReportJob.
+    """
+    try:
+        claimed = ReportJob.objects.filter(pk=job_id, status=ReportJob.QUEUED).update(
+            status=ReportJob.RUNNING, updated_at=timezone.now()
+        )
+        if not claimed:
+            return
+        job = ReportJob.objects.get(pk=job_id)
+        try:
+            sections = REPORT_SECTIONS[job.report_type]
+            report = ReportData(report_filters(
+                job.from_date.isoformat() if job.from_date else None,
+                job.to_date.isoformat() if job.to_date else None
+            ))
+
+            # Spill to disk past 1 MB so large reports do not sit in worker memory
+            spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            with io.TextIOWrapper(spool, encoding='utf-8', newline='') as buffer:
+                writer = csv.writer(buffer)
+                for index, (title, header, rows) in enumerate(sections):
+                    if index:
+                        writer.writerow([])
+                    writer.writerow([title])
+                    writer.writerow(header)
+                    with analytics_reads():
+                        writer.writerows(rows(report))
+                    if not _update_running(job.pk, progress=(index + 1) * 100 // len(sections)):
+                        return
+
+                buffer.flush()
+                spool.seek(0)
+                job.file.save(f'{job.report_type}_report_{job.pk}.csv', File(spool), save=False)
+            outcome = {'status': ReportJob.SUCCEEDED, 'progress': 100, 'file': job.file.name}
+        except Exception as e:
+            outcome = {'status': ReportJob.FAILED, 'error': str(e)}
+        if not _update_running(job.pk, finished_at=timezone.now(), **outcome) and outcome.get('file'):
+            job.file.delete(save=False)
+    finally:
+        connections.close_all()
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from sales.benchmarks import compare_to_baseline, generate_dataset, load_baseline, remove_dataset_files, run_benchmarks, save_baseline
+
+
+class Command(BaseCommand):
+    """
+    Management command that benchmarks the sales endpoints and calculation functions.
+
+    It creates a throwaway test database, fills it with a seeded synthetic dataset, and
+    times each benchmark while counting its SQL queries. With --baseline, it fails when a
+    benchmark is slower than the baseline by more than the tolerance, or runs more queries.
+
+    Usage:
+        python manage.py bench_sales [--items 10000] [--seed 42] [--baseline bench.json] [--update-baseline]
+    """
+    help = 'Benchmarks the sales endpoints and calculations against a synthetic dataset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000, help='Number of synthetic invoice line items. Defaults to 10000.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed of the synthetic dataset. Defaults to 42.')
+        parser.add_argument('--days', type=int, default=730, help='Number of days the orders span, ending on ANCHOR_DATE. Defaults to 730.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per benchmark; the median is reported. Defaults to 5.')
+        parser.add_argument('--only', help='Only run benchmarks whose name contains this text.')
+        parser.add_argument('--baseline', help='Path of the baseline JSON file to compare against.')
+        parser.add_argument('--update-baseline', action='store_true', help='Write the results to --baseline instead of comparing.')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown against the baseline. Defaults to 0.25.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+    def handle(self, *args, **options):
+        if options['update_baseline'] and not options['baseline']:
+            raise CommandError('--update-baseline requires --baseline.')
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            counts = generate_dataset(items=options['items'], seed=options['seed'], days=options['days'])
+            self.stdout.write('Dataset: ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+            results = run_benchmarks(repeat=options['repeat'], only=options['only'])
+        finally:
+            remove_dataset_files()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        width = max((len(name) for name in results), default=0)
+        for name, result in sorted(results.items()):
+            self.stdout.write(f"{name:<{width}}  {result['seconds'] * 1000:10.2f} ms  {result['queries']:5d} queries")
+
+        meta = {'items': options['items'], 'seed': options['seed'], 'days': options['days'], 'repeat': options['repeat']}
+        if options['update_baseline']:
+            save_baseline(options['baseline'], results, **meta)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}."))
+            return
+        if not options['baseline']:
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline.get('meta', {}).get('items') != meta['items'] or baseline.get('meta', {}).get('seed') != meta['seed']:
+            self.stdout.write(self.style.WARNING('Baseline was recorded with a different dataset; comparisons may not be meaningful.'))
+        regressions = compare_to_baseline(results, baseline.get('results', {}), options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(f'  {line}' for line in regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
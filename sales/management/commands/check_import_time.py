@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that must not be imported while the project starts up
+DEFAULT_FORBIDDEN = ('pandas', 'numpy')
+
+STARTUP_SCRIPT = 'import django; django.setup(); import sales.urls'
+
+
+def parse_importtime(output):
+    """
+    Parses the stderr of 'python -X importtime'.
+
+    Args:
+        output (str): The captured stderr.
+
+    Returns:
+        dict: Maps each imported module name to its self time in microseconds.
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _cumulative, name = line[len('import time:'):].split('|', 2)
+        modules[name.strip()] = int(self_us)
+    return modules
+
+
+class Command(BaseCommand):
+    """
+    Management command that measures project startup with 'python -X importtime'.
+
+    It fails when a forbidden analytics dependency is imported at startup, or when the
+    total import time exceeds the budget.
+
+    Usage:
+        python manage.py check_import_time [--budget-ms 800] [--forbid pandas,numpy]
+    """
+    help = 'Fails if Django startup imports heavy analytics modules or exceeds an import time budget.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget-ms', type=float, default=getattr(settings, 'SALES_IMPORT_BUDGET_MS', None),
+            help='Maximum total import time in milliseconds. Defaults to settings.SALES_IMPORT_BUDGET_MS.'
+        )
+        parser.add_argument(
+            '--forbid', default=','.join(DEFAULT_FORBIDDEN),
+            help='Comma-separated top-level modules that must not be imported at startup.'
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            capture_output=True, text=True, env=env, cwd=os.getcwd()
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+
+        modules = parse_importtime(result.stderr)
+        total_ms = sum(modules.values()) / 1000
+        self.stdout.write(f'Imported {len(modules)} modules in {total_ms:.1f} ms.')
+
+        forbidden = {name for name in options['forbid'].split(',') if name}
+        offenders = sorted(name for name in modules if name.split('.')[0] in forbidden)
+        if offenders:
+            raise CommandError(f"Startup imports forbidden modules: {', '.join(offenders[:10])}")
+
+        budget = options['budget_ms']
+        if budget is not None and total_ms > budget:
+            slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]
+            details = '\n'.join(f'  {us / 1000:8.1f} ms  {name}' for name, us in slowest)
+            raise CommandError(f'Startup import time {total_ms:.1f} ms exceeds the {budget:.1f} ms budget. Slowest:\n{details}')
+
+        self.stdout.write(self.style.SUCCESS('Startup import check passed.'))
@@ -0,0 +1,47 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from sales.ingest import INGEST_BATCH_SIZE, INGEST_FORMATS, detect_format, ingest_sales, iter_records
+
+
+class Command(BaseCommand):
+    """
+    Management command for bulk importing sales from a CSV or NDJSON file.
+
+    The file is streamed, validated and inserted in batches, each in its own transaction.
+
+    Usage:
+        python manage.py import_sales path/to/sales.csv [--format csv|ndjson] [--batch-size 5000]
+    """
+    help = 'Bulk imports Sale rows from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import. Use '-' to read from standard input.")
+        parser.add_argument('--format', choices=INGEST_FORMATS, help='Input format. Defaults to a guess from the file name.')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='Rows validated and inserted per batch.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        fmt = options['format'] or detect_format(options['path'])
+
+        reported = 0
+
+        def report_batch(result):
+            nonlocal reported
+            for error in result.errors[reported:]:
+                where = f"line {error['line']}" if error['line'] else 'whole batch'
+                self.stderr.write(f"Batch {error['batch']}, {where}: {error['errors']}")
+            reported = len(result.errors)
+            self.stdout.write(f'Batch {result.batches}: {result.inserted} inserted, {result.rejected} rejected of {result.rows} rows.')
+
+        if options['path'] == '-':
+            result = ingest_sales(iter_records(sys.stdin.buffer, fmt), options['batch_size'], on_batch=report_batch)
+        else:
+            try:
+                with open(options['path'], 'rb') as stream:
+                    result = ingest_sales(iter_records(stream, fmt), options['batch_size'], on_batch=report_batch)
+            except OSError as e:
+                raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        message = f'Imported {result.inserted} of {result.rows} sales; {result.rejected} rejected.'
+        self.stdout.write(self.style.SUCCESS(message) if not result.rejected else self.style.WARNING(message))
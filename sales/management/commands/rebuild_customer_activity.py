@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from sales.customers import rebuild_customer_activity, CUSTOMER_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    """
+    Management command for rebuilding or backfilling the customer activity tables.
+
+    Usage:
+        python manage.py rebuild_customer_activity [--batch-size 1000]
+    """
+    help = 'Rebuilds the CustomerActivity and CustomerMonth tables from Order.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CUSTOMER_BATCH_SIZE, help='Rows per bulk insert.')
+
+    def handle(self, *args, **options):
+        written = rebuild_customer_activity(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} customer activity rows.'))
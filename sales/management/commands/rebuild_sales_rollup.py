@@ -0,0 +1,38 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from sales.rollup import rebuild_rollup, ROLLUP_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    """
+    Management command for rebuilding or backfilling the daily sales rollup.
+
+    Usage:
+        python manage.py rebuild_sales_rollup [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--product ID]
+    """
+    help = 'Rebuilds the DailySalesRollup table from OrderInvoiceItems.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='to_date', help='Last day to rebuild, inclusive (YYYY-MM-DD).')
+        parser.add_argument('--product', type=int, help='Only rebuild rows for this product ID.')
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE, help='Rows per bulk insert.')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = self._parse_date(options['from_date'])
+            end_date = self._parse_date(options['to_date'])
+        except ValueError:
+            raise CommandError('Invalid date format. Use YYYY-MM-DD.')
+
+        written = rebuild_rollup(
+            start_date=start_date,
+            end_date=end_date,
+            product_id=options['product'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup rows.'))
+
+    @staticmethod
+    def _parse_date(value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from sales.jobs import recover_stale_jobs
+
+
+class Command(BaseCommand):
+    """
+    Management command for recovering report jobs lost by a stopped or restarted process.
+
+    Usage:
+        python manage.py recover_report_jobs [--stale-seconds 900]
+    """
+    help = 'Resubmits stale queued report jobs and marks stale running ones as failed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-seconds', type=int, default=None, help='Age after which a job is considered lost. Defaults to SALES_REPORT_JOB_STALE_SECONDS or 900.')
+
+    def handle(self, *args, **options):
+        resubmitted, failed = recover_stale_jobs(stale_seconds=options['stale_seconds'])
+        self.stdout.write(self.style.SUCCESS(f'Resubmitted {resubmitted} and failed {failed} stale report jobs.'))
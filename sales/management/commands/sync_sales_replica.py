@@ -0,0 +1,39 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from sales.routing import primary_database
+
+
+class Command(BaseCommand):
+    """
+    Management command for copying a local SQLite primary into its SQLite analytics replica.
+
+    Real replicas are kept up to date by the database server; this stands in for replication
+    when both aliases are SQLite files, e.g. when trying out sales.routing locally.
+
+    Usage:
+        python manage.py sync_sales_replica [--replica replica]
+    """
+    help = 'Copies the primary SQLite database into the SALES_READ_DATABASE SQLite file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replica', default=None, help='Replica alias. Defaults to SALES_READ_DATABASE.')
+
+    def handle(self, *args, **options):
+        primary = primary_database()
+        replica = options['replica'] or getattr(settings, 'SALES_READ_DATABASE', None)
+        if not replica or replica == primary or replica not in settings.DATABASES:
+            raise CommandError('Configure SALES_READ_DATABASE or pass --replica with a replica alias.')
+        for alias in (primary, replica):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"'{alias}' is not a SQLite database.")
+
+        connections[replica].close()
+        connections[primary].ensure_connection()
+        target = sqlite3.connect(str(settings.DATABASES[replica]['NAME']))
+        try:
+            connections[primary].connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(self.style.SUCCESS(f"Copied '{primary}' into '{replica}'."))
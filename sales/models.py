@@ -1,7 +1,6 @@
 from django.db import models
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField 
+from django.db.models import Q, Sum, F, ExpressionWrapper, DecimalField 
 from core.models import Order, Report, ReportMetric, Metric, DataSource, Dashboard, DashboardLayout, Product, OrderInvoiceItems
-import pandas as pd
 
 class Sale(models.Model):
     """
@@ -18,6 +17,13 @@ class Sale(models.Model):
     sale_date = models.DateField()
     revenue = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        # Date-range scans, per-product history and per-day product breakdowns use these
+        indexes = [
+            models.Index(fields=['sale_date', 'product_name'], name='sale_date_product_idx'),
+            models.Index(fields=['product_name', 'sale_date'], name='sale_product_date_idx'),
+        ]
+
     def __str__(self):
         """
         String representation of the Sale model.
@@ -28,16 +34,55 @@ class Sale(models.Model):
         return self.product_name
 
     @staticmethod
-    def get_sales_trend_data():
+    def get_sales_trend_data(granularity='month'):
         """
         Static method to retrieve and calculate sales trend data.
         
-        Aggregates total revenue and total quantity of sales by month.
+        Aggregates total revenue and total quantity of sales per bucket in the database, so only
+        one row per bucket is fetched. Empty buckets are filled with 0, as in get_sales_trend_data_pandas.
+
+        Args:
+            granularity (str, optional): Bucket size, one of 'day', 'week', 'month' or 'quarter'. Defaults to 'month'.
+
+        Returns:
+            dict: A dictionary containing lists of bucket labels (under 'months'), total revenue, and total quantity.
+                  Returns empty lists if there are no sales records.
+        """
+        from .calculations import get_granularity, fill_buckets
+
+        buckets = Sale.objects.annotate(
+            bucket=get_granularity(granularity)['trunc']('sale_date')
+        ).values('bucket').annotate(
+            total_revenue=Sum('revenue'),
+            total_quantity=Sum('quantity')
+        ).order_by('bucket')
+
+        series = fill_buckets(buckets, granularity, ['total_revenue', 'total_quantity'])
+        return {
+            'months': series['labels'],
+            'total_revenue': series['total_revenue'],
+            'total_quantity': series['total_quantity']
+        }
+
+    @staticmethod
+    def get_sales_trend_data_pandas(granularity='month'):
+        """
+        Static method to retrieve and calculate sales trend data by resampling daily totals in pandas.
+        
+        Aggregates total revenue and total quantity of sales by month. Reference implementation
+        for get_sales_trend_data, which buckets in the database instead.
+
+        Args:
+            granularity (str, optional): Bucket size, one of 'day', 'week', 'month' or 'quarter'. Defaults to 'month'.
 
         Returns:
             dict: A dictionary containing lists of months, total revenue, and total quantity.
                   Returns empty lists if there are no sales records.
         """
+        import pandas as pd
+        from .calculations import get_granularity
+
+        bucketing = get_granularity(granularity)
         sales = Sale.objects.values('sale_date').annotate(
             total_revenue=Sum('revenue'),
             total_quantity=Sum('quantity')
@@ -48,15 +93,229 @@ class Sale(models.Model):
         if df.empty:
             return {'months': [], 'total_revenue': [], 'total_quantity': []}
         
-        # Set the sale_date as index and resample data monthly
+        # Set the sale_date as index and resample data per bucket
         df['sale_date'] = pd.to_datetime(df['sale_date'])
         df.set_index('sale_date', inplace=True)
-        df = df.resample('M').sum()
+        df = df.resample(bucketing['rule']).sum()
 
         # Prepare trend data for response
         trend_data = {
-            'months': df.index.strftime('%Y-%m').tolist(),
+            'months': df.index.strftime(bucketing['label']).tolist(),
             'total_revenue': df['total_revenue'].tolist(),
             'total_quantity': df['total_quantity'].tolist()
         }
         return trend_data
+
+
+class DailySalesRollup(models.Model):
+    """
+    Model holding pre-aggregated sales for one product shipped to one country on one day.
+
+    Rows are maintained incrementally by the signal handlers in ``sales.signals``
+    and can be rebuilt with the ``rebuild_sales_rollup`` management command.
+
+    Attributes:
+        day (date): Local calendar day of the orders.
+        productID (Product): Product the totals belong to.
+        country (str): Shipping country of the orders, if any.
+        line_count (int): Number of invoice line items.
+        quantity (int): Total units sold.
+        gross_sales (Decimal): Sum of quantity * price.
+        margin (Decimal): Sum of quantity * (price - costPrice).
+    """
+    day = models.DateField()
+    productID = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales_rollups')
+    country = models.CharField(max_length=100, null=True, blank=True)
+    line_count = models.PositiveIntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    gross_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    margin = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        # NULLs never compare equal in a unique constraint, so orders without a shipping
+        # country need their own partial constraint to get one row per day and product
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'productID', 'country'], name='unique_daily_sales_rollup'),
+            models.UniqueConstraint(fields=['day', 'productID'], condition=Q(country__isnull=True), name='unique_daily_sales_rollup_no_country'),
+        ]
+
+    def __str__(self):
+        """
+        String representation of the DailySalesRollup model.
+
+        Returns:
+            str: The day, product ID and country of the rollup row.
+        """
+        return f"{self.day} / {self.productID_id} / {self.country}"
+
+
+class ReportJob(models.Model):
+    """
+    Model representing a report generated in the background by the local worker pool.
+
+    Attributes:
+        report (Report): The report row the generated file belongs to.
+        report_type (str): 'sales-summary' or 'product-analysis'.
+        from_date (date): First day of the report, if any.
+        to_date (date): Last day of the report, if any.
+        status (str): One of queued, running, succeeded or failed.
+        progress (int): Percentage of report sections written.
+        file (File): The generated CSV once the job has succeeded.
+        error (str): The error message if the job failed.
+        created_at (datetime): When the job was enqueued.
+        updated_at (datetime): When the job was last saved; a running job saves after every section.
+        finished_at (datetime): When the job succeeded or failed.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name='jobs')
+    report_type = models.CharField(max_length=50)
+    from_date = models.DateField(null=True, blank=True)
+    to_date = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    file = models.FileField(upload_to='reports/', null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """
+        String representation of the ReportJob model.
+
+        Returns:
+            str: The report type and status of the job.
+        """
+        return f"{self.report_type} ({self.status})"
+
+
+class TrendPeriod(models.Model):
+    """
+    Model persisting one closed month of a sales trend series and its tracked indicator values.
+
+    A series is identified by its start date. Closed months never change unless late data
+    arrives, in which case the rollup maintenance deletes the affected months and later ones.
+
+    Attributes:
+        series_start (date): The 'start_date' of the trend requests this series answers.
+        month (date): First day of the month.
+        total_revenue (Decimal): Gross sales of the month within the series.
+        total_quantity (int): Units sold in the month within the series.
+        indicators (dict): Maps each tracked indicator name to its value for this month. This is the
+            whole EMA state; SMA and WMA read their window from the persisted totals.
+    """
+    series_start = models.DateField()
+    month = models.DateField()
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_quantity = models.BigIntegerField(default=0)
+    indicators = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['series_start', 'month'], name='unique_trend_period'),
+        ]
+
+    def __str__(self):
+        """
+        String representation of the TrendPeriod model.
+
+        Returns:
+            str: The series start date and the month.
+        """
+        return f"{self.series_start} / {self.month}"
+
+
+class CustomerActivity(models.Model):
+    """
+    Model summarizing the order history of one customer, identified by email.
+
+    Rows are maintained incrementally by the signal handlers in ``sales.signals`` and can be
+    rebuilt with the ``rebuild_customer_activity`` management command.
+
+    Attributes:
+        email (str): The customer's email, as stored on their orders.
+        first_order (datetime): When the customer placed their first order.
+        last_order (datetime): When the customer placed their latest order.
+        cohort (date): First day of the local month of the first order.
+        order_count (int): Number of orders.
+        lifetime_value (Decimal): Sum of quantity * price over every order.
+    """
+    email = models.CharField(max_length=254, unique=True)
+    first_order = models.DateTimeField(db_index=True)
+    last_order = models.DateTimeField(db_index=True)
+    cohort = models.DateField(db_index=True)
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        """
+        String representation of the CustomerActivity model.
+
+        Returns:
+            str: The customer's email.
+        """
+        return self.email
+
+
+class CustomerMonth(models.Model):
+    """
+    Model recording the months in which a customer placed orders, for cohort retention.
+
+    Attributes:
+        customer (CustomerActivity): The customer.
+        month (date): First day of the local month.
+        order_count (int): Number of orders the customer placed that month.
+    """
+    customer = models.ForeignKey(CustomerActivity, on_delete=models.CASCADE, related_name='months')
+    month = models.DateField()
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'month'], name='unique_customer_month'),
+        ]
+
+    def __str__(self):
+        """
+        String representation of the CustomerMonth model.
+
+        Returns:
+            str: The customer ID and the month.
+        """
+        return f"{self.customer_id} / {self.month}"
+
+
+class DataVersion(models.Model):
+    """
+    Model holding a version counter that is bumped whenever a kind of sales data changes.
+
+    The counters live in the database rather than the cache, so every worker process, and any
+    read replica, sees the version that matches the data it reads.
+
+    Attributes:
+        name (str): What the counter tracks, 'data' for the sales rollup or 'reports'.
+        version (int): Incremented on every change.
+        updated_at (datetime): When the counter was last bumped.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """
+        String representation of the DataVersion model.
+
+        Returns:
+            str: The counter name and version.
+        """
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,84 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from .columnar import encode_json, encode_packed
+
+
+class FileDownloadRenderer(BaseRenderer):
+    """
+    Renderer registering a download format with DRF's content negotiation.
+
+    Views using it build their own HttpResponse for the format, so the renderer only
+    makes '?format=<name>' acceptable instead of answering 404. Error payloads, such as a
+    400 for an invalid parameter, are sent as JSON rather than as a broken file.
+    """
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Return file content unchanged, and encode any other payload as JSON.
+        """
+        if data is None or isinstance(data, (bytes, str)):
+            return data
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data)
+
+
+class CSVRenderer(FileDownloadRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ArrowRenderer(FileDownloadRenderer):
+    media_type = 'application/vnd.apache.arrow.file'
+    format = 'arrow'
+
+
+class ParquetRenderer(FileDownloadRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+
+class NpzRenderer(FileDownloadRenderer):
+    media_type = 'application/octet-stream'
+    format = 'npz'
+
+
+class ColumnarJSONRenderer(BaseRenderer):
+    """
+    Renderer sending each series as a typed column of plain floats, ints or strings.
+
+    See sales.columnar.to_columns for the layout.
+    """
+    media_type = 'application/vnd.sales.columnar+json'
+    format = 'columnar'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Encode the payload as columnar JSON.
+        """
+        if data is None:
+            return b''
+        return encode_json(data)
+
+
+class PackedColumnarRenderer(BaseRenderer):
+    """
+    Renderer sending numeric series as packed little-endian float64 buffers behind a JSON header.
+
+    See sales.columnar.PACKED_MAGIC for the layout.
+    """
+    media_type = 'application/vnd.sales.columnar'
+    format = 'packed'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Encode the payload in the packed binary format.
+        """
+        if data is None:
+            return b''
+        return encode_packed(data)
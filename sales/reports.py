@@ -0,0 +1,388 @@
+import threading
+from datetime import timedelta
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+from .aggregation import DIMENSIONS, OTHER_LABEL, aggregate_sales, other_totals, top_groups
+from .customers import COHORT_MONTHS, cohort_retention, customer_metrics
+from .dateranges import local_day, range_filters
+from .models import DailySalesRollup
+from .restock import restock_candidates
+from .rollup import rollup_filters
+
+# Number of rows fetched per round trip when a section is read through a server-side cursor
+REPORT_CHUNK_SIZE = 2000
+
+# Settings:
+# - SALES_REPORT_SECTION_WORKERS : Threads shared by every report whose sections run concurrently.
+#   Defaults to 4.
+
+_section_executor = None
+_section_executor_lock = threading.Lock()
+
+
+def report_filters(from_date=None, to_date=None):
+    """
+    Builds the report query filters from the 'fromDate' and 'toDate' parameters.
+
+    The range is half-open and covers the whole of 'toDate'.
+
+    Args:
+        from_date (str, optional): First day of the report in 'YYYY-MM-DD' format. Defaults to None.
+        to_date (str, optional): Last day of the report in 'YYYY-MM-DD' format. Defaults to None.
+
+    Returns:
+        dict: Filters keyed by 'orderID__order_datetime__gte' and/or 'orderID__order_datetime__lt'.
+
+    Raises:
+        ValueError: If a date is not in 'YYYY-MM-DD' format.
+    """
+    return range_filters('orderID__order_datetime', from_date, to_date)
+
+
+class ReportData:
+    """
+    Report filters plus the sales aggregate shared by every section of one report.
+
+    The aggregate is computed at most once, even when sections run on several threads.
+
+    Attributes:
+        filters (dict): Query filters for fetching sales data.
+        top (int): When set, grouped sections list only the top groups plus an 'Other' row.
+    """
+    def __init__(self, filters, top=None):
+        self.filters = filters
+        self.top = top
+        self._sales = None
+        self._lock = threading.Lock()
+
+    @property
+    def sales(self):
+        """
+        Totals by product, category and country, computed in a single database pass.
+
+        With a top-N limit only the store-wide totals are aggregated here; the groups are
+        ranked in the database by groups().
+
+        Returns:
+            SalesAggregate: The aggregate for the report's date range.
+        """
+        with self._lock:
+            if self._sales is None:
+                dimensions = () if self.top else tuple(DIMENSIONS)
+                self._sales = aggregate_sales(rollup_filters(self.filters), dimensions=dimensions)
+            return self._sales
+
+    def groups(self, dimension):
+        """
+        Returns the groups of a dimension, best sellers first.
+
+        Args:
+            dimension (str): One of DIMENSIONS.
+
+        Returns:
+            list: Rows as returned by SalesAggregate.by. With a top-N limit, the top groups
+                  followed by an 'Other' row summing the rest, when anything remains.
+        """
+        if not self.top:
+            return self.sales.by(dimension)
+        rows, _has_more = top_groups(rollup_filters(self.filters), dimension, self.top)
+        other = other_totals(self.sales.total, rows)
+        if other['line_count']:
+            rows.append({DIMENSIONS[dimension]: OTHER_LABEL, **other})
+        return rows
+
+
+def sales_overview_rows(report):
+    """
+    Yields the rows of the 'Sales Performance Overview' section.
+
+    Args:
+        report (ReportData): The report being generated.
+
+    Yields:
+        list: One CSV row per metric.
+    """
+    total_sales_price = report.sales.total['gross_sales']
+    total_sales = report.sales.total['line_count']
+    avg_sale_value = total_sales_price / total_sales if total_sales else 0
+    yield ['Sales Performance Overview', 'Total Sales Price', total_sales_price]
+    yield ['', 'Total Sales', total_sales]
+    yield ['', 'Average Sale Value', avg_sale_value]
+
+
+def _grouped_rows(report, dimension):
+    """
+    Yields one row per group of a dimension with units sold and total sales price.
+
+    Args:
+        report (ReportData): The report being generated.
+        dimension (str): The aggregation dimension, e.g. 'product'.
+
+    Yields:
+        list: [group, units sold, total sales price], best sellers first.
+    """
+    field = DIMENSIONS[dimension]
+    for sale in report.groups(dimension):
+        yield [sale[field], sale['quantity'], sale['gross_sales']]
+
+
+def product_rows(report):
+    """
+    Yields one row per product with units sold and total sales price.
+    """
+    return _grouped_rows(report, 'product')
+
+
+def _grouped_columns(report, dimension):
+    """
+    Returns the columns of a grouped section, read field by field from the aggregate rows.
+
+    Args:
+        report (ReportData): The report being generated.
+        dimension (str): The aggregation dimension, e.g. 'product'.
+
+    Returns:
+        list: The group, units sold and total sales price columns, best sellers first.
+    """
+    groups = report.groups(dimension)
+    return [[group[field] for group in groups] for field in (DIMENSIONS[dimension], 'quantity', 'gross_sales')]
+
+
+def product_columns(report):
+    """
+    Returns the columns of the per-product section.
+    """
+    return _grouped_columns(report, 'product')
+
+
+def product_overview_rows(report):
+    """
+    Yields the rows of the 'Product Performance Overview' section.
+    """
+    for row in product_rows(report):
+        yield ['Product Performance Overview', *row]
+
+
+def category_rows(report):
+    """
+    Yields one row per product category with units sold and total sales price.
+    """
+    return _grouped_rows(report, 'category')
+
+
+def category_columns(report):
+    """
+    Returns the columns of the per-category section.
+    """
+    return _grouped_columns(report, 'category')
+
+
+def region_rows(report):
+    """
+    Yields one row per shipping country with units sold and total sales price.
+    """
+    return _grouped_rows(report, 'country')
+
+
+def region_columns(report):
+    """
+    Returns the columns of the per-country section.
+    """
+    return _grouped_columns(report, 'country')
+
+
+def customer_rows(report):
+    """
+    Yields the rows of the 'Customer Analysis' section, read from the customer activity table.
+    """
+    filters = report.filters
+    metrics = customer_metrics(filters.get('orderID__order_datetime__gte'), filters.get('orderID__order_datetime__lt'))
+    customer_retention_rate = (metrics['repeat'] / metrics['active']) * 100 if metrics['active'] else 0
+    yield ['Number of New Customers', metrics['new']]
+    yield ['Repeat Customers', metrics['repeat']]
+    yield ['Customer Retention Rate (%)', customer_retention_rate]
+
+
+def cohort_rows(report):
+    """
+    Yields one row per monthly cohort with the share of customers ordering in each following month.
+    """
+    filters = report.filters
+    cohorts = cohort_retention(filters.get('orderID__order_datetime__gte'), filters.get('orderID__order_datetime__lt'))
+    for cohort, size, retained in cohorts:
+        yield [cohort.strftime('%Y-%m'), size, *(round(customers * 100 / size, 1) for customers in retained)]
+
+
+def _daily_trends(report):
+    return DailySalesRollup.objects.filter(**rollup_filters(report.filters)).values('day').annotate(
+        total_quantity=Sum('quantity'),
+        total_sales_price=Sum('gross_sales')
+    ).order_by('day')
+
+
+def sales_trend_rows(report):
+    """
+    Yields one row per day with units sold and total sales price, oldest first.
+    """
+    for trend in _daily_trends(report).iterator(chunk_size=REPORT_CHUNK_SIZE):
+        yield [trend['day'].strftime('%m/%d/%y'), trend['total_quantity'], trend['total_sales_price']]
+
+
+def sales_trend_columns(report):
+    """
+    Returns the day, units sold and total sales price columns, oldest first.
+
+    The days are kept as dates, so columnar exports store them as a date column.
+    """
+    trends = _daily_trends(report).values_list('day', 'total_quantity', 'total_sales_price')
+    return [list(column) for column in zip(*trends)] or [[], [], []]
+
+
+def inventory_rows(report):
+    """
+    Yields one row per product that needs restocking, most urgent first.
+
+    Sales velocity is measured over the days leading up to the report's last day.
+    """
+    end = report.filters.get('orderID__order_datetime__lt')
+    as_of = local_day(end) - timedelta(days=1) if end is not None else None
+    for item in restock_candidates(as_of=as_of):
+        yield [
+            item['product'], item['stock'], item['restock_threshold'], item['last_restocked'],
+            item['daily_velocity'], item['days_of_cover'], item['reorder_quantity'], '; '.join(item['reasons'])
+        ]
+
+
+# Report layouts. Each section is a (title, header, rows) tuple, where rows is a
+# function taking the ReportData and yielding the section's CSV rows.
+
+SALES_SUMMARY_SECTIONS = [
+    ('Sales Performance Overview', ['Section', 'Metric', 'Value'], sales_overview_rows),
+    ('Detailed Sales Breakdown by Product', ['Product', 'Units Sold', 'Total Sales Price'], product_rows),
+    ('Detailed Sales Breakdown by Category', ['Category', 'Units Sold', 'Total Sales Price'], category_rows),
+    ('Detailed Sales Breakdown by Region', ['Region', 'Units Sold', 'Total Sales Price'], region_rows),
+    ('Customer Analysis', ['Metric', 'Value'], customer_rows),
+    ('Customer Cohort Retention (%)', ['Cohort', 'Customers', *(f'Month {month}' for month in range(COHORT_MONTHS))], cohort_rows),
+]
+
+PRODUCT_ANALYSIS_SECTIONS = [
+    ('Product Performance Overview', ['Section', 'Product', 'Units Sold', 'Total Sales Price'], product_overview_rows),
+    ('Product Sales Trends', ['Date', 'Units Sold', 'Total Sales Price'], sales_trend_rows),
+    ('Product Category Analysis', ['Category', 'Units Sold', 'Total Sales Price'], category_rows),
+    ('Inventory and Restock Analysis', ['Product', 'Current Stock', 'Restock Threshold', 'Last Restocked', 'Units Sold per Day', 'Days of Cover', 'Reorder Quantity', 'Flags'], inventory_rows),
+]
+
+# Row functions whose sections columnar exports read column by column instead. Other sections
+# have a handful of rows and are transposed.
+SECTION_COLUMNS = {
+    product_rows: product_columns,
+    category_rows: category_columns,
+    region_rows: region_columns,
+    sales_trend_rows: sales_trend_columns,
+}
+
+REPORT_SECTIONS = {
+    'sales-summary': SALES_SUMMARY_SECTIONS,
+    'product-analysis': PRODUCT_ANALYSIS_SECTIONS,
+}
+
+
+def iter_report_rows(sections, filters, top=None):
+    """
+    Lazily yields every CSV row of a report, section by section.
+
+    Sections are separated by a blank row and start with their title and header rows.
+    No section is queried before the previous one has been fully consumed, and the
+    grouped sections share one aggregation pass.
+
+    Args:
+        sections (list): The report layout, e.g. SALES_SUMMARY_SECTIONS.
+        filters (dict): Query filters for fetching sales data.
+        top (int, optional): Limit grouped sections to the top N groups plus 'Other'. Defaults to None.
+
+    Yields:
+        list: The next CSV row.
+    """
+    report = ReportData(filters, top=top)
+    for index, (title, header, rows) in enumerate(sections):
+        if index:
+            yield []
+        yield [title]
+        yield header
+        yield from rows(report)
+
+
+def _collect_section(rows, report):
+    """
+    Runs one report section to completion on a worker thread.
+
+    Each worker thread gets its own database connections from Django, which are closed
+    once the section's rows have been read.
+
+    Args:
+        rows (callable): The section's row function.
+        report (ReportData): The report being generated.
+
+    Returns:
+        list: The section's CSV rows.
+    """
+    try:
+        return list(rows(report))
+    finally:
+        connections.close_all()
+
+
+def get_section_executor():
+    """
+    Returns the process-wide pool that runs report sections, creating it on first use.
+
+    The pool is shared by every request, so concurrent reports queue for its threads instead
+    of each starting their own, and the number of section queries in flight stays bounded.
+
+    Returns:
+        ThreadPoolExecutor: The section worker pool.
+    """
+    global _section_executor
+    with _section_executor_lock:
+        if _section_executor is None:
+            _section_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'SALES_REPORT_SECTION_WORKERS', 4),
+                thread_name_prefix='sales-section'
+            )
+        return _section_executor
+
+
+def iter_report_rows_concurrently(sections, filters, top=None):
+    """
+    Yields every CSV row of a report, computing the sections concurrently.
+
+    Sections are submitted to the shared section pool up front and written out in their
+    original order, so the report takes about as long as its slowest section. Unlike
+    iter_report_rows, each section is held in memory until it has been written. Sections
+    not started yet are cancelled if the rows stop being consumed, e.g. when the client
+    disconnects.
+
+    Args:
+        sections (list): The report layout, e.g. SALES_SUMMARY_SECTIONS.
+        filters (dict): Query filters for fetching sales data.
+        top (int, optional): Limit grouped sections to the top N groups plus 'Other'. Defaults to None.
+
+    Yields:
+        list: The next CSV row.
+    """
+    report = ReportData(filters, top=top)
+    pool = get_section_executor()
+    futures = [pool.submit(copy_context().run, _collect_section, rows, report) for _title, _header, rows in sections]
+    try:
+        for index, ((title, header, _rows), future) in enumerate(zip(sections, futures)):
+            if index:
+                yield []
+            yield [title]
+            yield header
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
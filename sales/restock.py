@@ -0,0 +1,104 @@
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from core.models import Inventory, Product
+from .dateranges import today
+from .models import DailySalesRollup
+from .singleflight import coalesced
+
+# Settings:
+# - SALES_VELOCITY_DAYS : Days of sales the daily sales velocity is averaged over. Defaults to 30.
+# - SALES_RESTOCK_HORIZON_DAYS : Products whose stock covers fewer days than this are flagged as
+#   running out. Defaults to 14.
+
+BELOW_THRESHOLD = 'below threshold'
+RUNNING_OUT = 'running out'
+
+RESTOCK_CHUNK_SIZE = 2000
+
+
+def _per_product(queryset, field):
+    """
+    Returns a correlated subquery summing field over the rows of queryset for the outer product.
+    """
+    totals = queryset.values('product').annotate(total=Sum(field)).values('total')
+    return Coalesce(Subquery(totals, output_field=IntegerField()), Value(0))
+
+
+@coalesced
+def restock_candidates(as_of=None, velocity_days=None, horizon_days=None, category=None):
+    """
+    Returns the products that need restocking, most urgent first.
+
+    Stock is summed per product over its inventory batches, and units sold over the last
+    velocity_days days are read from DailySalesRollup, both as subqueries of one query on
+    Product. The database keeps only the products that are at or below their restock
+    threshold, or whose stock covers fewer than horizon_days days of sales:
+    stock / (sold / velocity_days) < horizon_days, compared as stock * velocity_days < sold * horizon_days.
+
+    Args:
+        as_of (date, optional): Last day of the velocity window. Defaults to today.
+        velocity_days (int, optional): Length of the velocity window. Defaults to settings.SALES_VELOCITY_DAYS or 30.
+        horizon_days (int, optional): Days of cover below which a product is running out.
+            Defaults to settings.SALES_RESTOCK_HORIZON_DAYS or 14.
+        category (str, optional): Only consider products in this category. Defaults to None.
+
+    Returns:
+        list: One dict per product with 'product_id', 'product', 'category', 'stock',
+              'restock_threshold', 'last_restocked', 'units_sold', 'daily_velocity',
+              'days_of_cover' (None without recent sales), 'reorder_quantity' (units needed to
+              clear the threshold and cover horizon_days of sales) and 'reasons'.
+    """
+    as_of = as_of or today()
+    velocity_days = velocity_days or getattr(settings, 'SALES_VELOCITY_DAYS', 30)
+    horizon_days = horizon_days or getattr(settings, 'SALES_RESTOCK_HORIZON_DAYS', 14)
+
+    inventory = Inventory.objects.filter(batchID__productID=OuterRef('pk')).annotate(product=F('batchID__productID'))
+    sales = DailySalesRollup.objects.filter(
+        productID=OuterRef('pk'),
+        day__gt=as_of - timedelta(days=velocity_days),
+        day__lte=as_of
+    ).annotate(product=F('productID'))
+    last_restocked = inventory.values('product').annotate(last=Max('lastRestocked')).values('last')
+
+    products = Product.objects.all()
+    if category is not None:
+        products = products.filter(category=category)
+    products = products.annotate(
+        stock=_per_product(inventory, 'batchID__quantity'),
+        units_sold=_per_product(sales, 'quantity'),
+        last_restocked=Subquery(last_restocked),
+    ).annotate(
+        covered_units=ExpressionWrapper(F('stock') * velocity_days, output_field=IntegerField()),
+        horizon_units=ExpressionWrapper(F('units_sold') * horizon_days, output_field=IntegerField()),
+    ).filter(
+        Q(stock__lte=F('restockThreshold')) | Q(covered_units__lt=F('horizon_units'))
+    ).values('pk', 'prodName', 'category', 'restockThreshold', 'stock', 'units_sold', 'last_restocked')
+
+    candidates = []
+    for row in products.iterator(chunk_size=RESTOCK_CHUNK_SIZE):
+        stock, sold, threshold = row['stock'], row['units_sold'], row['restockThreshold'] or 0
+        velocity = sold / velocity_days
+        reasons = []
+        if stock <= threshold:
+            reasons.append(BELOW_THRESHOLD)
+        if stock * velocity_days < sold * horizon_days:
+            reasons.append(RUNNING_OUT)
+        candidates.append({
+            'product_id': row['pk'],
+            'product': row['prodName'],
+            'category': row['category'],
+            'stock': stock,
+            'restock_threshold': threshold,
+            'last_restocked': row['last_restocked'],
+            'units_sold': sold,
+            'daily_velocity': round(velocity, 2),
+            'days_of_cover': round(stock / velocity, 1) if velocity else None,
+            'reorder_quantity': max(threshold + 1, math.ceil(velocity * horizon_days)) - stock,
+            'reasons': reasons,
+        })
+    # Products running out soonest first, then those without recent sales by their shortfall
+    candidates.sort(key=lambda item: (item['days_of_cover'] is None, item['days_of_cover'] or 0, item['stock'] - item['restock_threshold']))
+    return candidates
@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.db.models import Sum, F, Count, DecimalField, ExpressionWrapper
+from django.db.models.functions import TruncDate
+from core.models import OrderInvoiceItems
+from .cache import bump_data_version
+from .dateranges import day_bounds, local_day, range_filters
+from .models import DailySalesRollup, TrendPeriod
+
+ROLLUP_BATCH_SIZE = 1000
+
+# Aggregates computed from OrderInvoiceItems for each rollup row. The 'total_' prefix keeps
+# the aliases from clashing with OrderInvoiceItems.quantity in annotate().
+ROLLUP_AGGREGATES = {
+    'total_line_count': Count('pk'),
+    'total_quantity': Sum('quantity'),
+    'total_gross_sales': Sum(ExpressionWrapper(
+        F('quantity') * F('productID__price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )),
+    'total_margin': Sum(ExpressionWrapper(
+        F('quantity') * (F('productID__price') - F('productID__costPrice')),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )),
+}
+
+
+def refresh_rollup_cell(day, product_id, country):
+    """
+    Recomputes a single (day, product, country) rollup row from the raw invoice items.
+
+    The row is deleted when no invoice items remain for the cell. Must run inside a
+    transaction: the row is created if needed and locked before the items are aggregated, so
+    a concurrent refresh of the same cell waits for this one to commit and then aggregates
+    its items too, instead of both missing each other's uncommitted items.
+
+    Args:
+        day (date): The day of the cell.
+        product_id (int): The primary key of the product.
+        country (str): The shipping country of the cell, or None.
+    """
+    cell, _created = DailySalesRollup.objects.get_or_create(day=day, productID_id=product_id, country=country)
+    cell = DailySalesRollup.objects.select_for_update().get(pk=cell.pk)
+
+    start, end = day_bounds(day)
+    totals = OrderInvoiceItems.objects.filter(
+        productID=product_id,
+        orderID__shippingID__country=country,
+        orderID__order_datetime__gte=start,
+        orderID__order_datetime__lt=end
+    ).aggregate(**ROLLUP_AGGREGATES)
+
+    if not totals['total_line_count']:
+        cell.delete()
+        return
+
+    cell.line_count = totals['total_line_count']
+    cell.quantity = totals['total_quantity'] or 0
+    cell.gross_sales = totals['total_gross_sales'] or 0
+    cell.margin = totals['total_margin'] or 0
+    cell.save(update_fields=['line_count', 'quantity', 'gross_sales', 'margin'])
+
+
+def invalidate_trend_periods(start_date=None):
+    """
+    Deletes the persisted trend months that changed rollup rows may have made stale.
+
+    Args:
+        start_date (date, optional): Earliest changed day. Defaults to None, which deletes every month.
+    """
+    periods = TrendPeriod.objects.all()
+    if start_date:
+        periods = periods.filter(month__gte=start_date.replace(day=1))
+    periods.delete()
+
+
+def refresh_rollup_cells(cells):
+    """
+    Recomputes a set of rollup rows inside one transaction.
+
+    The cells are locked in a fixed order, so concurrent refreshes cannot deadlock.
+
+    Args:
+        cells (iterable): Iterable of (day, product_id, country) tuples. Duplicates are ignored.
+    """
+    cells = sorted(set(cells), key=lambda cell: (cell[0], cell[1], cell[2] is not None, cell[2] or ''))
+    if not cells:
+        return
+    with transaction.atomic():
+        for day, product_id, country in cells:
+            refresh_rollup_cell(day, product_id, country)
+        invalidate_trend_periods(min(day for day, _product_id, _country in cells))
+        transaction.on_commit(bump_data_version)
+
+
+def rebuild_rollup(start_date=None, end_date=None, product_id=None, batch_size=ROLLUP_BATCH_SIZE):
+    """
+    Rebuilds the rollup rows for a date range from the raw invoice items.
+
+    Existing rows in the range are replaced in a single transaction, so readers never
+    see a partially rebuilt range.
+
+    Args:
+        start_date (date, optional): First day to rebuild. Defaults to the earliest order.
+        end_date (date, optional): Last day to rebuild (inclusive). Defaults to the latest order.
+        product_id (int, optional): Restrict the rebuild to one product. Defaults to None.
+        batch_size (int, optional): Number of rows per bulk insert. Defaults to ROLLUP_BATCH_SIZE.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    items = OrderInvoiceItems.objects.filter(**range_filters('orderID__order_datetime', start_date, end_date))
+    existing = DailySalesRollup.objects.all()
+    if start_date:
+        existing = existing.filter(day__gte=start_date)
+    if end_date:
+        existing = existing.filter(day__lte=end_date)
+    if product_id is not None:
+        items = items.filter(productID=product_id)
+        existing = existing.filter(productID=product_id)
+
+    grouped = items.annotate(
+        day=TruncDate('orderID__order_datetime')
+    ).values('day', 'productID', 'orderID__shippingID__country').annotate(**ROLLUP_AGGREGATES).order_by()
+
+    written = 0
+    with transaction.atomic():
+        existing.delete()
+        invalidate_trend_periods(start_date)
+        batch = []
+        for row in grouped.iterator(chunk_size=batch_size):
+            batch.append(DailySalesRollup(
+                day=row['day'],
+                productID_id=row['productID'],
+                country=row['orderID__shippingID__country'],
+                line_count=row['total_line_count'],
+                quantity=row['total_quantity'] or 0,
+                gross_sales=row['total_gross_sales'] or 0,
+                margin=row['total_margin'] or 0,
+            ))
+            if len(batch) >= batch_size:
+                DailySalesRollup.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            DailySalesRollup.objects.bulk_create(batch)
+            written += len(batch)
+        transaction.on_commit(bump_data_version)
+    return written
+
+
+def rollup_filters(filters):
+    """
+    Translates order datetime filters used by the report generators into rollup filters.
+
+    Args:
+        filters (dict): Filters keyed by 'orderID__order_datetime__gte' and/or
+                        'orderID__order_datetime__lt', as built by sales.dateranges.range_filters.
+
+    Returns:
+        dict: Equivalent filters on DailySalesRollup.day.
+    """
+    translated = {}
+    if filters.get('orderID__order_datetime__gte'):
+        translated['day__gte'] = local_day(filters['orderID__order_datetime__gte'])
+    if filters.get('orderID__order_datetime__lt'):
+        translated['day__lt'] = local_day(filters['orderID__order_datetime__lt'])
+    return translated
@@ -0,0 +1,265 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError, connections
+from .cache import get_cache
+
+# Settings:
+# - DATABASE_ROUTERS : Add 'sales.routing.AnalyticsRouter' to send analytics reads to a replica.
+# - SALES_READ_DATABASE : Database alias analytics reads are sent to, e.g. 'replica'.
+#   Defaults to None, which keeps every query on the primary.
+# - SALES_PRIMARY_DATABASE : Alias of the primary database. Defaults to 'default'.
+# - SALES_REPLICA_RETRY_SECONDS : How long an unreachable replica is skipped before it is
+#   tried again. Defaults to 30.
+# - SALES_REPLICA_CHECK_SECONDS : How long a successful replica health check is trusted before
+#   the connection is checked again. Defaults to 5.
+# - SALES_READ_YOUR_WRITES_SECONDS : How long a user's analytics reads stay on the primary
+#   after they wrote through CreateReportView or SaleIngestView. Defaults to 10.
+#
+# Connection reuse is configured per alias with pooled(); replica() also mirrors the primary
+# in tests. Locally, two SQLite files are enough:
+#
+#   DATABASES = {
+#       'default': pooled({'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'}),
+#       'replica': replica(pooled({'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3'})),
+#   }
+#   DATABASE_ROUTERS = ['sales.routing.AnalyticsRouter']
+#   SALES_READ_DATABASE = 'replica'
+#
+# and 'manage.py sync_sales_replica' copies the primary into the replica file.
+#
+# A lagging replica cannot poison cached or persisted results: the data watermark is read from
+# the same database as the data, so cached results are keyed on the version they were computed
+# from, and TrendPeriod rows are only persisted when that version matches the primary's.
+
+ANALYTICS = 'analytics'
+PRIMARY = 'primary'
+
+# Seconds a persistent connection is kept open by pooled(), unless overridden
+DEFAULT_CONN_MAX_AGE = 60
+
+# Where reads of the current request or task go: None (Django's default), ANALYTICS or PRIMARY
+_reads = ContextVar('sales_reads', default=None)
+
+# Replica alias -> (available, monotonic time until which that health check result is trusted)
+_health = {}
+
+
+def pooled(database, conn_max_age=DEFAULT_CONN_MAX_AGE):
+    """
+    Returns a copy of a DATABASES entry that keeps its connections open between requests.
+
+    Args:
+        database (dict): The DATABASES entry.
+        conn_max_age (int, optional): Seconds to reuse a connection. Defaults to DEFAULT_CONN_MAX_AGE.
+
+    Returns:
+        dict: The entry with CONN_MAX_AGE and CONN_HEALTH_CHECKS set, unless already given.
+    """
+    return {'CONN_MAX_AGE': conn_max_age, 'CONN_HEALTH_CHECKS': True, **database}
+
+
+def replica(database, primary='default'):
+    """
+    Returns a copy of a DATABASES entry marked as a replica of the primary.
+
+    The test runner then points the replica at the primary's test database instead of
+    creating a second, empty one.
+
+    Args:
+        database (dict): The DATABASES entry.
+        primary (str, optional): The primary's alias. Defaults to 'default'.
+
+    Returns:
+        dict: The entry with TEST MIRROR set.
+    """
+    return {**database, 'TEST': {**database.get('TEST', {}), 'MIRROR': primary}}
+
+
+def primary_database():
+    """
+    Returns the alias of the primary database.
+    """
+    return getattr(settings, 'SALES_PRIMARY_DATABASE', 'default')
+
+
+def replica_available(alias):
+    """
+    Checks that a replica alias is configured and reachable.
+
+    The result is remembered, so queries do not each check the connection: a reachable
+    replica is trusted for SALES_REPLICA_CHECK_SECONDS, and one that fails to connect is
+    skipped for SALES_REPLICA_RETRY_SECONDS, during which reads fall back to the primary.
+
+    Args:
+        alias (str): The replica's alias.
+
+    Returns:
+        bool: True when reads can be sent to the replica.
+    """
+    if alias not in settings.DATABASES:
+        return False
+    now = time.monotonic()
+    available, until = _health.get(alias, (False, 0))
+    if until > now:
+        return available
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _health[alias] = (False, now + getattr(settings, 'SALES_REPLICA_RETRY_SECONDS', 30))
+        return False
+    _health[alias] = (True, now + getattr(settings, 'SALES_REPLICA_CHECK_SECONDS', 5))
+    return True
+
+
+def read_database():
+    """
+    Returns the alias analytics reads should use right now.
+
+    Returns:
+        str: SALES_READ_DATABASE when it is reachable, otherwise the primary.
+    """
+    alias = getattr(settings, 'SALES_READ_DATABASE', None)
+    if alias and alias != primary_database() and replica_available(alias):
+        return alias
+    return primary_database()
+
+
+@contextmanager
+def analytics_reads():
+    """
+    Sends the reads made inside the block to the analytics database.
+
+    Has no effect inside a primary_reads block.
+    """
+    if _reads.get() == PRIMARY:
+        yield
+        return
+    token = _reads.set(ANALYTICS)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Keeps the reads made inside the block on the primary, so they see earlier writes.
+    """
+    token = _reads.set(PRIMARY)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def iter_with_reads(iterable):
+    """
+    Yields from an iterable, running each step with the reads routing active at the call.
+
+    Used for streamed responses, which are consumed after the view has returned.
+
+    Args:
+        iterable (iterable): E.g. the rows of a report.
+
+    Yields:
+        The items of iterable.
+    """
+    reads = _reads.get()
+    iterator = iter(iterable)
+    while True:
+        token = _reads.set(reads)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _reads.reset(token)
+        yield item
+
+
+def _pin_key(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return f'sales:primary-pin:{user.pk}'
+
+
+def pin_to_primary(request):
+    """
+    Keeps the requesting user's analytics reads on the primary for SALES_READ_YOUR_WRITES_SECONDS.
+
+    Args:
+        request (Request): The request that wrote data.
+    """
+    key = _pin_key(request)
+    seconds = getattr(settings, 'SALES_READ_YOUR_WRITES_SECONDS', 10)
+    if key and seconds and getattr(settings, 'SALES_READ_DATABASE', None):
+        get_cache().set(key, True, timeout=seconds)
+
+
+def is_pinned_to_primary(request):
+    """
+    Returns whether the requesting user wrote data recently enough to read from the primary.
+
+    Args:
+        request (Request): The request.
+
+    Returns:
+        bool: True while the pin set by pin_to_primary lasts.
+    """
+    key = _pin_key(request)
+    if not key or not getattr(settings, 'SALES_READ_DATABASE', None):
+        return False
+    return bool(get_cache().get(key))
+
+
+class AnalyticsReadMixin:
+    """
+    Mixin for DRF views whose queries are read-only analytics, sent to the analytics database.
+
+    Routing starts once the request is authenticated and permitted, so those checks keep
+    reading from the primary. Users who have just written data read from the primary until
+    their pin expires.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        token = _reads.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _reads.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        _reads.set(PRIMARY if is_pinned_to_primary(request) else ANALYTICS)
+
+
+class AnalyticsRouter:
+    """
+    Database router that sends reads made inside analytics_reads to the analytics database.
+
+    Writes, and every read outside analytics_reads, keep Django's default routing. Reads made
+    while the primary is inside a transaction stay on it, so they see that transaction's writes.
+    """
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None:
+            return None
+        primary = primary_database()
+        if reads == PRIMARY or connections[primary].in_atomic_block:
+            return primary
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {primary_database(), getattr(settings, 'SALES_READ_DATABASE', None)}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -2,7 +2,8 @@
 
 from rest_framework import serializers
 from core.models import Order, Report, ReportMetric, Metric, DataSource, Dashboard, DashboardLayout
-from .models import Sale
+from .models import Sale, ReportJob
+from .reports import REPORT_SECTIONS
 
 class SaleSerializer(serializers.ModelSerializer):
     """
@@ -26,6 +27,7 @@ class SalesTrendSerializer(serializers.Serializer):
         ema_revenue (list): List of exponential moving average revenue values (optional).
         sma_quantity (list): List of simple moving average quantity values (optional).
         ema_quantity (list): List of exponential moving average quantity values (optional).
+        indicators (dict): Requested indicator series keyed by name, e.g. 'wma_revenue_4' (optional).
     """
     months = serializers.ListField(child=serializers.CharField())
     total_revenue = serializers.ListField(child=serializers.DecimalField(max_digits=10, decimal_places=2))
@@ -34,6 +36,7 @@ class SalesTrendSerializer(serializers.Serializer):
     ema_revenue = serializers.ListField(child=serializers.DecimalField(max_digits=10, decimal_places=2), required=False)
     sma_quantity = serializers.ListField(child=serializers.IntegerField(), required=False)
     ema_quantity = serializers.ListField(child=serializers.IntegerField(), required=False)
+    indicators = serializers.DictField(child=serializers.ListField(child=serializers.FloatField()), required=False)
 
 class SalesDataSerializer(serializers.Serializer):
     """
@@ -96,8 +99,42 @@ class ReportSerializer(serializers.ModelSerializer):
     """
     Serializer for the Report model.
 
-    Serializes all fields of the Report model.
+    Serializes all fields of the Report model, or only those named in the optional
+    'fields' keyword argument.
     """
     class Meta:
         model = Report
         fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class ReportJobRequestSerializer(serializers.ModelSerializer):
+    """
+    Serializer validating the parameters of a background report job.
+
+    Attributes:
+        report_type (str): One of the report types in REPORT_SECTIONS.
+        from_date (date): First day of the report (optional).
+        to_date (date): Last day of the report (optional).
+    """
+    report_type = serializers.ChoiceField(choices=list(REPORT_SECTIONS))
+
+    class Meta:
+        model = ReportJob
+        fields = ['report_type', 'from_date', 'to_date']
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the ReportJob model.
+
+    Serializes the job's status, progress and generated file.
+    """
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'report', 'report_type', 'from_date', 'to_date', 'status', 'progress', 'file', 'error', 'created_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,238 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.db import transaction
+from core.models import Order, OrderInvoiceItems, Product, Report
+from .cache import bump_report_version
+from .customers import refresh_customers
+from .rollup import local_day, refresh_rollup_cells, rebuild_rollup
+
+# The shipping address model orders point to; its country is part of every rollup cell
+Shipping = Order._meta.get_field('shippingID').related_model
+
+
+def _item_cell(item):
+    """
+    Returns the (day, product, country) rollup cell an invoice item contributes to.
+
+    Args:
+        item (OrderInvoiceItems): The invoice item.
+
+    Returns:
+        tuple: (day, product_id, country), or None if the item has no order datetime.
+    """
+    order = Order.objects.filter(pk=item.orderID_id).values_list('order_datetime', 'shippingID__country').first()
+    if order is None or order[0] is None:
+        return None
+    return local_day(order[0]), item.productID_id, order[1]
+
+
+@receiver(pre_save, sender=OrderInvoiceItems)
+def stash_previous_item_cell(sender, instance, **kwargs):
+    """
+    Remembers the rollup cell of an invoice item before it is updated.
+    """
+    instance._previous_rollup_cell = None
+    if instance.pk:
+        previous = OrderInvoiceItems.objects.filter(pk=instance.pk).first()
+        if previous is not None:
+            instance._previous_rollup_cell = _item_cell(previous)
+
+
+@receiver(post_save, sender=OrderInvoiceItems)
+def update_rollup_for_item(sender, instance, raw=False, **kwargs):
+    """
+    Refreshes the rollup cells touched by a saved invoice item.
+    """
+    if raw:
+        return
+    cells = [_item_cell(instance), getattr(instance, '_previous_rollup_cell', None)]
+    refresh_rollup_cells(cell for cell in cells if cell)
+
+
+@receiver(pre_delete, sender=OrderInvoiceItems)
+def stash_deleted_item_cell(sender, instance, **kwargs):
+    """
+    Remembers the rollup cell of an invoice item before it is deleted.
+    """
+    instance._previous_rollup_cell = _item_cell(instance)
+
+
+@receiver(post_delete, sender=OrderInvoiceItems)
+def update_rollup_for_deleted_item(sender, instance, **kwargs):
+    """
+    Refreshes the rollup cell of a deleted invoice item.
+    """
+    cell = getattr(instance, '_previous_rollup_cell', None)
+    if cell:
+        refresh_rollup_cells([cell])
+
+
+def _order_key(order_id):
+    """
+    Returns the rollup-relevant fields of an order as stored in the database.
+
+    Args:
+        order_id (int): The primary key of the order.
+
+    Returns:
+        tuple: (order_datetime, country), or None if the order does not exist.
+    """
+    return Order.objects.filter(pk=order_id).values_list('order_datetime', 'shippingID__country').first()
+
+
+@receiver(pre_save, sender=Order)
+def stash_previous_order_key(sender, instance, **kwargs):
+    """
+    Remembers the order datetime and shipping country before an order is updated.
+    """
+    instance._previous_rollup_key = _order_key(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=Order)
+def update_rollup_for_order(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Moves an order's line items between rollup cells when its datetime or shipping country changes.
+    """
+    previous = getattr(instance, '_previous_rollup_key', None)
+    if raw or created or previous is None:
+        return
+    current = _order_key(instance.pk)
+    if current is None or current == previous:
+        return
+    product_ids = list(OrderInvoiceItems.objects.filter(orderID=instance).values_list('productID', flat=True).distinct())
+    keys = {(local_day(previous[0]), previous[1]), (local_day(current[0]), current[1])}
+    refresh_rollup_cells((day, product_id, country) for day, country in keys for product_id in product_ids)
+
+
+@receiver(pre_save, sender=Shipping)
+def stash_previous_shipping_country(sender, instance, **kwargs):
+    """
+    Remembers the country of a shipping address before it is updated.
+    """
+    instance._previous_country = None
+    if instance.pk:
+        instance._previous_country = Shipping.objects.filter(pk=instance.pk).values_list('country', flat=True).first()
+
+
+@receiver(post_save, sender=Shipping)
+def update_rollup_for_shipping(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Moves the line items of every order shipped to an address to its new country's rollup cells.
+    """
+    if raw or created or instance.pk is None:
+        return
+    previous = getattr(instance, '_previous_country', None)
+    current = Shipping.objects.filter(pk=instance.pk).values_list('country', flat=True).first()
+    if previous == current:
+        return
+    items = OrderInvoiceItems.objects.filter(
+        orderID__shippingID=instance, orderID__order_datetime__isnull=False
+    ).values_list('orderID__order_datetime', 'productID').distinct()
+    refresh_rollup_cells(
+        (local_day(moment), product_id, country)
+        for moment, product_id in items for country in (previous, current)
+    )
+
+
+@receiver(pre_save, sender=Product)
+def stash_previous_product_prices(sender, instance, **kwargs):
+    """
+    Remembers a product's price and cost price before it is updated.
+    """
+    instance._previous_prices = None
+    if instance.pk:
+        instance._previous_prices = Product.objects.filter(pk=instance.pk).values_list('price', 'costPrice').first()
+
+
+@receiver(post_save, sender=Product)
+def update_rollup_for_product(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Rebuilds a product's rollup rows and its buyers' lifetime values when its price or cost price changes.
+    """
+    previous = getattr(instance, '_previous_prices', None)
+    if raw or created or previous is None or previous == (instance.price, instance.costPrice):
+        return
+    rebuild_rollup(product_id=instance.pk)
+    # Lifetime values are priced like the rollup, so the product's buyers need refreshing too
+    refresh_customers(OrderInvoiceItems.objects.filter(productID=instance).values_list('orderID__custEmail', flat=True).distinct())
+
+
+@receiver(post_save, sender=Report)
+@receiver(post_delete, sender=Report)
+def bump_report_version_for_report(sender, instance, **kwargs):
+    """
+    Moves the report watermark when a report is created, changed or deleted.
+    """
+    transaction.on_commit(bump_report_version)
+
+
+def _order_email(order_id):
+    """
+    Returns the customer email of an order as stored in the database, or None.
+    """
+    return Order.objects.filter(pk=order_id).values_list('custEmail', flat=True).first()
+
+
+@receiver(pre_save, sender=Order)
+def stash_previous_order_customer(sender, instance, **kwargs):
+    """
+    Remembers the customer and datetime of an order before it is updated.
+    """
+    instance._previous_customer_key = None
+    if instance.pk:
+        instance._previous_customer_key = Order.objects.filter(pk=instance.pk).values_list('custEmail', 'order_datetime').first()
+
+
+@receiver(post_save, sender=Order)
+def update_customer_activity_for_order(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Refreshes the customer activity of a new order, or of both customers when an order changes hands or dates.
+    """
+    previous = getattr(instance, '_previous_customer_key', None)
+    if raw or (not created and previous == (instance.custEmail, instance.order_datetime)):
+        return
+    refresh_customers([instance.custEmail, previous[0] if previous else None])
+
+
+@receiver(post_delete, sender=Order)
+def update_customer_activity_for_deleted_order(sender, instance, **kwargs):
+    """
+    Refreshes the customer activity of a deleted order.
+    """
+    refresh_customers([instance.custEmail])
+
+
+@receiver(pre_save, sender=OrderInvoiceItems)
+def stash_previous_item_customer(sender, instance, **kwargs):
+    """
+    Remembers the customer of an invoice item before it is updated, in case it moves to another order.
+    """
+    instance._previous_customer = None
+    if instance.pk:
+        instance._previous_customer = OrderInvoiceItems.objects.filter(pk=instance.pk).values_list('orderID__custEmail', flat=True).first()
+
+
+@receiver(post_save, sender=OrderInvoiceItems)
+def update_customer_value_for_item(sender, instance, raw=False, **kwargs):
+    """
+    Refreshes the lifetime value of the customer whose order an invoice item belongs to, and of
+    the previous order's customer when the item moved.
+    """
+    if not raw:
+        refresh_customers([_order_email(instance.orderID_id), getattr(instance, '_previous_customer', None)])
+
+
+@receiver(pre_delete, sender=OrderInvoiceItems)
+def stash_deleted_item_customer(sender, instance, **kwargs):
+    """
+    Remembers the customer of an invoice item before it is deleted.
+    """
+    instance._previous_customer = _order_email(instance.orderID_id)
+
+
+@receiver(post_delete, sender=OrderInvoiceItems)
+def update_customer_value_for_deleted_item(sender, instance, **kwargs):
+    """
+    Refreshes the lifetime value of the customer of a deleted invoice item.
+    """
+    refresh_customers([getattr(instance, '_previous_customer', None)])
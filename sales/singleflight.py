@@ -0,0 +1,289 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+# Settings:
+# - SALES_SINGLE_FLIGHT_ENABLED : Coalesces concurrent identical computations. Defaults to True.
+# - SALES_SINGLE_FLIGHT_TIMEOUT : Seconds a caller waits for another caller's computation
+#   before giving up with SingleFlightTimeout. Defaults to 30.
+# - SALES_SINGLE_FLIGHT_LOCK_TIMEOUT : Seconds the cross-process lock is held at most, so a
+#   crashed process cannot block a key for longer. Defaults to 120.
+# - SALES_SINGLE_FLIGHT_RESULT_TIMEOUT : Seconds a finished computation's result stays in the
+#   cache for callers in other processes to pick up. Defaults to 30.
+#
+# Callers in one process share a computation through an in-memory table. Across processes the
+# leader holds a lock in the SALES_CACHE_ALIAS cache; callers of other processes register as
+# waiters before polling, and the leader only publishes its outcome when someone is waiting,
+# so uncontended computations never write their result to the cache. The lock is taken with
+# cache.add, which is atomic in Redis, Memcached and the database cache. The file-based cache
+# implements add as a read followed by a write, so with it the lock is a file next to the
+# cache entries, created with O_CREAT | O_EXCL instead. Two processes removing the same
+# expired lock at once may both lead, which costs a duplicate computation, not a wrong
+# result. With a local-memory cache every process runs its own computation.
+
+# How often, in seconds, callers in other processes check for the leader's outcome
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class SingleFlightTimeout(TimeoutError):
+    """
+    Raised when a caller gives up waiting for a computation run by another caller.
+    """
+
+
+class SingleFlightError(Exception):
+    """
+    Raised in callers of another process when the computation they waited on failed.
+    """
+
+
+class _Flight:
+    """
+    One in-process computation and its outcome, shared by the callers waiting on it.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def flight_key(name, params):
+    """
+    Builds the key of a computation from its name and normalized parameters.
+
+    Args:
+        name (str): The name of the computation, e.g. 'sales_trend_data'.
+        params: JSON-serializable parameters. Dates and other values are compared as strings.
+
+    Returns:
+        str: The key, short and free of spaces so any cache backend accepts it.
+    """
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{name}:{digest}'
+
+
+def _lock_key(key):
+    return f'sales:flight-lock:{key}'
+
+
+def _result_key(key, token):
+    return f'sales:flight-result:{key}:{token}'
+
+
+def _waiters_key(key, token):
+    return f'sales:flight-waiters:{key}:{token}'
+
+
+def _lock_path(cache, lock_key):
+    return os.path.join(cache._dir, hashlib.sha1(lock_key.encode()).hexdigest() + '.lock')
+
+
+def _acquire(cache, lock_key, token, lock_timeout):
+    """
+    Takes the cross-process lock for token, returning False when another leader holds it.
+    """
+    if not isinstance(cache, FileBasedCache):
+        return cache.add(lock_key, token, timeout=lock_timeout)
+    path = _lock_path(cache, lock_key)
+    os.makedirs(cache._dir, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    except FileExistsError:
+        if _lock_holder(cache, lock_key, lock_timeout) is not None:
+            return False
+        # The lock expired, e.g. after a crash: remove it and try once more
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return True
+
+
+def _lock_holder(cache, lock_key, lock_timeout):
+    """
+    Returns the token of the leader holding the cross-process lock, or None.
+    """
+    if not isinstance(cache, FileBasedCache):
+        return cache.get(lock_key)
+    path = _lock_path(cache, lock_key)
+    try:
+        if os.path.getmtime(path) + lock_timeout < time.time():
+            return None
+        with open(path) as f:
+            # Empty while the leader is still writing its token
+            return f.read() or ''
+    except FileNotFoundError:
+        return None
+
+
+def _release(cache, lock_key, token, lock_timeout):
+    """
+    Releases the cross-process lock if token still holds it.
+    """
+    if _lock_holder(cache, lock_key, lock_timeout) != token:
+        return
+    if not isinstance(cache, FileBasedCache):
+        cache.delete(lock_key)
+        return
+    try:
+        os.remove(_lock_path(cache, lock_key))
+    except FileNotFoundError:
+        pass
+
+
+def _outcome(cache, key, token):
+    """
+    Returns the (succeeded, value) outcome the leader holding token published, or None.
+    """
+    return cache.get(_result_key(key, token))
+
+
+def _lead_shared(key, compute, timeout):
+    """
+    Runs compute once across processes, or waits for the process already running it.
+    """
+    # The cache sales.cache stores results in; not imported from there, which imports this module
+    cache = caches[getattr(settings, 'SALES_CACHE_ALIAS', 'default')]
+    lock_key = _lock_key(key)
+    lock_timeout = getattr(settings, 'SALES_SINGLE_FLIGHT_LOCK_TIMEOUT', 120)
+    deadline = time.monotonic() + timeout
+    interval = POLL_INTERVAL
+    while True:
+        token = uuid.uuid4().hex
+        if _acquire(cache, lock_key, token, lock_timeout):
+            return _run_leader(cache, key, lock_key, token, compute, lock_timeout)
+
+        leader = _lock_holder(cache, lock_key, lock_timeout)
+        if leader:
+            cache.set(_waiters_key(key, leader), True, timeout=lock_timeout)
+        while leader is not None:
+            outcome = _outcome(cache, key, leader) if leader else None
+            if outcome is None and _lock_holder(cache, lock_key, lock_timeout) != leader:
+                # The leader may have published and released the lock since the first read;
+                # otherwise its lock expired or was released without an outcome, e.g. after a crash
+                outcome = _outcome(cache, key, leader)
+                if outcome is None:
+                    break
+            if outcome is not None:
+                succeeded, value = outcome
+                if succeeded:
+                    return value
+                raise SingleFlightError(value)
+            if time.monotonic() >= deadline:
+                raise SingleFlightTimeout(f'Timed out after {timeout}s waiting for {key}.')
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+
+def _run_leader(cache, key, lock_key, token, compute, lock_timeout):
+    """
+    Runs compute while holding the cross-process lock, and publishes the outcome for the
+    callers of other processes waiting on it, if any.
+    """
+    def publish(outcome):
+        if cache.get(_waiters_key(key, token)) is not None:
+            cache.set(_result_key(key, token), outcome, timeout=getattr(settings, 'SALES_SINGLE_FLIGHT_RESULT_TIMEOUT', 30))
+
+    try:
+        try:
+            result = compute()
+        except Exception as e:
+            publish((False, f'{type(e).__name__}: {e}'))
+            raise
+        publish((True, result))
+        return result
+    finally:
+        _release(cache, lock_key, token, lock_timeout)
+
+
+def single_flight(key, compute, timeout=None):
+    """
+    Runs compute once for all concurrent callers with the same key and shares the outcome.
+
+    The first caller runs compute; callers arriving while it runs wait for it and receive the
+    same result, or have the same exception raised. Results are shared, not copied, so callers
+    must treat them as read-only. A finished computation is never reused by later callers;
+    caching is left to sales.cache.
+
+    Args:
+        key (str): The key of the computation, e.g. from flight_key.
+        compute (callable): Function computing the result.
+        timeout (float, optional): Seconds to wait for another caller's computation.
+            Defaults to settings.SALES_SINGLE_FLIGHT_TIMEOUT or 30.
+
+    Returns:
+        The result of compute.
+
+    Raises:
+        SingleFlightTimeout: If the computation being waited on did not finish in time.
+        SingleFlightError: If the computation failed in another process.
+    """
+    if not getattr(settings, 'SALES_SINGLE_FLIGHT_ENABLED', True):
+        return compute()
+    timeout = timeout or getattr(settings, 'SALES_SINGLE_FLIGHT_TIMEOUT', 30)
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if not flight.done.wait(timeout):
+            raise SingleFlightTimeout(f'Timed out after {timeout}s waiting for {key}.')
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _lead_shared(key, compute, timeout)
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result
+
+
+def coalesced(func):
+    """
+    Decorator that coalesces concurrent calls of a function with the same arguments.
+
+    Arguments are bound to the function's signature, with defaults applied, so calls that
+    only differ in how they pass the same values share one computation.
+
+    Args:
+        func (callable): The function, e.g. get_sales_trend_data.
+
+    Returns:
+        callable: The wrapped function.
+    """
+    signature = inspect.signature(func)
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return single_flight(flight_key(name, bound.arguments), lambda: func(*args, **kwargs))
+    return wrapper
@@ -1,3 +1,1130 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import CommandError, call_command
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.models import Inventory, Order, OrderInvoiceItems, Product, Report
+from . import calculations, jobs, routing, singleflight, views
+from .benchmarks import build
+from .cache import cached_result, data_watermark
+from .aggregation import aggregate_sales
+from .columnar import PACKED_MAGIC, encode_json, encode_packed, to_columns
+from .calculations import GRANULARITIES, get_grouped_sales_trend_data, get_sales_data, get_sales_data_pandas, get_sales_trend_data
+from .customers import customer_metrics, rebuild_customer_activity
+from .dateranges import day_start, range_filters
+from .export import export_report, section_slug
+from .indicators import Indicator, compute_indicators
+from .ingest import ingest_sales, iter_records, validate_record
+from .jobs import INTERRUPTED_ERROR, recover_stale_jobs, run_report_job
+from .management.commands.check_import_time import parse_importtime
+from .models import CustomerActivity, CustomerMonth, DailySalesRollup, ReportJob, Sale, TrendPeriod
+from .restock import BELOW_THRESHOLD, RUNNING_OUT, restock_candidates
+from .rollup import rebuild_rollup
+from .reports import (
+    PRODUCT_ANALYSIS_SECTIONS, SALES_SUMMARY_SECTIONS, ReportData, category_rows, iter_report_rows, iter_report_rows_concurrently,
+    product_rows, region_rows, report_filters, sales_overview_rows
+)
+from .views import GenerateSalesPerformanceReport, ListReportsView, SalesMetricsView, SalesOverview, SalesTrendData
 
-# Create your tests here.
+
+def make_order(email, day, country='Canada', index=0):
+    """
+    Saves an order placed by email at noon on day, shipped to country.
+    """
+    rng = random.Random(index)
+    Shipping = Order._meta.get_field('shippingID').related_model
+    shipping = build(Shipping, index, rng, country=country)
+    shipping.save()
+    order = build(Order, index, rng, custEmail=email, order_datetime=day_start(day).replace(hour=12), shippingID=shipping)
+    order.save()
+    return order
+
+
+def make_product(index=0, price='10.00'):
+    """
+    Saves a product with the given price.
+    """
+    product = build(Product, index, random.Random(index), prodName=f'Product {index}', price=Decimal(price), costPrice=Decimal(price) / 2)
+    product.save()
+    return product
+
+
+def make_item(order, product, quantity, index=0):
+    """
+    Saves an invoice item of order for quantity units of product.
+    """
+    item = build(OrderInvoiceItems, index, random.Random(index), orderID=order, productID=product, quantity=quantity)
+    item.save()
+    return item
+
+
+class CustomerMetricsTests(TestCase):
+    def setUp(self):
+        make_order('twice@example.com', date(2024, 1, 5), index=1)
+        make_order('twice@example.com', date(2024, 1, 20), index=2)
+        make_order('twice@example.com', date(2024, 6, 1), index=3)
+        make_order('once@example.com', date(2024, 1, 10), index=4)
+        make_order('returning@example.com', date(2023, 12, 1), index=5)
+        make_order('returning@example.com', date(2024, 1, 15), index=6)
+        rebuild_customer_activity()
+
+    def test_historical_range_ignores_later_orders(self):
+        metrics = customer_metrics(day_start(date(2024, 1, 1)), day_start(date(2024, 2, 1)))
+        self.assertEqual(metrics, {'new': 2, 'active': 3, 'repeat': 2})
+
+    def test_earlier_order_makes_a_repeat_customer(self):
+        metrics = customer_metrics(day_start(date(2024, 6, 1)), day_start(date(2024, 7, 1)))
+        self.assertEqual(metrics, {'new': 0, 'active': 1, 'repeat': 1})
+        metrics = customer_metrics(day_start(date(2023, 12, 1)), day_start(date(2024, 1, 1)))
+        self.assertEqual(metrics, {'new': 1, 'active': 1, 'repeat': 0})
+
+    def test_unbounded_range_counts_customers_with_several_orders(self):
+        self.assertEqual(customer_metrics(), {'new': 3, 'active': 3, 'repeat': 2})
+
+
+class CustomerActivityTests(TestCase):
+    def activity(self):
+        return (
+            sorted(CustomerActivity.objects.values_list('email', 'first_order', 'last_order', 'cohort', 'order_count', 'lifetime_value')),
+            sorted(CustomerMonth.objects.values_list('customer__email', 'month', 'order_count')),
+        )
+
+    def assertMatchesRebuild(self):
+        maintained = self.activity()
+        rebuild_customer_activity()
+        self.assertEqual(maintained, self.activity())
+
+    def test_item_moved_to_another_customer_updates_both(self):
+        product = make_product()
+        alice = make_order('alice@example.com', date(2024, 1, 5), index=1)
+        bob = make_order('bob@example.com', date(2024, 2, 5), index=2)
+        item = make_item(alice, product, 3, index=1)
+        make_item(bob, product, 1, index=2)
+        self.assertMatchesRebuild()
+
+        item.orderID = bob
+        item.save()
+        self.assertEqual(CustomerActivity.objects.get(email='alice@example.com').lifetime_value, 0)
+        self.assertEqual(CustomerActivity.objects.get(email='bob@example.com').lifetime_value, Decimal('40.00'))
+        self.assertMatchesRebuild()
+
+    def test_repeated_refreshes_keep_one_month_row(self):
+        for index in range(3):
+            make_order('alice@example.com', date(2024, 1, 5 + index), index=index)
+        self.assertEqual(CustomerMonth.objects.filter(customer__email='alice@example.com').get().order_count, 3)
+        self.assertMatchesRebuild()
+
+
+class SalesTrendTests(TestCase):
+    def setUp(self):
+        product = make_product()
+        for index, quantity in enumerate([3, 1, 4, 1, 5, 9, 2, 6]):
+            order = make_order(f'customer{index}@example.com', date(2023, index + 1, 10), index=index)
+            make_item(order, product, quantity, index=index)
+
+    def test_resumed_series_matches_full_computation(self):
+        extra = [Indicator('wma', 4, 'quantity'), Indicator('ema', 5, 'revenue')]
+        first = get_sales_trend_data('2023-01-01', '2023-12-31', 'EMA')
+        self.assertTrue(TrendPeriod.objects.filter(series_start=date(2023, 1, 1)).exists())
+        second = get_sales_trend_data('2023-01-01', '2023-12-31', 'EMA', extra)
+        third = get_sales_trend_data('2023-01-01', '2023-12-31', 'EMA', extra)
+
+        series = {
+            'revenue': [float(value) for value in first['total_revenue']],
+            'quantity': [float(value) for value in first['total_quantity']],
+        }
+        expected = compute_indicators(series, extra + [Indicator('ema', 3, 'revenue')])
+        for result in (second, third):
+            self.assertEqual(result['months'], first['months'])
+            for name in ('wma_quantity_4', 'ema_revenue_5'):
+                for got, want in zip(result['indicators'][name], expected[name]):
+                    self.assertAlmostEqual(got, want)
+            for got, want in zip(result['ema_revenue'], expected['ema_revenue_3']):
+                self.assertAlmostEqual(got, want)
+
+
+@override_settings(SALES_CACHE_ENABLED=True)
+class DataWatermarkTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = make_item(make_order('customer@example.com', date(2024, 1, 10)), self.product, 2)
+
+    def assertChangeMovesWatermark(self, change):
+        before = data_watermark()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(data_watermark(), before)
+
+    def test_item_update_moves_watermark(self):
+        def change():
+            self.item.quantity = 5
+            self.item.save()
+        self.assertChangeMovesWatermark(change)
+
+    def test_item_delete_moves_watermark(self):
+        self.assertChangeMovesWatermark(self.item.delete)
+
+    def test_price_change_moves_watermark(self):
+        def change():
+            self.product.price = Decimal('12.50')
+            self.product.save()
+        self.assertChangeMovesWatermark(change)
+
+    def test_closed_result_is_recomputed_after_a_change(self):
+        calls = []
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cached_result('watermark-test', {}, compute, closed=True), 1)
+        self.assertEqual(cached_result('watermark-test', {}, compute, closed=True), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.quantity = 7
+            self.item.save()
+        self.assertEqual(cached_result('watermark-test', {}, compute, closed=True), 2)
+
+
+@override_settings(SALES_READ_DATABASE='flaky', SALES_REPLICA_RETRY_SECONDS=30, SALES_REPLICA_CHECK_SECONDS=5)
+class ReplicaFallbackTests(SimpleTestCase):
+    def setUp(self):
+        routing._health.clear()
+        self.addCleanup(routing._health.clear)
+        patcher = mock.patch.dict(settings.DATABASES, {'flaky': {}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(routing, 'connections')
+        self.connections = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connections.__getitem__.return_value.in_atomic_block = False
+        self.ensure_connection = self.connections.__getitem__.return_value.ensure_connection
+        patcher = mock.patch.object(routing.time, 'monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missing_alias_falls_back_to_primary(self):
+        with override_settings(SALES_READ_DATABASE='missing'):
+            self.assertEqual(routing.read_database(), 'default')
+
+    def test_unreachable_replica_is_retried_after_the_retry_window(self):
+        self.ensure_connection.side_effect = DatabaseError('down')
+        self.assertEqual(routing.read_database(), 'default')
+        self.clock.return_value = 1029.0
+        self.assertEqual(routing.read_database(), 'default')
+        self.assertEqual(self.ensure_connection.call_count, 1)
+
+        self.ensure_connection.side_effect = None
+        self.clock.return_value = 1031.0
+        self.assertEqual(routing.read_database(), 'flaky')
+        self.assertEqual(self.ensure_connection.call_count, 2)
+
+    def test_healthy_check_is_cached(self):
+        self.assertEqual(routing.read_database(), 'flaky')
+        self.clock.return_value = 1004.0
+        self.assertEqual(routing.read_database(), 'flaky')
+        self.assertEqual(self.ensure_connection.call_count, 1)
+        self.clock.return_value = 1006.0
+        self.assertEqual(routing.read_database(), 'flaky')
+        self.assertEqual(self.ensure_connection.call_count, 2)
+
+    def test_router_sends_only_analytics_reads_to_the_replica(self):
+        router = routing.AnalyticsRouter()
+        self.assertIsNone(router.db_for_read(TrendPeriod))
+        with routing.analytics_reads():
+            self.assertEqual(router.db_for_read(TrendPeriod), 'flaky')
+            with routing.primary_reads():
+                self.assertEqual(router.db_for_read(TrendPeriod), 'default')
+
+
+class IngestTests(TestCase):
+    def record(self, **values):
+        return {'product_name': 'Widget', 'quantity': '2', 'sale_date': '2024-01-10', 'revenue': '19.98', **values}
+
+    def test_valid_record_becomes_a_sale(self):
+        sale, errors = validate_record(self.record(quantity=3.0, revenue=12.5))
+        self.assertIsNone(errors)
+        self.assertEqual((sale.quantity, sale.revenue), (3, Decimal('12.50')))
+
+    def test_fractional_quantity_is_rejected(self):
+        for quantity in ('2.7', 2.7, True, 'two'):
+            sale, errors = validate_record(self.record(quantity=quantity))
+            self.assertIsNone(sale)
+            self.assertIn('quantity', errors)
+
+    def test_extra_revenue_decimal_places_are_rejected(self):
+        for revenue in ('1.005', 1.005, False, '123456789.00', 'nan'):
+            sale, errors = validate_record(self.record(revenue=revenue))
+            self.assertIsNone(sale)
+            self.assertIn('revenue', errors)
+
+    def test_ingest_inserts_valid_rows_and_reports_the_rest(self):
+        stream = io.BytesIO(
+            b'{"product_name": "Widget", "quantity": 2, "sale_date": "2024-01-10", "revenue": "19.98"}\n'
+            b'{"product_name": "Widget", "quantity": 2.7, "sale_date": "2024-01-10", "revenue": "1.00"}\n'
+            b'not json\n'
+            b'{"product_name": "Gadget", "quantity": "4", "sale_date": "2024-01-11", "revenue": 8}\n'
+        )
+        result = ingest_sales(iter_records(stream, 'ndjson'), batch_size=2)
+        self.assertEqual((result.rows, result.inserted, result.rejected, result.batches), (4, 2, 2, 2))
+        self.assertEqual([error['line'] for error in result.errors], [2, 3])
+        self.assertEqual(
+            list(Sale.objects.order_by('sale_date').values_list('product_name', 'quantity', 'revenue')),
+            [('Widget', 2, Decimal('19.98')), ('Gadget', 4, Decimal('8.00'))]
+        )
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = routing.get_cache()
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def test_result_is_not_published_without_waiters(self):
+        with mock.patch.object(singleflight.uuid, 'uuid4', return_value=mock.Mock(hex='leader')):
+            self.assertEqual(singleflight.single_flight('quiet', lambda: 42), 42)
+        self.assertIsNone(self.cache.get(singleflight._result_key('quiet', 'leader')))
+
+    def test_result_is_published_for_waiters(self):
+        def compute():
+            # A caller of another process registers while the leader runs
+            self.cache.set(singleflight._waiters_key('busy', 'leader'), True)
+            return 42
+
+        with mock.patch.object(singleflight.uuid, 'uuid4', return_value=mock.Mock(hex='leader')):
+            self.assertEqual(singleflight.single_flight('busy', compute), 42)
+        self.assertEqual(self.cache.get(singleflight._result_key('busy', 'leader')), (True, 42))
+
+    def test_waiter_takes_result_published_as_the_lock_is_released(self):
+        self.cache.set(singleflight._lock_key('race'), 'leader')
+        real_get = self.cache.get
+
+        def get(key, *args, **kwargs):
+            if key == singleflight._lock_key('race') and real_get(singleflight._waiters_key('race', 'leader')):
+                # The leader finishes between the waiter's result and lock reads
+                self.cache.set(singleflight._result_key('race', 'leader'), (True, 'shared'))
+                self.cache.delete(key)
+            return real_get(key, *args, **kwargs)
+
+        compute = mock.Mock(return_value='recomputed')
+        with mock.patch.object(self.cache, 'get', side_effect=get):
+            with mock.patch.object(self.cache, 'add', return_value=False):
+                self.assertEqual(singleflight._lead_shared('race', compute, 1), 'shared')
+        compute.assert_not_called()
+
+    def test_file_based_cache_locks_with_exclusive_files(self):
+        with tempfile.TemporaryDirectory() as location:
+            cache = FileBasedCache(location, {})
+            self.assertTrue(singleflight._acquire(cache, 'lock', 'first', 60))
+            self.assertFalse(singleflight._acquire(cache, 'lock', 'second', 60))
+            self.assertEqual(singleflight._lock_holder(cache, 'lock', 60), 'first')
+
+            singleflight._release(cache, 'lock', 'second', 60)
+            self.assertEqual(singleflight._lock_holder(cache, 'lock', 60), 'first')
+            singleflight._release(cache, 'lock', 'first', 60)
+            self.assertIsNone(singleflight._lock_holder(cache, 'lock', 60))
+
+            # A lock older than the lock timeout, e.g. left by a crash, is taken over
+            self.assertTrue(singleflight._acquire(cache, 'lock', 'crashed', 60))
+            an_hour_ago = time.time() - 3600
+            os.utime(singleflight._lock_path(cache, 'lock'), (an_hour_ago, an_hour_ago))
+            self.assertIsNone(singleflight._lock_holder(cache, 'lock', 60))
+            self.assertTrue(singleflight._acquire(cache, 'lock', 'third', 60))
+            self.assertEqual(singleflight._lock_holder(cache, 'lock', 60), 'third')
+
+
+class ColumnarExportTests(TestCase):
+    def setUp(self):
+        cheap, dear = make_product(1, '4.50'), make_product(2, '12.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            for index, (day, country) in enumerate([(date(2024, 1, 5), 'Canada'), (date(2024, 1, 6), 'France'), (date(2024, 2, 1), 'Canada')]):
+                order = make_order(f'customer{index}@example.com', day, country, index=index)
+                make_item(order, cheap, index + 1, index=2 * index)
+                make_item(order, dear, 2, index=2 * index + 1)
+
+    def assertRoundTrips(self, sections):
+        import numpy as np
+
+        filters = report_filters('2024-01-01', '2024-12-31')
+        content, _content_type, extension = export_report(sections, filters, 'npz')
+        self.assertEqual(extension, 'npz')
+        arrays = np.load(io.BytesIO(content))
+        report = ReportData(filters)
+        for title, header, rows in sections:
+            csv_rows = list(rows(report))
+            for index, name in enumerate(header):
+                column = arrays[f'{section_slug(title)}/{name}']
+                self.assertEqual(len(column), len(csv_rows), name)
+                for row, value in zip(csv_rows, column.tolist()):
+                    expected = row[index]
+                    if column.dtype.kind == 'f':
+                        self.assertAlmostEqual(value, float(expected), places=6)
+                    elif column.dtype.kind == 'M':
+                        self.assertEqual(value.strftime('%m/%d/%y'), expected)
+                    elif column.dtype.kind in 'iu':
+                        self.assertEqual(value, expected)
+                    else:
+                        self.assertEqual(value, '' if expected is None else str(expected))
+
+    def test_sales_summary_round_trips(self):
+        self.assertRoundTrips(SALES_SUMMARY_SECTIONS)
+
+    def test_product_analysis_round_trips(self):
+        self.assertRoundTrips(PRODUCT_ANALYSIS_SECTIONS)
+
+
+@override_settings(SALES_METRICS_ENABLED=True, SALES_METRICS_TOKEN=None)
+class SalesMetricsViewTests(TestCase):
+    def get(self, user=None, **headers):
+        request = APIRequestFactory().get('/sales/metrics/', **headers)
+        if user is not None:
+            force_authenticate(request, user=user)
+        return SalesMetricsView.as_view()(request)
+
+    def test_metrics_are_private_without_a_token(self):
+        self.assertIn(self.get().status_code, (401, 403))
+        clerk = get_user_model().objects.create_user('clerk', password='secret')
+        self.assertEqual(self.get(clerk).status_code, 403)
+
+    def test_staff_can_read_metrics_without_a_token(self):
+        admin = get_user_model().objects.create_user('admin', password='secret', is_staff=True)
+        response = self.get(admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    @override_settings(SALES_METRICS_TOKEN='scrape')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+
+class GranularityTests(TestCase):
+    def setUp(self):
+        product = make_product()
+        for index, day in enumerate([date(2023, 11, 30), date(2024, 1, 7), date(2024, 1, 8), date(2024, 3, 31), date(2024, 4, 1)]):
+            make_item(make_order(f'customer{index}@example.com', day, index=index), product, index + 1, index=index)
+            Sale.objects.create(product_name='Widget', quantity=index + 1, sale_date=day, revenue=Decimal('2.50') * (index + 1))
+
+    def test_database_buckets_match_pandas_resampling(self):
+        for granularity in GRANULARITIES:
+            with self.subTest(granularity=granularity):
+                bucketed, resampled = get_sales_data(granularity=granularity), get_sales_data_pandas(granularity=granularity)
+                self.assertEqual(list(bucketed.index), list(resampled.index))
+                self.assertEqual(bucketed['total_quantity'].tolist(), resampled['total_quantity'].tolist())
+                self.assertEqual(bucketed['total_revenue'].astype(float).tolist(), resampled['total_revenue'].astype(float).tolist())
+
+    def test_sale_trend_labels_name_the_last_day_of_each_bucket(self):
+        for granularity in GRANULARITIES:
+            with self.subTest(granularity=granularity):
+                trend, reference = Sale.get_sales_trend_data(granularity), Sale.get_sales_trend_data_pandas(granularity)
+                self.assertEqual(trend['months'], reference['months'])
+                self.assertEqual([int(value) for value in trend['total_quantity']], reference['total_quantity'])
+        quarters = Sale.get_sales_trend_data('quarter')
+        self.assertEqual(quarters['months'], ['2023-12', '2024-03', '2024-06'])
+        self.assertEqual(quarters['total_quantity'], [1, 9, 5])
+
+
+class StaleReportJobTests(TestCase):
+    def setUp(self):
+        report = build(Report, 0, random.Random(0))
+        report.save()
+        self.jobs = {
+            name: ReportJob.objects.create(report=report, report_type='sales-summary', status=job_status)
+            for name, job_status in [('lost_queued', ReportJob.QUEUED), ('lost_running', ReportJob.RUNNING), ('queued', ReportJob.QUEUED), ('running', ReportJob.RUNNING), ('done', ReportJob.SUCCEEDED)]
+        }
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        ReportJob.objects.filter(pk__in=[self.jobs[name].pk for name in ('lost_queued', 'lost_running', 'done')]).update(updated_at=an_hour_ago)
+
+    def test_lost_jobs_are_resubmitted_or_failed(self):
+        executor = mock.Mock()
+        self.assertEqual(recover_stale_jobs(stale_seconds=900, executor=executor), (1, 1))
+        executor.submit.assert_called_once_with(run_report_job, self.jobs['lost_queued'].pk)
+
+        statuses = dict(ReportJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[self.jobs['lost_running'].pk], ReportJob.FAILED)
+        self.assertEqual(ReportJob.objects.get(pk=self.jobs['lost_running'].pk).error, INTERRUPTED_ERROR)
+        for name in ('lost_queued', 'queued'):
+            self.assertEqual(statuses[self.jobs[name].pk], ReportJob.QUEUED)
+        self.assertEqual(statuses[self.jobs['running'].pk], ReportJob.RUNNING)
+        self.assertEqual(statuses[self.jobs['done'].pk], ReportJob.SUCCEEDED)
+
+    def run_job(self, job, rows):
+        sections = {'sales-summary': [('Section', ['Value'], rows)]}
+        with mock.patch.dict(jobs.REPORT_SECTIONS, sections), mock.patch.object(jobs, 'connections'):
+            run_report_job(job.pk)
+        job.refresh_from_db()
+        if job.file:
+            self.addCleanup(job.file.delete, save=False)
+        return job
+
+    def test_job_runs_once_and_succeeds(self):
+        job = self.run_job(self.jobs['queued'], lambda report: [[1], [2]])
+        self.assertEqual((job.status, job.progress), (ReportJob.SUCCEEDED, 100))
+        self.assertEqual(job.file.read().decode(), 'Section\r\nValue\r\n1\r\n2\r\n')
+
+        calls = []
+        self.run_job(job, lambda report: calls.append(1) or [])
+        self.assertEqual(calls, [])
+
+    def test_job_failed_by_recovery_while_running_stays_failed(self):
+        job = self.jobs['queued']
+
+        def rows(report):
+            # recover_stale_jobs gives up on the job while its section runs
+            ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.FAILED, error=INTERRUPTED_ERROR)
+            return [[1]]
+
+        job = self.run_job(job, rows)
+        self.assertEqual((job.status, job.error, job.progress), (ReportJob.FAILED, INTERRUPTED_ERROR, 0))
+        self.assertFalse(job.file)
+
+    def test_resubmitted_jobs_are_not_resubmitted_by_the_next_sweep(self):
+        recover_stale_jobs(stale_seconds=900, executor=mock.Mock())
+        executor = mock.Mock()
+        self.assertEqual(recover_stale_jobs(stale_seconds=900, executor=executor), (0, 0))
+        executor.submit.assert_not_called()
+
+
+class DailySalesRollupTests(TestCase):
+    def setUp(self):
+        self.widget, self.gadget = make_product(1, '10.00'), make_product(2, '4.00')
+        self.canada = make_order('first@example.com', date(2024, 1, 10), 'Canada', index=1)
+        self.france = make_order('second@example.com', date(2024, 1, 11), 'France', index=2)
+        self.item = make_item(self.canada, self.widget, 2, index=1)
+        make_item(self.canada, self.gadget, 1, index=2)
+        self.assertMatchesRebuild()
+
+    def rollup_rows(self):
+        return sorted(
+            DailySalesRollup.objects.values_list('day', 'productID', 'country', 'line_count', 'quantity', 'gross_sales', 'margin'),
+            key=str
+        )
+
+    def assertMatchesRebuild(self):
+        maintained = self.rollup_rows()
+        rebuild_rollup()
+        self.assertEqual(maintained, self.rollup_rows())
+        self.assertTrue(maintained)
+
+    def test_item_quantity_and_product_changes(self):
+        self.item.quantity = 7
+        self.item.save()
+        self.assertMatchesRebuild()
+        self.item.productID = self.gadget
+        self.item.save()
+        self.assertMatchesRebuild()
+
+    def test_item_moves_between_orders_days_and_countries(self):
+        self.item.orderID = self.france
+        self.item.save()
+        self.assertMatchesRebuild()
+        self.france.order_datetime = day_start(date(2024, 2, 1)).replace(hour=12)
+        self.france.save()
+        self.assertMatchesRebuild()
+
+    def test_item_delete(self):
+        self.item.delete()
+        self.assertMatchesRebuild()
+
+    def test_product_price_change(self):
+        self.widget.price = Decimal('12.50')
+        self.widget.save()
+        self.assertMatchesRebuild()
+
+    def test_shipping_country_edit(self):
+        shipping = self.canada.shippingID
+        shipping.country = 'Mexico'
+        shipping.save()
+        self.assertEqual(set(DailySalesRollup.objects.values_list('country', flat=True)), {'Mexico'})
+        self.assertMatchesRebuild()
+
+    def test_one_row_per_day_and_product_without_a_country(self):
+        product = make_product(3)
+        DailySalesRollup.objects.create(day=date(2024, 1, 10), productID=product, country=None, line_count=1, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DailySalesRollup.objects.create(day=date(2024, 1, 10), productID=product, country=None, line_count=1, quantity=1)
+        DailySalesRollup.objects.create(day=date(2024, 1, 10), productID=product, country='Canada', line_count=1, quantity=1)
+
+
+@override_settings(SALES_CACHE_ENABLED=True)
+class TrendCoalescingTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_item(make_order('first@example.com', date(2023, 3, 10)), self.product, 2)
+
+    def test_request_after_a_write_does_not_join_an_earlier_computation(self):
+        started, release = threading.Event(), threading.Event()
+        parse_date = calculations.parse_date
+
+        def parse(value):
+            if threading.current_thread() is worker:
+                # The earlier computation stalls until after the write, then fails
+                started.set()
+                release.wait(5)
+                raise RuntimeError('computed before the write')
+            return parse_date(value)
+
+        def run_early():
+            try:
+                get_sales_trend_data('2023-01-01', '2023-12-31', 'SMA')
+            except RuntimeError:
+                pass
+
+        worker = threading.Thread(target=run_early)
+        timer = threading.Timer(0.5, release.set)
+        with mock.patch.object(calculations, 'parse_date', side_effect=parse):
+            worker.start()
+            self.assertTrue(started.wait(5))
+            with self.captureOnCommitCallbacks(execute=True):
+                make_item(make_order('second@example.com', date(2023, 3, 20), index=1), self.product, 5, index=1)
+            timer.start()
+            try:
+                result = cached_result(
+                    'sales_trend_data', {'start': '2023-01-01', 'end': '2023-12-31'},
+                    lambda: get_sales_trend_data('2023-01-01', '2023-12-31', 'SMA'),
+                    closed=True
+                )
+            finally:
+                release.set()
+                worker.join(5)
+                timer.cancel()
+        self.assertEqual(result['total_quantity'], [7])
+
+
+class TopProductsTests(TestCase):
+    def setUp(self):
+        order = make_order('customer@example.com', date(2024, 1, 10))
+        for index, (price, quantity) in enumerate([('30.00', 1), ('10.00', 2), ('5.00', 1)]):
+            make_item(order, make_product(index, price), quantity, index=index)
+
+    def get(self, view, path, **params):
+        request = APIRequestFactory().get(path, params)
+        response = view(request)
+        response.render()
+        return response
+
+    def test_invalid_top_is_a_json_error_for_every_format(self):
+        report = GenerateSalesPerformanceReport.as_view({'get': 'list'}, permission_classes=[])
+        for fmt in ('csv', 'npz', 'json'):
+            with self.subTest(format=fmt):
+                response = self.get(report, '/sales/generate_sales_performance_report/', reportType='sales-summary', top='x', format=fmt)
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response['Content-Type'].startswith('application/json'))
+                self.assertIn('top', json.loads(response.content)['error'])
+
+    def test_report_sections_end_with_other(self):
+        rows = list(iter_report_rows(SALES_SUMMARY_SECTIONS, report_filters('2024-01-01', '2024-01-31'), top=1))
+        start = rows.index(['Detailed Sales Breakdown by Product'])
+        self.assertEqual(rows[start + 2:start + 4], [['Product 0', 1, Decimal('30.00')], ['Other', 3, Decimal('25.00')]])
+        self.assertEqual(rows[start + 4], [])
+
+    def test_overview_pages_end_with_other_and_next_offset(self):
+        overview = SalesOverview.as_view(permission_classes=[])
+        params = {'start_date': '2024-01-01', 'end_date': '2024-01-31', 'top': 2}
+        first = self.get(overview, '/sales/overview/', **params).data
+        self.assertEqual(
+            [(row['productID__prodName'], row['total_revenue']) for row in first['sales_by_product']],
+            [('Product 0', Decimal('30.00')), ('Product 1', Decimal('20.00')), ('Other', Decimal('5.00'))]
+        )
+        self.assertEqual(first['next_offset'], 2)
+
+        last = self.get(overview, '/sales/overview/', offset=2, **params).data
+        self.assertEqual([row['productID__prodName'] for row in last['sales_by_product']], ['Product 2', 'Other'])
+        self.assertIsNone(last['next_offset'])
+
+
+class ListReportsTests(TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.reports = []
+        for index in range(5):
+            report = build(Report, index, rng, reportName=f'Report {index}', createdDate=date(2024, 1, 1) + timedelta(days=index), createdBy='alice' if index % 2 else 'bob')
+            report.save()
+            self.reports.append(report.reportID)
+
+    def get(self, **params):
+        response = ListReportsView.as_view(permission_classes=[])(APIRequestFactory().get('/sales/reports/', params))
+        return response, [report['reportID'] for report in response.data]
+
+    def test_without_limit_or_cursor_every_report_is_returned(self):
+        with mock.patch.object(views, 'REPORT_PAGE_SIZE', 2):
+            response, ids = self.get()
+        self.assertEqual(ids, self.reports)
+        self.assertNotIn('Link', response)
+
+    def test_pages_follow_the_cursor(self):
+        response, ids = self.get(limit=2)
+        self.assertEqual(ids, self.reports[:2])
+        self.assertEqual(response['X-Next-Cursor'], str(self.reports[1]))
+        self.assertIn(f'cursor={self.reports[1]}', response['Link'])
+
+        response, ids = self.get(limit=2, cursor=self.reports[3])
+        self.assertEqual(ids, self.reports[4:])
+        self.assertNotIn('X-Next-Cursor', response)
+
+        with mock.patch.object(views, 'REPORT_PAGE_SIZE', 2):
+            response, ids = self.get(cursor=self.reports[0])
+        self.assertEqual(ids, self.reports[1:3])
+        self.assertEqual(response['X-Next-Cursor'], str(self.reports[2]))
+
+    def test_fields_and_filters(self):
+        response, ids = self.get(fields='reportName')
+        self.assertEqual(set(response.data[0]), {'reportID', 'reportName'})
+        self.assertEqual(self.get(fields='reportName,nope')[0].status_code, 400)
+
+        self.assertEqual(self.get(createdBy='alice')[1], self.reports[1::2])
+        self.assertEqual(self.get(fromDate='2024-01-02', toDate='2024-01-04')[1], self.reports[1:4])
+        self.assertEqual(self.get(fromDate='01/02/2024')[0].status_code, 400)
+        self.assertEqual(self.get(limit=0)[0].status_code, 400)
+
+
+class OverviewGrowthTests(TestCase):
+    TODAY = date(2024, 3, 10)
+
+    def setUp(self):
+        product = make_product()
+        days = [(date(2024, 3, 10), 3), (date(2024, 3, 9), 1), (date(2024, 3, 3), 2), (date(2024, 3, 2), 4), (date(2024, 2, 24), 1), (date(2024, 2, 23), 5)]
+        for index, (day, quantity) in enumerate(days):
+            make_item(make_order(f'customer{index}@example.com', day, index=index), product, quantity, index=index)
+        patcher = mock.patch.object(views, 'today', return_value=self.TODAY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def overview(self, date_range, start=None, end=None):
+        start_date, end_date = SalesOverview.get_window(date_range, start, end)
+        data = SalesOverview.get_overview_data(start_date, end_date)
+        return data['total_revenue'], data['money_growth'], data['sales_growth']
+
+    def test_windows_end_today(self):
+        self.assertEqual(SalesOverview.get_window('today'), (self.TODAY, self.TODAY))
+        self.assertEqual(SalesOverview.get_window('7days'), (date(2024, 3, 3), self.TODAY))
+        self.assertEqual(SalesOverview.get_window('all'), (None, None))
+        self.assertEqual(SalesOverview.get_window('today', '2024-03-03'), (date(2024, 3, 3), self.TODAY))
+
+    def test_growth_against_the_previous_window(self):
+        # The day before
+        self.assertEqual(self.overview('today'), (Decimal('30.00'), 200.0, 0))
+        # 3 to 10 March against 24 February to 2 March
+        self.assertEqual(self.overview('7days'), (Decimal('60.00'), 20.0, 50.0))
+        # 3 to 9 March against 25 February to 2 March
+        self.assertEqual(self.overview('today', '2024-03-03', '2024-03-09'), (Decimal('30.00'), -25.0, 100.0))
+        # An open-ended window runs to today
+        self.assertEqual(SalesOverview.get_overview_data(date(2024, 3, 3))['money_growth'], 20.0)
+        self.assertEqual(self.overview('all'), (Decimal('160.00'), 0, 0))
+
+    def test_both_windows_are_read_in_one_query(self):
+        with self.assertNumQueries(1):
+            SalesOverview.get_overview_data(date(2024, 3, 3), self.TODAY)
+        # A page of products is ranked in a second query
+        with self.assertNumQueries(2):
+            SalesOverview.get_overview_data(date(2024, 3, 3), self.TODAY, top=1)
+
+
+class ConditionalGetTests(TestCase):
+    ENDPOINTS = [
+        (SalesTrendData, '/sales/sales_trend_data/', {'start_date': '2024-01-01', 'end_date': '2024-03-31'}),
+        (SalesOverview, '/sales/overview/', {'date_range': 'all'}),
+        (ListReportsView, '/sales/reports/', {}),
+    ]
+
+    def setUp(self):
+        self.product = make_product()
+        make_item(make_order('customer@example.com', date(2024, 1, 10)), self.product, 2)
+        self.addCleanup(routing.get_cache().clear)
+
+    def get(self, view, path, params, **headers):
+        response = view.as_view(permission_classes=[])(APIRequestFactory().get(path, params, **headers))
+        response.render()
+        return response
+
+    def test_unchanged_data_is_not_modified(self):
+        for view, path, params in self.ENDPOINTS:
+            with self.subTest(view=view.__name__):
+                response = self.get(view, path, params)
+                self.assertEqual(response.status_code, 200)
+                etag, last_modified = response['ETag'], response['Last-Modified']
+
+                for headers in ({'HTTP_IF_NONE_MATCH': etag}, {'HTTP_IF_MODIFIED_SINCE': last_modified}):
+                    revalidated = self.get(view, path, params, **headers)
+                    self.assertEqual(revalidated.status_code, 304)
+                    self.assertEqual(revalidated['ETag'], etag)
+                    self.assertEqual(revalidated.content, b'')
+
+                stale = self.get(view, path, params, HTTP_IF_NONE_MATCH='"outdated"')
+                self.assertEqual(stale.status_code, 200)
+
+    def test_changed_data_is_sent_again(self):
+        etags = {view: self.get(view, path, params)['ETag'] for view, path, params in self.ENDPOINTS}
+        make_item(make_order('other@example.com', date(2024, 1, 11), index=1), self.product, 1, index=1)
+        build(Report, 0, random.Random(0)).save()
+        for view, path, params in self.ENDPOINTS:
+            with self.subTest(view=view.__name__):
+                response = self.get(view, path, params, HTTP_IF_NONE_MATCH=etags[view])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etags[view])
+
+    def test_trend_ranges_in_the_past_are_closed(self):
+        params = {'start_date': '2024-01-01', 'end_date': '2024-03-31'}
+        for current_day, closed in [(date(2024, 3, 31), False), (date(2024, 4, 1), True)]:
+            with self.subTest(today=current_day):
+                with mock.patch.object(views, 'today', return_value=current_day), \
+                        mock.patch.object(views, 'cached_result', return_value={}) as cached:
+                    self.get(SalesTrendData, '/sales/sales_trend_data/', params)
+                self.assertIs(cached.call_args.kwargs['closed'], closed)
+
+    def test_overview_windows_in_the_past_are_closed(self):
+        cases = [
+            ({'start_date': '2024-01-01', 'end_date': '2024-03-31'}, True),
+            ({'start_date': '2024-01-01', 'end_date': '2024-04-01'}, False),
+            ({'start_date': '2024-01-01'}, False),
+            ({'date_range': '7days'}, False),
+            ({'date_range': 'all'}, False),
+        ]
+        for params, closed in cases:
+            with self.subTest(params=params):
+                with mock.patch.object(views, 'today', return_value=date(2024, 4, 1)), \
+                        mock.patch.object(views, 'cached_result', return_value={}) as cached:
+                    self.get(SalesOverview, '/sales/overview/', params)
+                self.assertIs(cached.call_args.kwargs['closed'], closed)
+
+
+class GroupedTrendTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(0, '10.00'), make_product(1, '4.00')]
+        quantities = [(1, 2), (3, 0), (2, 1), (5, 4)]
+        for month, row in enumerate(quantities, start=1):
+            order = make_order(f'customer{month}@example.com', date(2024, month, 15), index=month)
+            for offset, (product, quantity) in enumerate(zip(self.products, row)):
+                if quantity:
+                    make_item(order, product, quantity, index=10 * month + offset)
+
+    def single_product_trend(self, product, metric, indicators):
+        # Trend of the product alone, with the other products' items removed for the duration
+        with transaction.atomic():
+            OrderInvoiceItems.objects.exclude(productID=product).delete()
+            trend = get_sales_trend_data(date(2024, 1, 1), date(2024, 4, 30), metric, indicators)
+            transaction.set_rollback(True)
+        return trend
+
+    def test_each_series_matches_the_single_trend(self):
+        indicators = [Indicator('wma', 2, 'revenue'), Indicator('sma', 2, 'quantity')]
+        for metric in ('SMA', 'EMA'):
+            grouped = get_grouped_sales_trend_data(
+                date(2024, 1, 1), date(2024, 4, 30), metric, 'product', [product.pk for product in self.products], indicators
+            )
+            for product, series in zip(self.products, grouped['series']):
+                with self.subTest(metric=metric, product=product.prodName):
+                    trend = self.single_product_trend(product, metric, indicators)
+                    self.assertEqual(grouped['months'], trend['months'])
+                    self.assertEqual(series['name'], product.prodName)
+                    self.assertEqual(series['total_revenue'], [float(value) for value in trend['total_revenue']])
+                    self.assertEqual(series['total_quantity'], [int(value) for value in trend['total_quantity']])
+                    pairs = [(series['indicators'][name], values) for name, values in trend['indicators'].items()]
+                    pairs += [(series[key], trend[key]) for key in (f'{metric.lower()}_revenue', f'{metric.lower()}_quantity')]
+                    for grouped_values, values in pairs:
+                        self.assertEqual(len(grouped_values), len(values))
+                        for grouped_value, value in zip(grouped_values, values):
+                            self.assertAlmostEqual(grouped_value, value)
+
+    def test_indicators_add_no_queries(self):
+        indicators = [Indicator(kind, window, field) for kind in ('sma', 'ema', 'wma') for window in (2, 3) for field in ('revenue', 'quantity')]
+
+        def count_queries(metric, indicators):
+            TrendPeriod.objects.all().delete()
+            with CaptureQueriesContext(connection) as captured:
+                get_sales_trend_data(date(2024, 1, 1), date(2024, 4, 30), metric, indicators)
+            return len(captured.captured_queries)
+
+        self.assertEqual(count_queries('SMA', indicators), count_queries('SMA', None))
+        self.assertEqual(count_queries('', indicators), count_queries('', None))
+
+        keys = [product.pk for product in self.products]
+        for requested in (None, indicators):
+            with self.assertNumQueries(1):
+                get_grouped_sales_trend_data(date(2024, 1, 1), date(2024, 4, 30), 'EMA', 'product', keys, requested)
+
+
+class ReportRequestMixin:
+    """
+    Saves a few orders and requests reports for them.
+    """
+    def setUp(self):
+        cheap, dear = make_product(1, '4.50'), make_product(2, '12.00')
+        for index, (day, country) in enumerate([(date(2024, 1, 5), 'Canada'), (date(2024, 1, 6), 'France'), (date(2024, 2, 1), 'Canada')]):
+            order = make_order(f'customer{index}@example.com', day, country, index=index)
+            make_item(order, cheap, index + 1, index=2 * index)
+            make_item(order, dear, 2, index=2 * index + 1)
+
+    def get(self, **params):
+        report = GenerateSalesPerformanceReport.as_view({'get': 'list'}, permission_classes=[])
+        response = report(APIRequestFactory().get('/sales/generate_sales_performance_report/', {'fromDate': '2024-01-01', 'toDate': '2024-12-31', **params}))
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+
+class ReportStreamingTests(ReportRequestMixin, TestCase):
+    def test_streamed_report_equals_the_buffered_one(self):
+        for report_type in ('sales-summary', 'product-analysis'):
+            for top in ({}, {'top': '1'}):
+                with self.subTest(report_type=report_type, **top):
+                    buffered = self.get(reportType=report_type, **top)
+                    self.assertIn(b'\r\n\r\n', buffered)
+                    self.assertEqual(self.get(reportType=report_type, stream='true', **top), buffered)
+
+
+class ConcurrentReportTests(ReportRequestMixin, TransactionTestCase):
+    # Sections are computed on worker threads with their own connections, which only see committed data
+
+    def test_concurrent_sections_equal_sequential_ones(self):
+        filters = report_filters('2024-01-01', '2024-12-31')
+        for sections in (SALES_SUMMARY_SECTIONS, PRODUCT_ANALYSIS_SECTIONS):
+            for top in (None, 1):
+                with self.subTest(sections=sections[0][0], top=top):
+                    self.assertEqual(
+                        list(iter_report_rows_concurrently(sections, filters, top=top)),
+                        list(iter_report_rows(sections, filters, top=top))
+                    )
+
+    def test_concurrent_report_equals_the_sequential_one(self):
+        for report_type in ('sales-summary', 'product-analysis'):
+            with self.subTest(report_type=report_type):
+                self.assertEqual(self.get(reportType=report_type, concurrent='true'), self.get(reportType=report_type))
+
+
+def decode_packed(content):
+    """
+    Decodes the packed format of sales.columnar back into columnar JSON.
+    """
+    assert content[:len(PACKED_MAGIC)] == PACKED_MAGIC
+    start = len(PACKED_MAGIC) + 4
+    end = start + struct.unpack('<I', content[len(PACKED_MAGIC):start])[0]
+    # The buffers start at an 8-byte boundary
+    assert end % 8 == 0
+    buffers = content[end:]
+
+    def restore(node):
+        if isinstance(node, dict) and {'dtype', 'offset', 'length'} <= set(node):
+            values = array('d')
+            values.frombytes(buffers[node['offset']:node['offset'] + 8 * node['length']])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            values = [int(value) for value in values] if node['dtype'] == 'int64' else values.tolist()
+            return {'dtype': node['dtype'], 'values': values}
+        if isinstance(node, dict):
+            return {key: restore(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [restore(value) for value in node]
+        return node
+    return restore(json.loads(content[len(PACKED_MAGIC) + 4:end]))
+
+
+class ColumnarEncodingTests(TestCase):
+    PAYLOAD = {
+        'months': ['2024-01', '2024-02'],
+        'total_revenue': [Decimal('10.50'), Decimal('3')],
+        'total_quantity': [1, 2 ** 40],
+        'indicators': {'sma_3_revenue': [0.0, 1.25]},
+        'sales_by_product': [{'name': 'A', 'quantity': 1}, {'name': 'B', 'quantity': 2}],
+        'total': Decimal('13.50'),
+        'next_offset': None,
+        'mixed': [1, 'a'],
+    }
+    COLUMNS = {
+        'months': {'dtype': 'string', 'values': ['2024-01', '2024-02']},
+        'total_revenue': {'dtype': 'float64', 'values': [10.5, 3.0]},
+        'total_quantity': {'dtype': 'int64', 'values': [1, 2 ** 40]},
+        'indicators': {'sma_3_revenue': {'dtype': 'float64', 'values': [0.0, 1.25]}},
+        'sales_by_product': {
+            'name': {'dtype': 'string', 'values': ['A', 'B']},
+            'quantity': {'dtype': 'int64', 'values': [1, 2]},
+        },
+        'total': 13.5,
+        'next_offset': None,
+        'mixed': [1, 'a'],
+    }
+
+    def test_encodings_round_trip(self):
+        self.assertEqual(to_columns(self.PAYLOAD), self.COLUMNS)
+        self.assertEqual(json.loads(encode_json(self.PAYLOAD)), self.COLUMNS)
+        packed = encode_packed(self.PAYLOAD)
+        self.assertEqual(decode_packed(packed), self.COLUMNS)
+
+    def test_views_encode_their_payload(self):
+        product = make_product()
+        make_item(make_order('customer@example.com', date(2024, 1, 10)), product, 3)
+        make_item(make_order('customer@example.com', date(2024, 2, 10), index=1), product, 1, index=1)
+        endpoints = [
+            (SalesTrendData, '/sales/sales_trend_data/', {'start_date': '2024-01-01', 'end_date': '2024-02-29', 'indicators': 'wma:2:revenue'}),
+            (SalesOverview, '/sales/overview/', {'date_range': 'all', 'top': 1}),
+        ]
+        for view, path, params in endpoints:
+            with self.subTest(view=view.__name__):
+                def get(fmt):
+                    response = view.as_view(permission_classes=[])(APIRequestFactory().get(path, {**params, 'format': fmt}))
+                    response.render()
+                    return response
+                expected = to_columns(get('json').data)
+                columnar, packed = get('columnar'), get('packed')
+                self.assertEqual(columnar['Content-Type'], 'application/vnd.sales.columnar+json; charset=utf-8')
+                self.assertEqual(json.loads(columnar.content), expected)
+                self.assertEqual(packed['Content-Type'], 'application/vnd.sales.columnar')
+                self.assertEqual(decode_packed(packed.content), expected)
+
+
+class ImportTimeTests(SimpleTestCase):
+    def test_parse_importtime(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   _io\n'
+            'import time:      2500 |       2620 | sales.views\n'
+            'unrelated warning\n'
+        )
+        self.assertEqual(parse_importtime(output), {'_io': 120, 'sales.views': 2500})
+
+    def test_startup_does_not_import_numpy_or_pandas(self):
+        out = io.StringIO()
+        call_command('check_import_time', forbid='pandas,numpy', budget_ms=None, stdout=out)
+        self.assertIn('Startup import check passed.', out.getvalue())
+
+    def test_forbidden_startup_import_fails(self):
+        with self.assertRaisesMessage(CommandError, 'Startup imports forbidden modules: django'):
+            call_command('check_import_time', forbid='django', budget_ms=None, stdout=io.StringIO())
+
+
+class RestockTests(TestCase):
+    AS_OF = date(2024, 3, 31)
+
+    def setUp(self):
+        Batch = Inventory._meta.get_field('batchID').related_model
+        # (threshold, category, batches as (quantity, last restocked), units sold on a day)
+        layout = [
+            (10, 'Garden', [(5, date(2024, 1, 2))], None),
+            (0, 'Garden', [(12, date(2024, 2, 1)), (8, date(2024, 3, 1))], (60, date(2024, 3, 15))),
+            (5, 'Garden', [(100, date(2024, 3, 1))], (30, date(2024, 3, 20))),
+            (0, 'Toys', [(10, date(2024, 3, 1))], (300, date(2024, 3, 1))),
+        ]
+        self.products = []
+        for index, (threshold, category, batches, sold) in enumerate(layout):
+            product = make_product(index)
+            product.restockThreshold, product.category = threshold, category
+            product.save()
+            self.products.append(product)
+            for quantity, restocked in batches:
+                batch = build(Batch, index, random.Random(index), productID=product, quantity=quantity)
+                batch.save()
+                build(Inventory, index, random.Random(index), batchID=batch, lastRestocked=restocked).save()
+            if sold:
+                quantity, day = sold
+                make_item(make_order(f'customer{index}@example.com', day, index=index), product, quantity, index=index)
+
+    def test_candidates_most_urgent_first(self):
+        candidates = restock_candidates(as_of=self.AS_OF, velocity_days=30, horizon_days=14)
+        self.assertEqual([
+            {key: item[key] for key in ('product_id', 'stock', 'units_sold', 'daily_velocity', 'days_of_cover', 'reorder_quantity', 'last_restocked', 'reasons')}
+            for item in candidates
+        ], [
+            # 20 units at 2 a day last 10 days; 28 are needed for 14 days
+            {'product_id': self.products[1].pk, 'stock': 20, 'units_sold': 60, 'daily_velocity': 2.0, 'days_of_cover': 10.0,
+             'reorder_quantity': 8, 'last_restocked': date(2024, 3, 1), 'reasons': [RUNNING_OUT]},
+            # No recent sales, but 5 units are below the threshold of 10
+            {'product_id': self.products[0].pk, 'stock': 5, 'units_sold': 0, 'daily_velocity': 0.0, 'days_of_cover': None,
+             'reorder_quantity': 6, 'last_restocked': date(2024, 1, 2), 'reasons': [BELOW_THRESHOLD]},
+        ])
+
+    def test_velocity_window_and_category(self):
+        # The 300 units sold on 1 March count once the window reaches back to that day
+        candidates = restock_candidates(as_of=self.AS_OF, velocity_days=31, horizon_days=14, category='Toys')
+        self.assertEqual([(item['product_id'], item['units_sold'], item['reasons']) for item in candidates], [(self.products[3].pk, 300, [RUNNING_OUT])])
+        self.assertEqual(restock_candidates(as_of=self.AS_OF, velocity_days=30, horizon_days=14, category='Toys'), [])
+
+
+class AggregationTests(TestCase):
+    def setUp(self):
+        products = []
+        for index, (price, category) in enumerate([('10.00', 'Garden'), ('4.00', 'Toys'), ('6.00', 'Garden')]):
+            product = make_product(index, price)
+            product.category = category
+            product.save()
+            products.append(product)
+        widget, gadget, trowel = products
+        for index, (day, country, lines) in enumerate([
+            (date(2024, 1, 10), 'Canada', [(widget, 2), (gadget, 5)]),
+            (date(2024, 1, 20), 'France', [(trowel, 1), (widget, 1)]),
+            (date(2023, 12, 20), 'Canada', [(gadget, 3)]),
+        ]):
+            order = make_order(f'customer{index}@example.com', day, country, index=index)
+            for line, (product, quantity) in enumerate(lines):
+                make_item(order, product, quantity, index=10 * index + line)
+        self.january = {'day__gte': date(2024, 1, 1), 'day__lte': date(2024, 1, 31)}
+
+    def test_every_dimension_in_one_query(self):
+        with self.assertNumQueries(1):
+            sales = aggregate_sales(self.january, previous={'day__gte': date(2023, 12, 1), 'day__lt': date(2024, 1, 1)})
+        self.assertEqual((sales.total['line_count'], sales.total['quantity'], sales.total['gross_sales']), (4, 9, Decimal('56.00')))
+        self.assertEqual(sales.previous['gross_sales'], Decimal('12.00'))
+        self.assertEqual([(row['productID__prodName'], row['gross_sales']) for row in sales.by('product')], [
+            ('Product 0', Decimal('30.00')), ('Product 1', Decimal('20.00')), ('Product 2', Decimal('6.00')),
+        ])
+        self.assertEqual([(row['productID__category'], row['quantity'], row['line_count']) for row in sales.by('category')], [('Garden', 4, 3), ('Toys', 5, 1)])
+        self.assertEqual([(row['country'], row['gross_sales']) for row in sales.by('country')], [('Canada', Decimal('40.00')), ('France', Decimal('16.00'))])
+
+    def test_report_sections_share_one_query(self):
+        filters = report_filters('2024-01-01', '2024-01-31')
+        report = ReportData(filters)
+        with self.assertNumQueries(1):
+            for rows in (sales_overview_rows, product_rows, category_rows, region_rows):
+                list(rows(report))
+
+        # With a top-N limit, the total is read once and each dimension is ranked in its own query
+        report = ReportData(filters, top=1)
+        with self.assertNumQueries(4):
+            rows = {section: list(section(report)) for section in (sales_overview_rows, product_rows, category_rows, region_rows)}
+        self.assertEqual(rows[category_rows], [['Garden', 4, Decimal('36.00')], ['Other', 5, Decimal('20.00')]])
+
+
+class DateRangeTests(TestCase):
+    def test_days_become_a_half_open_range(self):
+        self.assertEqual(report_filters('2024-01-01', '2024-01-31'), {
+            'orderID__order_datetime__gte': day_start(date(2024, 1, 1)),
+            'orderID__order_datetime__lt': day_start(date(2024, 2, 1)),
+        })
+        self.assertEqual(range_filters('order_datetime', end_date='2024-01-31'), {'order_datetime__lt': day_start(date(2024, 2, 1))})
+        self.assertEqual(range_filters('order_datetime'), {})
+        with self.assertRaises(ValueError):
+            range_filters('order_datetime', '01/31/2024')
+
+    def test_last_day_is_included_without_casting_the_column(self):
+        product = make_product()
+        for index, moment in enumerate([(date(2024, 1, 1), 0, 0), (date(2024, 1, 31), 23, 30), (date(2024, 2, 1), 0, 0), (date(2023, 12, 31), 23, 59)]):
+            day, hour, minute = moment
+            order = make_order(f'customer{index}@example.com', day, index=index)
+            Order.objects.filter(pk=order.pk).update(order_datetime=day_start(day).replace(hour=hour, minute=minute))
+            make_item(order, product, 10 ** index, index=index)
+
+        with self.assertNumQueries(1) as captured:
+            total = OrderInvoiceItems.objects.filter(**report_filters('2024-01-01', '2024-01-31')).aggregate(total=Sum('quantity'))['total']
+        self.assertEqual(total, 11)
+        sql = captured.captured_queries[0]['sql'].lower()
+        self.assertNotIn('cast', sql)
+        self.assertNotIn('::date', sql)
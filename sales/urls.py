@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import  GenerateSalesPerformanceReport, SalesTrendData,  CreateReportView, ListReportsView, DeleteReportView, SalesOverview
+from .views import  GenerateSalesPerformanceReport, SalesTrendData,  CreateReportView, ListReportsView, DeleteReportView, SalesOverview, ReportJobStatusView, ReportFileView, SaleIngestView, SalesMetricsView, RestockView
 
 router = DefaultRouter()
 
@@ -13,6 +13,11 @@ router = DefaultRouter()
     - 'create-report/' : URL for creating a report.
     - 'reports/' : URL for listing all reports.
     - 'reports/<int:reportID>/' : URL for deleting a specific report by its ID.
+    - 'reports/<int:reportID>/status/' : URL for the progress of a report generated in the background.
+    - 'reports/<int:reportID>/file/' : URL for downloading a report generated in the background.
+    - 'restock/' : URL for the products that need restocking, by stock and sales velocity.
+    - 'ingest/' : URL for bulk importing sales from a CSV or NDJSON upload.
+    - 'metrics/' : URL for the per-endpoint performance metrics in Prometheus format.
 """
 
 urlpatterns = [
@@ -29,4 +34,15 @@ urlpatterns = [
     path('create-report/', CreateReportView.as_view(), name='create_report'),
     path('reports/', ListReportsView.as_view(), name='list_reports'),
     path('reports/<int:reportID>/', DeleteReportView.as_view(), name='delete_report'),
+    path('reports/<int:reportID>/status/', ReportJobStatusView.as_view(), name='report_job_status'),
+    path('reports/<int:reportID>/file/', ReportFileView.as_view(), name='report_job_file'),
+
+    # URL for Inventory page
+    path('restock/', RestockView.as_view(), name='sales_restock'),
+
+    # URL for bulk imports
+    path('ingest/', SaleIngestView.as_view(), name='sale_ingest'),
+
+    # URL for monitoring
+    path('metrics/', SalesMetricsView.as_view(), name='sales_metrics'),
 ]
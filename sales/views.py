@@ -1,24 +1,44 @@
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import ReportSerializer
-from core.models import OrderInvoiceItems, Order, Inventory, Product, Report
-from .calculations import get_sales_trend_data  
-from django.http import HttpResponse
-from django.db.models import Sum, F, Count
+from rest_framework.permissions import IsAdminUser
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from .serializers import ReportSerializer, ReportJobSerializer, ReportJobRequestSerializer
+from .models import ReportJob
+from .jobs import enqueue_report_job
+from .export import COLUMNAR_FORMATS, export_report
+from .renderers import CSVRenderer, ArrowRenderer, ParquetRenderer, NpzRenderer, ColumnarJSONRenderer, PackedColumnarRenderer
+from .ingest import INGEST_BATCH_SIZE, INGEST_FORMATS, detect_format, ingest_sales, iter_records
+from .instrumentation import InstrumentedViewMixin, metrics_enabled, registry
+from core.models import Report
+from .aggregation import OTHER_LABEL, aggregate_sales, other_totals, top_groups
+from .cache import cached_result, data_watermark, report_watermark
+from .conditional import ConditionalGetMixin
+from .singleflight import SingleFlightTimeout
+from .restock import restock_candidates
+from .routing import AnalyticsReadMixin, iter_with_reads, pin_to_primary, primary_reads
+from .dateranges import parse_date, today
+from .indicators import parse_indicators, indicator_name
+from .calculations import get_grouped_sales_trend_data, get_sales_trend_data
+from .reports import REPORT_SECTIONS, SALES_SUMMARY_SECTIONS, PRODUCT_ANALYSIS_SECTIONS, iter_report_rows, iter_report_rows_concurrently, report_filters
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 import csv
 from datetime import date, timedelta, datetime
-from django.utils import timezone
 from core.permissions import HasRoleFactory
 
 
-class GenerateSalesPerformanceReport(ViewSet):
+class GenerateSalesPerformanceReport(InstrumentedViewMixin, AnalyticsReadMixin, ViewSet):
     """
     ViewSet for generating sales performance reports.
     """
     permission_classes = [HasRoleFactory("Employee")]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [CSVRenderer, ArrowRenderer, ParquetRenderer, NpzRenderer]
     
     @action(detail=False, methods=['get'])
     def list(self, request):
@@ -27,30 +47,57 @@ class GenerateSalesPerformanceReport(ViewSet):
 
         Parameters:
         - request: The request object containing query parameters 'fromDate', 'toDate', and 'reportType'.
+          Pass 'stream=true' to stream the CSV instead of building it in memory, and
+          'concurrent=true' to compute the report sections in parallel. 'format' selects
+          'csv' (default), 'arrow', 'parquet' or 'npz'; Arrow and Parquet fall back to
+          'npz' when pyarrow is not installed. 'top=N' limits the product, category and region
+          sections to the N best sellers plus an 'Other' row.
 
         Returns:
-        - CSV response containing the generated report.
+        - CSV or columnar binary response containing the generated report.
         """
         from_date = request.query_params.get('fromDate')
         to_date = request.query_params.get('toDate')
         report_type = request.query_params.get('reportType')
-
-        filters = {}
-        if from_date:
-            filters['orderID__order_datetime__gte'] = timezone.datetime.strptime(from_date, '%Y-%m-%d').replace(tzinfo=timezone.get_current_timezone())
-        if to_date:
-            filters['orderID__order_datetime__lte'] = timezone.datetime.strptime(to_date, '%Y-%m-%d').replace(tzinfo=timezone.get_current_timezone())
+        top = request.query_params.get('top')
+        if top is not None and (not top.isdigit() or int(top) < 1):
+            return Response({"error": "top must be a whole number of at least 1."}, status=status.HTTP_400_BAD_REQUEST)
+        top = int(top) if top else None
+
+        filters = report_filters(from_date, to_date)
+
+        sections = REPORT_SECTIONS.get(report_type, [])
+        filename = f'{report_type}_report.csv'
+
+        # Columnar binary formats are built from column arrays instead of CSV rows
+        fmt = request.query_params.get('format', 'csv')
+        if fmt in COLUMNAR_FORMATS:
+            content, content_type, extension = export_report(sections, filters, fmt, top=top)
+            response = HttpResponse(content, content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{report_type}_report.{extension}"'
+            return response
+
+        # Optionally compute the sections in parallel, then write them in their usual order
+        concurrent = request.query_params.get('concurrent', '').lower() in ('1', 'true')
+        rows = iter_report_rows_concurrently(sections, filters, top=top) if concurrent else iter_report_rows(sections, filters, top=top)
+
+        # Stream the CSV row by row so memory stays flat for large date ranges. The rows are
+        # read after the view returns, so they carry the request's database routing with them.
+        if request.query_params.get('stream', '').lower() in ('1', 'true'):
+            writer = csv.writer(Echo())
+            response = StreamingHttpResponse(
+                (writer.writerow(row) for row in iter_with_reads(rows)),
+                content_type='text/csv'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
 
         # Generate the CSV response
         response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{report_type}_report.csv"'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
         writer = csv.writer(response)
-        
-        if report_type == 'sales-summary':
-            GenerateSalesPerformanceReport.generate_sales_summary(writer, filters)
-        elif report_type == 'product-analysis':
-            GenerateSalesPerformanceReport.generate_product_analysis(writer, filters)
+        writer.writerows(rows)
         
         return response
 
@@ -63,60 +110,7 @@ class GenerateSalesPerformanceReport(ViewSet):
         - writer: CSV writer object.
         - filters: Query filters for fetching sales data.
         """
-        writer.writerow(['Sales Performance Overview'])
-        writer.writerow(['Section', 'Metric', 'Value'])
-
-        # Sales Performance Overview
-        total_sales_price = OrderInvoiceItems.objects.filter(**filters).aggregate(total_sales_price=Sum(F('quantity') * F('productID__price')))['total_sales_price'] or 0
-        total_sales = OrderInvoiceItems.objects.filter(**filters).count()
-        avg_sale_value = total_sales_price / total_sales if total_sales else 0
-        writer.writerow(['Sales Performance Overview', 'Total Sales Price', total_sales_price])
-        writer.writerow(['', 'Total Sales', total_sales])
-        writer.writerow(['', 'Average Sale Value', avg_sale_value])
-
-        # Detailed Sales Breakdown by Product
-        writer.writerow([])
-        writer.writerow(['Detailed Sales Breakdown by Product'])
-        writer.writerow(['Product', 'Units Sold', 'Total Sales Price'])
-        sales_by_product = OrderInvoiceItems.objects.filter(**filters).values('productID__prodName').annotate(
-            total_quantity=Sum('quantity'),
-            total_sales_price=Sum(F('quantity') * F('productID__price'))
-        ).order_by('-total_sales_price')
-        for sale in sales_by_product:
-            writer.writerow([sale['productID__prodName'], sale['total_quantity'], sale['total_sales_price']])
-
-        # Detailed Sales Breakdown by Category
-        writer.writerow([])
-        writer.writerow(['Detailed Sales Breakdown by Category'])
-        writer.writerow(['Category', 'Units Sold', 'Total Sales Price'])
-        sales_by_category = OrderInvoiceItems.objects.filter(**filters).values('productID__category').annotate(
-            total_quantity=Sum('quantity'),
-            total_sales_price=Sum(F('quantity') * F('productID__price'))
-        ).order_by('-total_sales_price')
-        for sale in sales_by_category:
-            writer.writerow([sale['productID__category'], sale['total_quantity'], sale['total_sales_price']])
-
-        # Detailed Sales Breakdown by Region
-        writer.writerow([])
-        writer.writerow(['Detailed Sales Breakdown by Region'])
-        writer.writerow(['Region', 'Units Sold', 'Total Sales Price'])
-        sales_by_region = Order.objects.filter(order_datetime__gte=filters.get('orderID__order_datetime__gte', None), order_datetime__lte=filters.get('orderID__order_datetime__lte', None)).values('shippingID__country').annotate(
-            total_quantity=Sum('orderinvoiceitems__quantity'),
-            total_sales_price=Sum(F('orderinvoiceitems__quantity') * F('orderinvoiceitems__productID__price'))
-        ).order_by('-total_sales_price')
-        for sale in sales_by_region:
-            writer.writerow([sale['shippingID__country'], sale['total_quantity'], sale['total_sales_price']])
-
-        # Customer Analysis
-        writer.writerow([])
-        writer.writerow(['Customer Analysis'])
-        writer.writerow(['Metric', 'Value'])
-        num_new_customers = Order.objects.filter(order_datetime__gte=filters.get('orderID__order_datetime__gte', None)).count()
-        repeat_customers = Order.objects.filter(order_datetime__gte=filters.get('orderID__order_datetime__gte', None), order_datetime__lte=filters.get('orderID__order_datetime__lte', None)).values('custEmail').annotate(order_count=Count('orderID')).filter(order_count__gt=1).count()
-        customer_retention_rate = (repeat_customers / num_new_customers) * 100 if num_new_customers else 0
-        writer.writerow(['Number of New Customers', num_new_customers])
-        writer.writerow(['Repeat Customers', repeat_customers])
-        writer.writerow(['Customer Retention Rate (%)', customer_retention_rate])
+        writer.writerows(iter_report_rows(SALES_SUMMARY_SECTIONS, filters))
 
     @action(detail=False, methods=['get'])
     def generate_product_analysis(writer, filters):
@@ -127,48 +121,21 @@ class GenerateSalesPerformanceReport(ViewSet):
         - writer: CSV writer object.
         - filters: Query filters for fetching sales data.
         """
-        writer.writerow(['Product Performance Overview'])
-        writer.writerow(['Section', 'Product', 'Units Sold', 'Total Sales Price'])
-
-        # Product Performance Overview
-        sales_by_product = OrderInvoiceItems.objects.filter(**filters).values('productID__prodName').annotate(
-            total_quantity=Sum('quantity'),
-            total_sales_price=Sum(F('quantity') * F('productID__price'))
-        ).order_by('-total_sales_price')
-        for sale in sales_by_product:
-            writer.writerow(['Product Performance Overview', sale['productID__prodName'], sale['total_quantity'], sale['total_sales_price']])
-
-        # Product Sales Trends
-        writer.writerow([])
-        writer.writerow(['Product Sales Trends'])
-        writer.writerow(['Date', 'Units Sold', 'Total Sales Price'])
-        sales_trends = OrderInvoiceItems.objects.filter(**filters).values('orderID__order_datetime').annotate(
-            total_quantity=Sum('quantity'),
-            total_sales_price=Sum(F('quantity') * F('productID__price'))
-        ).order_by('orderID__order_datetime')
-        for trend in sales_trends:
-            writer.writerow([trend['orderID__order_datetime'].strftime('%m/%d/%y'), trend['total_quantity'], trend['total_sales_price']])
-
-        # Product Category Analysis
-        writer.writerow([])
-        writer.writerow(['Product Category Analysis'])
-        writer.writerow(['Category', 'Units Sold', 'Total Sales Price'])
-        sales_by_category = OrderInvoiceItems.objects.filter(**filters).values('productID__category').annotate(
-            total_quantity=Sum('quantity'),
-            total_sales_price=Sum(F('quantity') * F('productID__price'))
-        ).order_by('-total_sales_price')
-        for sale in sales_by_category:
-            writer.writerow([sale['productID__category'], sale['total_quantity'], sale['total_sales_price']])
-
-        # Inventory and Restock Analysis
-        writer.writerow([])
-        writer.writerow(['Inventory and Restock Analysis'])
-        writer.writerow(['Product', 'Current Stock', 'Restock Threshold', 'Last Restocked'])
-        inventory_data = Inventory.objects.filter(batchID__productID__in=Product.objects.all()).values('batchID__productID__prodName', 'batchID__quantity', 'batchID__productID__restockThreshold', 'lastRestocked')
-        for item in inventory_data:
-            writer.writerow([item['batchID__productID__prodName'], item['batchID__quantity'], item['batchID__productID__restockThreshold'], item['lastRestocked']])
-
-class CreateReportView(APIView):
+        writer.writerows(iter_report_rows(PRODUCT_ANALYSIS_SECTIONS, filters))
+
+
+class Echo:
+    """
+    Pseudo-buffer that returns written values instead of storing them, so a csv.writer
+    can feed a StreamingHttpResponse.
+    """
+    def write(self, value):
+        """
+        Return the value passed in instead of buffering it.
+        """
+        return value
+
+class CreateReportView(InstrumentedViewMixin, APIView):
     """
     API view for creating a report.
     """
@@ -179,20 +146,55 @@ class CreateReportView(APIView):
         Handle POST requests to create a report.
 
         Parameters:
-        - request: The request object containing report data.
+        - request: The request object containing report data. When 'reportType' is included
+          (with optional 'fromDate' and 'toDate'), the CSV is generated in the background and
+          its progress can be followed at 'reports/<reportID>/status/'.
 
         Returns:
-        - JSON response with the created report data or errors.
+        - JSON response with the created report data or errors. Background jobs answer with
+          HTTP 202 Accepted and include the job under 'job'.
+
+        Reads stay on the primary database, and the user's analytics reads follow for
+        SALES_READ_YOUR_WRITES_SECONDS (see sales.routing), so they see their own writes.
+        """
+        with primary_reads():
+            response = self.create_report(request)
+        if response.status_code in (status.HTTP_201_CREATED, status.HTTP_202_ACCEPTED):
+            pin_to_primary(request)
+        return response
+
+    def create_report(self, request):
+        """
+        Validate and save the report and, with 'reportType', queue its background job.
         """
         data = request.data
         #data['accountID'] = 1  
+        report_type = data.get('reportType')
+        if report_type is not None:
+            job_serializer = ReportJobRequestSerializer(data={
+                'report_type': report_type,
+                'from_date': data.get('fromDate'),
+                'to_date': data.get('toDate'),
+            })
+            if not job_serializer.is_valid():
+                return Response(job_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = ReportSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            with transaction.atomic():
+                report = serializer.save()
+                if report_type is None:
+                    return Response(serializer.data, status=status.HTTP_201_CREATED)
+                job = job_serializer.save(report=report)
+                enqueue_report_job(job)
+            return Response({**serializer.data, 'job': ReportJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class ListReportsView(APIView):
+# Default and maximum number of reports per page of ListReportsView
+REPORT_PAGE_SIZE = 100
+MAX_REPORT_PAGE_SIZE = 500
+
+class ListReportsView(InstrumentedViewMixin, ConditionalGetMixin, APIView):
     """
     API view for listing reports.
     """
@@ -200,19 +202,78 @@ class ListReportsView(APIView):
 
     def get(self, request):
         """
-        Handle GET requests to list all reports.
+        Handle GET requests to list reports in reportID order.
+
+        Without 'limit' or 'cursor' every report is returned, as before pagination existed.
 
         Parameters:
-        - request: The request object.
+        - request: The request object containing optional query parameters:
+          - 'cursor': Return reports after this reportID (from the previous page's Link header).
+          - 'limit': Page size, at most MAX_REPORT_PAGE_SIZE. Defaults to REPORT_PAGE_SIZE
+            when only 'cursor' is given.
+          - 'fields': Comma-separated Report fields to return, e.g. 'reportID,reportName'.
+          - 'createdBy', 'fromDate', 'toDate': Filter by creator and creation date (YYYY-MM-DD).
 
         Returns:
-        - JSON response with the list of reports.
+        - JSON response with the list of reports. When more reports exist, the 'Link' header
+          holds the URL of the next page and 'X-Next-Cursor' its cursor. HTTP 304 Not Modified
+          when the client's ETag or Last-Modified is still current.
         """
-        reports = Report.objects.all()
-        serializer = ReportSerializer(reports, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        params = request.query_params
+        try:
+            paginate = bool(params.get('limit') or params.get('cursor'))
+            limit = min(int(params.get('limit') or REPORT_PAGE_SIZE), MAX_REPORT_PAGE_SIZE)
+            cursor = int(params['cursor']) if params.get('cursor') else None
+            from_date = datetime.strptime(params['fromDate'], '%Y-%m-%d').date() if params.get('fromDate') else None
+            to_date = datetime.strptime(params['toDate'], '%Y-%m-%d').date() if params.get('toDate') else None
+        except ValueError:
+            return Response({"error": "Invalid cursor, limit or date. Dates use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be at least 1."}, status=status.HTTP_400_BAD_REQUEST)
+
+        not_modified = self.check_not_modified(request, 'reports', dict(params.items()), report_watermark())
+        if not_modified:
+            return not_modified
+
+        # Keyset pagination on the primary key keeps every page an index range scan
+        reports = Report.objects.order_by('reportID')
+        if cursor is not None:
+            reports = reports.filter(reportID__gt=cursor)
+        if params.get('createdBy'):
+            reports = reports.filter(createdBy=params['createdBy'])
+        if from_date:
+            reports = reports.filter(createdDate__gte=from_date)
+        if to_date:
+            reports = reports.filter(createdDate__lte=to_date)
+
+        fields = None
+        if params.get('fields'):
+            fields = [name.strip() for name in params['fields'].split(',') if name.strip()]
+            known = {field.name for field in Report._meta.concrete_fields}
+            unknown = [name for name in fields if name not in known]
+            if unknown:
+                return Response({"error": f"Unknown fields: {', '.join(unknown)}."}, status=status.HTTP_400_BAD_REQUEST)
+            if 'reportID' not in fields:
+                fields.insert(0, 'reportID')
+            reports = reports.only(*fields)
+
+        if paginate:
+            page = list(reports[:limit + 1])
+            has_next = len(page) > limit
+            page = page[:limit]
+        else:
+            page, has_next = list(reports), False
+
+        serializer = ReportSerializer(page, many=True, fields=fields)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        if has_next:
+            next_cursor = page[-1].reportID
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+            response['Link'] = f'<{next_url}>; rel="next"'
+            response['X-Next-Cursor'] = str(next_cursor)
+        return response
 
-class DeleteReportView(APIView):
+class DeleteReportView(InstrumentedViewMixin, APIView):
     """
     API view for deleting a report.
     """
@@ -237,11 +298,60 @@ class DeleteReportView(APIView):
             return Response(status=status.HTTP_404_NOT_FOUND)
 
 
-class SalesTrendData(APIView):
+class ReportJobStatusView(InstrumentedViewMixin, APIView):
+    """
+    API view for checking the progress of a report generated in the background.
+    """
+    permission_classes = [HasRoleFactory("Manager")]
+
+    def get(self, request, reportID):
+        """
+        Handle GET requests for the status of a report's latest job.
+
+        Parameters:
+        - request: The request object.
+        - reportID: The ID of the report.
+
+        Returns:
+        - JSON response with the job status and progress, or HTTP 404 Not Found if the report has no job.
+        """
+        job = ReportJob.objects.filter(report_id=reportID).order_by('-created_at').first()
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(ReportJobSerializer(job).data, status=status.HTTP_200_OK)
+
+class ReportFileView(InstrumentedViewMixin, APIView):
+    """
+    API view for downloading a report generated in the background.
+    """
+    permission_classes = [HasRoleFactory("Manager")]
+
+    def get(self, request, reportID):
+        """
+        Handle GET requests to download a report's generated CSV.
+
+        Parameters:
+        - request: The request object.
+        - reportID: The ID of the report.
+
+        Returns:
+        - CSV file response, or HTTP 404 Not Found if no finished file exists.
+        """
+        job = ReportJob.objects.filter(report_id=reportID, status=ReportJob.SUCCEEDED).order_by('-created_at').first()
+        if job is None or not job.file:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=f'{job.report_type}_report.csv', content_type='text/csv')
+
+
+# Maximum number of products or categories in one grouped trend request
+MAX_TREND_SERIES = 200
+
+class SalesTrendData(InstrumentedViewMixin, AnalyticsReadMixin, ConditionalGetMixin, APIView):
     """
     API view for fetching sales trend data.
     """
     # permission_classes = [HasRoleFactory("Manager")]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer, PackedColumnarRenderer]
     
     @action(detail=False, methods=['get'])
     def get(self, request):
@@ -250,9 +360,17 @@ class SalesTrendData(APIView):
 
         Parameters:
         - request: The request object containing query parameters 'start_date', 'end_date', and 'metric'.
+          An optional 'indicators' parameter requests extra overlays in one call,
+          e.g. 'sma:3:revenue,ema:6:quantity,wma:4:revenue'. 'format=columnar' returns each
+          series as a typed column, 'format=packed' as float64 buffers (see sales.columnar).
+          'products=1,2,3' or 'categories=A,B' (up to MAX_TREND_SERIES) return one series per
+          product or category, computed from a single grouped query.
 
         Returns:
-        - JSON response with the sales trend data or errors.
+        - JSON response with the sales trend data or errors. With 'products' or 'categories',
+          'months' is shared by every entry of 'series'. HTTP 304 Not Modified when the
+          client's ETag or Last-Modified is still current. Identical concurrent requests share
+          one computation; HTTP 503 if waiting for it times out.
         """
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
@@ -265,18 +383,68 @@ class SalesTrendData(APIView):
         except (ValueError, TypeError):
             return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
 
-        # Fetch sales trend data
+        # Validate indicators
+        try:
+            indicators = parse_indicators(request.query_params.get('indicators'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        # Validate the optional grouping
+        products = request.query_params.get('products')
+        categories = request.query_params.get('categories')
+        if products and categories:
+            return Response({"error": "Use either 'products' or 'categories', not both."}, status=400)
+        dimension, keys = None, []
+        if products:
+            dimension = 'product'
+            try:
+                keys = list(dict.fromkeys(int(key) for key in products.split(',') if key.strip()))
+            except ValueError:
+                return Response({"error": "'products' must be a comma-separated list of product IDs."}, status=400)
+        elif categories:
+            dimension = 'category'
+            keys = list(dict.fromkeys(key.strip() for key in categories.split(',') if key.strip()))
+        if dimension and not keys:
+            return Response({"error": f"No {dimension} given."}, status=400)
+        if len(keys) > MAX_TREND_SERIES:
+            return Response({"error": f"At most {MAX_TREND_SERIES} series can be requested at once."}, status=400)
+
+        # Fetch sales trend data, reusing the cached result while the data is unchanged
+        params = {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'metric': metric,
+            'indicators': [indicator_name(indicator) for indicator in indicators],
+            'dimension': dimension,
+            'keys': keys
+        }
+        if dimension:
+            compute = lambda: get_grouped_sales_trend_data(start_date, end_date, metric, dimension, keys, indicators)
+        else:
+            compute = lambda: get_sales_trend_data(start_date, end_date, metric, indicators)
         try:
-            trend_data = get_sales_trend_data(start_date, end_date, metric)
+            watermark = data_watermark()
+            not_modified = self.check_not_modified(request, 'sales_trend_data', params, watermark)
+            if not_modified:
+                return not_modified
+            trend_data = cached_result(
+                'sales_trend_data', params,
+                compute,
+                closed=end_date < today(),
+                watermark=watermark
+            )
             return Response(trend_data, status=200)
+        except SingleFlightTimeout as e:
+            return Response({"error": str(e)}, status=503, headers={'Retry-After': '5'})
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
-class SalesOverview(APIView):
+class SalesOverview(InstrumentedViewMixin, AnalyticsReadMixin, ConditionalGetMixin, APIView):
     """
     API view for providing a sales overview.
     """
     permission_classes = [HasRoleFactory("Manager")]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer, PackedColumnarRenderer]
     
     @action(detail=False, methods=['get'])
     def get(self, request):
@@ -284,47 +452,276 @@ class SalesOverview(APIView):
         Handle GET requests to provide a sales overview.
 
         Parameters:
-        - request: The request object containing the query parameter 'date_range'.
+        - request: The request object containing the query parameter 'date_range', or a custom
+          window given by 'start_date' and optional 'end_date' (YYYY-MM-DD). 'format=columnar'
+          or 'format=packed' select the compact encodings in sales.columnar. 'top=N' limits
+          'sales_by_product' to N products ranked by revenue, starting after 'offset' products.
 
         Returns:
-        - JSON response with the sales overview data.
+        - JSON response with the sales overview data. 'money_growth' and 'sales_growth' are the
+          percentage change in revenue and sales against the preceding window of the same length.
+          With 'top', 'sales_by_product' ends with an 'Other' row summing every product not on the
+          page, and 'next_offset' is the offset of the next page (None on the last page).
+          HTTP 304 Not Modified when the client's ETag or Last-Modified is still current.
+          Identical concurrent requests share one computation; HTTP 503 if waiting for it times out.
         """
-        date_range = request.query_params.get('date_range', 'today')
-        
+        params = request.query_params
+        try:
+            start_date, end_date = SalesOverview.get_window(
+                params.get('date_range', 'today'), params.get('start_date'), params.get('end_date')
+            )
+        except ValueError:
+            return Response({"error": "Dates must be in 'YYYY-MM-DD' format, with start_date on or before end_date."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top = int(params['top']) if params.get('top') else None
+            offset = int(params.get('offset', 0))
+        except ValueError:
+            top = offset = -1
+        if (top is not None and top < 1) or offset < 0:
+            return Response({"error": "top must be at least 1 and offset at least 0."}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_params = {
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None,
+            'top': top,
+            'offset': offset if top else 0,
+        }
+        watermark = data_watermark()
+        not_modified = self.check_not_modified(request, 'overview', cache_params, watermark)
+        if not_modified:
+            return not_modified
+        try:
+            data = cached_result(
+                'overview', cache_params,
+                lambda: SalesOverview.get_overview_data(start_date, end_date, top, offset),
+                closed=end_date is not None and end_date < today(),
+                watermark=watermark
+            )
+        except SingleFlightTimeout as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def get_window(date_range, start=None, end=None):
+        """
+        Resolve the overview window from the request parameters.
+
+        Parameters:
+        - date_range: 'today', '7days' or 'all'. Any other value means 'today'.
+        - start: First day of a custom window in 'YYYY-MM-DD' format. Overrides date_range.
+        - end: Last day of a custom window in 'YYYY-MM-DD' format. Defaults to today.
+
+        Returns:
+        - Tuple of the first and last day (inclusive); both are None for all time.
+        """
+        last_day = today()
+        if start:
+            start_date = parse_date(start)
+            end_date = parse_date(end) or last_day
+            if start_date > end_date:
+                raise ValueError('start_date is after end_date')
+            return start_date, end_date
         if date_range == '7days':
-            start_date = date.today() - timedelta(days=7)
-        elif date_range == 'all':
-            start_date = None
-        else:  # 'today' or any other invalid value
-            start_date = date.today()
+            return last_day - timedelta(days=7), last_day
+        if date_range == 'all':
+            return None, None
+        # 'today' or any other invalid value
+        return last_day, last_day
+
+    @staticmethod
+    def growth(current, previous):
+        """
+        Percentage change from the previous window to the current one.
 
-        if start_date:
-            total_revenue = OrderInvoiceItems.objects.filter(
-                orderID__order_datetime__date__gte=start_date
-            ).aggregate(total_revenue=Sum(F('quantity') * F('productID__price')))['total_revenue'] or 0
+        Parameters:
+        - current: The current window's value.
+        - previous: The previous window's value.
+
+        Returns:
+        - The change in percent rounded to 2 decimals, or 0 when the previous window had no sales.
+        """
+        if not previous:
+            return 0
+        return round(float((current - previous) * 100 / previous), 2)
 
-            total_sales = OrderInvoiceItems.objects.filter(orderID__order_datetime__date__gte=start_date).count()
-            sales_by_product = OrderInvoiceItems.objects.filter(orderID__order_datetime__date__gte=start_date).values(
-                'productID__prodName'
-            ).annotate(total_quantity=Sum('quantity')).annotate(total_revenue=Sum(F('quantity') * F('productID__price'))).order_by('-total_revenue')
-        else:  # all time
-            total_revenue = OrderInvoiceItems.objects.aggregate(total_revenue=Sum(F('quantity') * F('productID__price')))['total_revenue'] or 0
+    @staticmethod
+    def get_overview_data(start_date, end_date=None, top=None, offset=0):
+        """
+        Compute the sales overview for a window and its growth against the window just before it.
 
-            total_sales = OrderInvoiceItems.objects.count()
+        Both windows, the totals and the per-product breakdown come from a single query. With
+        'top', the breakdown is instead ranked and limited in a second query, so only one page
+        of products leaves the database.
 
-            sales_by_product = OrderInvoiceItems.objects.values(
-                'productID__prodName'
-            ).annotate(total_quantity=Sum('quantity')).annotate(total_revenue=Sum(F('quantity') * F('productID__price'))).order_by('-total_revenue')
+        Parameters:
+        - start_date: First day to include, or None for all time (no growth is computed).
+        - end_date: Last day to include. Defaults to no upper bound.
+        - top: Number of products to return, ranked by revenue. Defaults to all products.
+        - offset: Number of higher-ranked products to skip when 'top' is given. Defaults to 0.
+
+        Returns:
+        - Dictionary with total revenue, total sales, growth figures and sales by product.
+        """
+        filters = {}
+        if start_date:
+            filters['day__gte'] = start_date
+        if end_date:
+            filters['day__lte'] = end_date
+
+        # The previous window has the same length and ends the day before start_date
+        previous = None
+        if start_date:
+            length = ((end_date or today()) - start_date).days + 1
+            previous = {'day__gte': start_date - timedelta(days=length), 'day__lt': start_date}
+
+        sales = aggregate_sales(filters, dimensions=() if top else ('product',), previous=previous)
+
+        total_revenue = sales.total['gross_sales']
+        total_sales = sales.total['line_count']
+        next_offset = None
+        if top:
+            products, has_more = top_groups(filters, 'product', top, offset)
+            other = other_totals(sales.total, products)
+            if other['line_count']:
+                products.append({'productID__prodName': OTHER_LABEL, **other})
+            next_offset = offset + top if has_more else None
+        else:
+            products = sales.by('product')
+        sales_by_product = [
+            {
+                'productID__prodName': row['productID__prodName'],
+                'total_quantity': row['quantity'],
+                'total_revenue': row['gross_sales'],
+            }
+            for row in products
+        ]
 
         money_growth = 0
         sales_growth = 0
+        if sales.previous is not None:
+            money_growth = SalesOverview.growth(total_revenue, sales.previous['gross_sales'])
+            sales_growth = SalesOverview.growth(total_sales, sales.previous['line_count'])
 
         data = {
             'total_revenue': total_revenue,
             'total_sales': total_sales,
             'money_growth': money_growth,
             'sales_growth': sales_growth,
-            'sales_by_product': list(sales_by_product)
+            'sales_by_product': sales_by_product
         }
+        if top:
+            data['next_offset'] = next_offset
+        return data
 
-        return Response(data, status=status.HTTP_200_OK)
+class RestockView(InstrumentedViewMixin, AnalyticsReadMixin, APIView):
+    """
+    API view listing the products that need restocking.
+    """
+    permission_classes = [HasRoleFactory("Manager")]
+
+    def get(self, request):
+        """
+        Handle GET requests to list the products that need restocking.
+
+        Parameters:
+        - request: The request object with optional query parameters 'velocity_days' (days of sales
+          the velocity is averaged over), 'horizon_days' (days of cover below which a product is
+          running out), 'as_of' (last day of the velocity window, YYYY-MM-DD) and 'category'.
+
+        Returns:
+        - JSON response with the products at or below their restock threshold or running out
+          within 'horizon_days', most urgent first, with their stock, sales velocity, days of
+          cover and reorder quantity. HTTP 400 Bad Request for invalid parameters.
+        """
+        params = request.query_params
+        try:
+            as_of = parse_date(params.get('as_of'))
+            velocity_days = int(params['velocity_days']) if params.get('velocity_days') else None
+            horizon_days = int(params['horizon_days']) if params.get('horizon_days') else None
+        except ValueError:
+            return Response({"error": "as_of must be in 'YYYY-MM-DD' format and the day counts whole numbers."}, status=status.HTTP_400_BAD_REQUEST)
+        if (velocity_days is not None and velocity_days < 1) or (horizon_days is not None and horizon_days < 1):
+            return Response({"error": "velocity_days and horizon_days must be at least 1."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            products = restock_candidates(as_of, velocity_days, horizon_days, params.get('category') or None)
+        except SingleFlightTimeout as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+        return Response({'count': len(products), 'products': products}, status=status.HTTP_200_OK)
+
+class SaleIngestView(InstrumentedViewMixin, APIView):
+    """
+    API view for bulk importing sales from a CSV or NDJSON upload.
+    """
+    permission_classes = [HasRoleFactory("Manager")]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        """
+        Handle POST requests to import sales in batches.
+
+        Parameters:
+        - request: A multipart request with the upload in 'file'. CSV files need a header row with
+          'product_name', 'quantity', 'sale_date' (YYYY-MM-DD) and 'revenue'; NDJSON files hold one
+          object with those keys per line. 'format' ('csv' or 'ndjson') overrides the format guessed
+          from the file name, and 'batch_size' sets the rows per batch.
+
+        Returns:
+        - JSON response with the rows read, inserted and rejected, and the errors per batch and line.
+          HTTP 400 Bad Request if no file or an invalid format or batch size is given.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload the sales in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or detect_format(upload.name, upload.content_type)
+        if fmt not in INGEST_FORMATS:
+            return Response({"error": f"format must be one of: {', '.join(INGEST_FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        batch_size = request.data.get('batch_size', INGEST_BATCH_SIZE)
+        if not str(batch_size).isdigit() or int(batch_size) < 1:
+            return Response({"error": "batch_size must be a whole number of at least 1."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Large uploads are spooled to a temporary file by Django, and read back one line at a time
+        result = ingest_sales(iter_records(upload, fmt), batch_size=int(batch_size))
+        if result.inserted:
+            pin_to_primary(request)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+class SalesMetricsView(APIView):
+    """
+    API view exposing the sales endpoint metrics in the Prometheus text format.
+
+    Scrapers authenticate with SALES_METRICS_TOKEN. Without a token configured, only staff
+    users can read the metrics.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get_authenticators(self):
+        if getattr(settings, 'SALES_METRICS_TOKEN', None):
+            return []
+        return super().get_authenticators()
+
+    def get_permissions(self):
+        if getattr(settings, 'SALES_METRICS_TOKEN', None):
+            return []
+        return super().get_permissions()
+
+    def get(self, request):
+        """
+        Handle GET requests for the recorded metrics.
+
+        Parameters:
+        - request: The request object. When SALES_METRICS_TOKEN is set, it must carry
+          'Authorization: Bearer <token>'; otherwise the user must be staff.
+
+        Returns:
+        - Plain text response with p50/p95/p99, sum and count per endpoint and measurement,
+          HTTP 403 Forbidden for a missing or wrong token or a non-staff user, or HTTP 404 Not Found
+          when metrics are disabled.
+        """
+        if not metrics_enabled():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        token = getattr(settings, 'SALES_METRICS_TOKEN', None)
+        if token and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')